@@ -0,0 +1,129 @@
+"""
+JWT authentication with a cached principal.
+
+CachedJWTAuthentication resolves the user behind an access token from the
+shared cache (CACHES['shared']) instead of loading the accounts.User row on
+every request and WebSocket handshake. Entries are keyed by user id and the token's jti and
+live for AUTH_PRINCIPAL_CACHE_TTL seconds.
+
+Every entry is stamped with the user's current generation, a separate cache
+key that invalidate_principal replaces once the transaction commits (block
+toggles, profile and password changes). An entry from an older generation is
+a miss, so a blocked user is refused on their next request. The generation
+is read before the row is loaded, so an entry written from a row read during
+an invalidation is already stale when it lands.
+
+The password hash is never cached: it is left as a deferred field and loaded
+only when something reads user.password.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Invalidations have to reach every worker
+cache = ConnectionProxy(caches, 'shared')
+
+PRINCIPAL_KEY = 'auth_principal:{}:{}'
+GENERATION_KEY = 'auth_principal_gen:{}'
+
+# Generations are never reused, so letting one expire only costs misses
+GENERATION_TTL = 24 * 60 * 60
+
+EXCLUDED_FIELDS = ('password',)
+
+
+def _fields():
+    return [f.attname for f in User._meta.concrete_fields if f.attname not in EXCLUDED_FIELDS]
+
+
+def _load(user_id):
+    fields = _fields()
+    row = User._default_manager.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(*fields).first()
+    return fields, row
+
+
+def _build(fields, row):
+    # Missing concrete fields (the password) come back deferred
+    return User.from_db(User._default_manager.db, fields, row)
+
+
+def get_principal(user_id, token_id):
+    """The user `user_id` for the token `token_id`, or None if there is no such user."""
+    generation_key = GENERATION_KEY.format(user_id)
+    key = PRINCIPAL_KEY.format(user_id, token_id)
+    try:
+        cached = cache.get_many([generation_key, key])
+    except Exception:
+        logger.exception(f"Principal cache unavailable, loading user {user_id} directly")
+        fields, row = _load(user_id)
+        return _build(fields, row) if row is not None else None
+
+    generation = cached.get(generation_key)
+    entry = cached.get(key)
+    if generation is not None and entry is not None and entry[0] == generation:
+        return _build(_fields(), entry[1])
+
+    fields, row = _load(user_id)
+    if row is None:
+        return None
+
+    try:
+        if generation is None:
+            generation = time.time_ns()
+            if not cache.add(generation_key, generation, timeout=GENERATION_TTL):
+                # Someone else started (or invalidated) a generation meanwhile
+                return _build(fields, row)
+        cache.set(key, (generation, row), timeout=settings.AUTH_PRINCIPAL_CACHE_TTL)
+    except Exception:
+        logger.exception(f"Failed to cache principal of user {user_id}")
+    return _build(fields, row)
+
+
+def invalidate_principal(user_id):
+    """Drop every cached principal of this user once the transaction commits."""
+
+    def bump():
+        try:
+            cache.set(GENERATION_KEY.format(user_id), time.time_ns(), timeout=GENERATION_TTL)
+        except Exception:
+            logger.exception(f"Failed to invalidate principal of user {user_id}")
+
+    transaction.on_commit(bump)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        token_id = validated_token.get(api_settings.JTI_CLAIM) or validated_token.get('iat')
+        user = get_principal(user_id, token_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
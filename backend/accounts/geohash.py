@@ -0,0 +1,107 @@
+from math import ceil
+
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+GEOHASH_PRECISION = 12
+
+
+def _cell_size(precision):
+    """Return (lat_height, lon_width) in degrees of a geohash cell."""
+    bits = precision * 5
+    lon_bits = ceil(bits / 2)
+    lat_bits = bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    if latitude is None or longitude is None:
+        return None
+
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bit = 0
+    ch = 0
+    even = True
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                ch = (ch << 1) | 1
+                lon_range[0] = mid
+            else:
+                ch = ch << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                ch = (ch << 1) | 1
+                lat_range[0] = mid
+            else:
+                ch = ch << 1
+                lat_range[1] = mid
+
+        even = not even
+        bit += 1
+        if bit == 5:
+            geohash.append(BASE32[ch])
+            bit = 0
+            ch = 0
+
+    return ''.join(geohash)
+
+
+def _centers(low, high, origin, size, count):
+    """Centres of the grid cells of `size` (starting at origin) that overlap [low, high]."""
+    first = max(0, int((low - origin) // size))
+    last = min(count - 1, int((high - origin) // size))
+    return [origin + (i + 0.5) * size for i in range(first, last + 1)]
+
+
+def cells_in_box(min_lat, max_lat, min_lon, max_lon, precision):
+    """Geohash cells of the given precision overlapping the bounding box."""
+    lat_height, lon_width = _cell_size(precision)
+    bits = precision * 5
+    cells = {
+        encode(lat, lon, precision)
+        for lat in _centers(min_lat, max_lat, -90.0, lat_height, 1 << (bits // 2))
+        for lon in _centers(min_lon, max_lon, -180.0, lon_width, 1 << ceil(bits / 2))
+    }
+    # The corners are encoded the same way stored rows are, so the edge cells
+    # are right even where the division above rounds across a cell boundary
+    cells.update(
+        encode(lat, lon, precision)
+        for lat in (min_lat, max_lat) for lon in (min_lon, max_lon)
+    )
+    return cells
+
+
+def covering_cells(min_lat, max_lat, min_lon, max_lon, max_cells=16, max_precision=6):
+    """
+    Geohash prefixes that together cover the bounding box.
+
+    Picks the finest precision (up to max_precision) whose covering stays
+    within max_cells. Returns None when even a single-character covering
+    would be larger than that, in which case the caller should not filter
+    by cell at all.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+
+    if min_lat > max_lat or min_lon > max_lon:
+        return []
+
+    for precision in range(max_precision, 0, -1):
+        lat_height, lon_width = _cell_size(precision)
+        rows = int((max_lat - min_lat) / lat_height) + 2
+        cols = int((max_lon - min_lon) / lon_width) + 2
+        if rows * cols > max_cells * 2:
+            continue
+
+        cells = cells_in_box(min_lat, max_lat, min_lon, max_lon, precision)
+        if len(cells) <= max_cells:
+            return sorted(cells)
+
+    return None
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-17 18:57
+
+from django.db import migrations, models
+
+from accounts.geohash import encode
+
+
+def backfill_geohash(apps, schema_editor):
+    Workshop = apps.get_model('accounts', 'Workshop')
+
+    batch = []
+    for workshop in Workshop.objects.exclude(latitude__isnull=True).exclude(longitude__isnull=True).iterator():
+        workshop.geohash = encode(workshop.latitude, workshop.longitude)
+        batch.append(workshop)
+        if len(batch) >= 1000:
+            Workshop.objects.bulk_update(batch, ['geohash'])
+            batch = []
+
+    if batch:
+        Workshop.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_alter_user_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workshop',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseU
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth.hashers import is_password_usable
+from .geohash import encode as encode_geohash
 
 
 class CustomUserManager(BaseUserManager):
@@ -70,6 +71,8 @@ class Workshop(models.Model):
     pincode = models.CharField(max_length=6)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # Spatial index for nearby lookups, derived from latitude/longitude on save
+    geohash = models.CharField(max_length=12, null=True, blank=True, editable=False, db_index=True)
     rejection_reason = models.TextField(blank=True, null=True)
     type = models.CharField(
         max_length=20,
@@ -88,6 +91,46 @@ class Workshop(models.Model):
 
     def is_individual(self):
         return self.type == 'INDIVIDUAL'
+
+    # Fields that decide whether and where a workshop shows up in nearby lookups
+    NEARBY_FIELDS = ('latitude', 'longitude', 'verification_status', 'rating_avg')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_nearby_values = {
+            name: value for name, value in zip(field_names, values)
+            if name in cls.NEARBY_FIELDS
+        }
+        return instance
+
+    def _nearby_fields_changed(self):
+        loaded = getattr(self, '_loaded_nearby_values', None)
+        if loaded is None:
+            return True
+        return any(
+            name in loaded and loaded[name] != getattr(self, name)
+            for name in self.NEARBY_FIELDS
+        )
+
+    def save(self, *args, **kwargs):
+        self.geohash = encode_geohash(self.latitude, self.longitude)
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+
+        nearby_changed = self._nearby_fields_changed()
+        super().save(*args, **kwargs)
+
+        if nearby_changed:
+            from service_request.nearby import record_workshop_change
+            loaded = getattr(self, '_loaded_nearby_values', None) or {}
+            record_workshop_change(self.pk, locations=[
+                (loaded.get('latitude'), loaded.get('longitude')),
+                (self.latitude, self.longitude),
+            ])
+            self._loaded_nearby_values = {name: getattr(self, name) for name in self.NEARBY_FIELDS}
     
     def __str__(self):
         return f"{self.workshop_name} ({self.type}) - {self.verification_status}"
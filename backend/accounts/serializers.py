@@ -279,7 +279,8 @@ class ProfileUpdateSerializer(serializers.Serializer):
         if "profile_picture" in validated_data:
             user.profile_picture = validated_data["profile_picture"]
 
-        user.save()
+        # request.user may be a cached principal; only write what changed
+        user.save(update_fields=["full_name", "profile_picture"])
 
         role = user.role  
 
@@ -1,3 +1,69 @@
-from django.test import TestCase
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
 
-# Create your tests here.
+from .authentication import CachedJWTAuthentication
+from .models import User
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+})
+class CachedPrincipalTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        # create_user stores a usable password as given, i.e. already hashed
+        self.user = User.objects.create_user('owner@example.com', 'Owner', make_password('pass1234'))
+        self.admin = User.objects.create_superuser('admin@example.com', 'Admin', 'pass1234')
+        self.token = RefreshToken.for_user(self.user).access_token
+
+    def _authenticate(self, token=None):
+        auth = CachedJWTAuthentication()
+        return auth.get_user(auth.get_validated_token(str(token or self.token)))
+
+    def _client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_principal_is_cached_without_the_password(self):
+        self.assertEqual(self._authenticate(), self.user)
+        with self.assertNumQueries(0):
+            user = self._authenticate()
+        self.assertEqual((user.pk, user.email, user.role), (self.user.pk, 'owner@example.com', 'user'))
+        self.assertIn('password', user.get_deferred_fields())
+
+        # The hash is only loaded when something asks for it
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('pass1234'))
+
+    def test_blocked_user_is_refused_on_the_next_request(self):
+        client = self._client(self.user)
+        self.assertEqual(client.get('/api/accounts/profile/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._client(self.admin).patch(f'/api/admin-panel/users/{self.user.id}/toggle-block/')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(client.get('/api/accounts/profile/').status_code, 401)
+
+    def test_profile_and_password_changes_refresh_the_principal(self):
+        client = self._client(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.put('/api/accounts/profile/', {'full_name': 'Renamed Owner'}, format='json')
+        self.assertEqual(client.get('/api/accounts/profile/').data['full_name'], 'Renamed Owner')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.put(
+                '/api/accounts/change-password/',
+                {'old_password': 'pass1234', 'new_password': 'Another#Pass5678', 'confirm_new_password': 'Another#Pass5678'},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Another#Pass5678'))
+        self.assertEqual(self.user.full_name, 'Renamed Owner')
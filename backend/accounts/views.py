@@ -20,6 +20,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from .authentication import invalidate_principal
 from .models import EmailOTP,PendingUser,User,Workshop,Mechanic
 from .utils import send_otp_mail, send_password_reset_otp
 from rest_framework_simplejwt.views import TokenObtainPairView
@@ -631,7 +632,8 @@ class ForgotPasswordResetView(APIView):
 
             # Reset password
             user.set_password(new_password)
-            user.save()
+            user.save(update_fields=['password'])
+            invalidate_principal(user.id)
             logger.info(f"Password reset successfully for email: {email}")
 
             # Clean up OTP
@@ -721,6 +723,7 @@ class ProfileView(APIView):
 
             if serializer.is_valid():
                 serializer.update(user, serializer.validated_data)
+                invalidate_principal(user.id)
                 logger.info(f"Profile updated successfully for user {user.id}")
                 return Response({"detail": "Profile updated successfully."})
 
@@ -756,7 +759,8 @@ class ChangePasswordView(APIView):
                 )
 
             user.set_password(serializer.validated_data["new_password"])
-            user.save()
+            user.save(update_fields=['password'])
+            invalidate_principal(user.id)
             logger.info(f"Password updated successfully for user {user.id}")
 
             return Response(
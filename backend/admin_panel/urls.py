@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import AdminDashboardStatsView,WorkshopVerificationView, AdminMechanicListView,AdminUserListView,AdminWorkshopListView, ToggleUserBlockView, AdminComplaintListView, AdminWorkshopDetailView
+from .views import AdminDashboardStatsView,WorkshopVerificationView, AdminMechanicListView,AdminUserListView,AdminWorkshopListView, ToggleUserBlockView, AdminComplaintListView, AdminWorkshopDetailView, NearbyCacheStatsView
 
 urlpatterns = [
     path('stats/', AdminDashboardStatsView.as_view(), name='stats'),
@@ -10,4 +10,5 @@ urlpatterns = [
     path('mechanics/', AdminMechanicListView.as_view(), name='admin-mechanics'),
     path('users/<int:user_id>/toggle-block/', ToggleUserBlockView.as_view(), name='toggle-block'),
     path('complaints/', AdminComplaintListView.as_view(), name='admin-complaints'),
+    path('nearby-cache/', NearbyCacheStatsView.as_view(), name='nearby-cache-stats'),
 ]
@@ -4,12 +4,14 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser
 from rest_framework import serializers
+from accounts.authentication import invalidate_principal
 from accounts.models import Workshop, User, Mechanic
 from admin_panel.models import Complaint
 from rest_framework import status
 from django.shortcuts import get_object_or_404
 from django.db.models import Q
 from service_request.models import ServiceRequest
+from service_request.nearby import get_cache_stats, reset_cache_stats
 from payments.models import Wallet, WalletTransaction
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
@@ -309,7 +311,9 @@ class ToggleUserBlockView(APIView):
                 return Response({'error': 'Cannot block superuser'}, status=status.HTTP_403_FORBIDDEN)
 
             user.is_active = not user.is_active
-            user.save()
+            user.save(update_fields=['is_active'])
+            # Cached principals would keep a blocked user signed in until they expire
+            invalidate_principal(user.id)
 
             status_text = 'Active' if user.is_active else 'Blocked'
             logger.info("User %s toggled to '%s' by admin: %s", user_id, status_text, request.user)
@@ -347,3 +351,30 @@ class AdminComplaintListView(APIView):
                 {'error': 'Failed to fetch complaints', 'detail': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class NearbyCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        logger.info("Nearby cache stats requested by: %s", request.user)
+        try:
+            return Response(get_cache_stats(), status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error("Failed to read nearby cache stats", exc_info=True)
+            return Response(
+                {'error': 'Failed to read nearby cache stats', 'detail': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    def delete(self, request):
+        logger.info("Nearby cache stats reset by: %s", request.user)
+        try:
+            reset_cache_stats()
+            return Response({'message': 'Nearby cache counters reset'}, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.error("Failed to reset nearby cache stats", exc_info=True)
+            return Response(
+                {'error': 'Failed to reset nearby cache stats', 'detail': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
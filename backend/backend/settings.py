@@ -39,6 +39,22 @@ CHANNEL_LAYERS = {
     },
 }
 
+# The default cache stays Django's per-process one. State every worker has
+# to agree on (the nearby change log and results, service request
+# participants, JWT principals) goes through the "shared" alias, a separate
+# Redis DB from the channel layer.
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL', f"redis://{os.environ.get('REDIS_HOST', '127.0.0.1')}:6379/1")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": REDIS_CACHE_URL,
+    },
+}
+
 
 INSTALLED_APPS = [
     'daphne',
@@ -72,6 +88,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'service_request.middleware.NotificationBatchMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -97,7 +114,7 @@ AUTH_USER_MODEL = 'accounts.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny', 
@@ -223,4 +240,68 @@ INR_TO_USD_RATE = float(os.environ.get("INR_TO_USD_RATE", "0.012"))
 
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:5173")
 
+# Nearby workshop matching: 'db' queries Postgres per lookup, 'numpy' serves
+# lookups from an in-memory snapshot kept in every worker process. NumPy is
+# optional and not in requirements.txt; without it 'numpy' falls back to 'db'.
+NEARBY_WORKSHOP_ENGINE = os.environ.get("NEARBY_WORKSHOP_ENGINE", "db")
+NEARBY_ENGINE_SYNC_INTERVAL = float(os.environ.get("NEARBY_ENGINE_SYNC_INTERVAL", "1.0"))
+
+# Nearby result cache: coordinates are snapped to a grid of NEARBY_CACHE_GRID
+# degrees, and entries are invalidated per geohash cell of
+# NEARBY_CACHE_CELL_PRECISION characters. A TTL of 0 disables the cache.
+NEARBY_CACHE_GRID = float(os.environ.get("NEARBY_CACHE_GRID", "0.005"))
+NEARBY_CACHE_CELL_PRECISION = int(os.environ.get("NEARBY_CACHE_CELL_PRECISION", "4"))
+NEARBY_CACHE_TTL = int(os.environ.get("NEARBY_CACHE_TTL", "300"))
+
+# Cached participants of a service request (service_request.participants)
+PARTICIPANTS_CACHE_TTL = int(os.environ.get("PARTICIPANTS_CACHE_TTL", "300"))
+
+# Cached user behind an access token (accounts.authentication)
+AUTH_PRINCIPAL_CACHE_TTL = int(os.environ.get("AUTH_PRINCIPAL_CACHE_TTL", "60"))
+
+# k-nearest lookups ("top N" instead of everything within 20 km) start at
+# NEARBY_KNN_START_RADIUS_KM and double outwards up to NEARBY_MAX_RADIUS_KM.
+NEARBY_KNN_START_RADIUS_KM = float(os.environ.get("NEARBY_KNN_START_RADIUS_KM", "2"))
+NEARBY_KNN_BISECT_STEPS = int(os.environ.get("NEARBY_KNN_BISECT_STEPS", "4"))
+NEARBY_MAX_RADIUS_KM = float(os.environ.get("NEARBY_MAX_RADIUS_KM", "100"))
+NEARBY_MAX_LIMIT = int(os.environ.get("NEARBY_MAX_LIMIT", "50"))
+
+# Weights of the ?sort=rank score: closeness within the result set, rating
+# out of 5, and 1 / (1 + load) where load counts pending connections plus
+# active services.
+NEARBY_RANK_WEIGHTS = {
+    'distance': float(os.environ.get("NEARBY_RANK_WEIGHT_DISTANCE", "0.5")),
+    'rating': float(os.environ.get("NEARBY_RANK_WEIGHT_RATING", "0.3")),
+    'load': float(os.environ.get("NEARBY_RANK_WEIGHT_LOAD", "0.2")),
+}
+
+# Deadline scheduler (service_request.scheduler): Redis sorted set of due events
+DEADLINE_SCHEDULER_REDIS_URL = os.environ.get(
+    'DEADLINE_SCHEDULER_REDIS_URL', f"redis://{os.environ.get('REDIS_HOST', '127.0.0.1')}:6379/2"
+)
+DEADLINE_SCHEDULER_BATCH_SIZE = int(os.environ.get("DEADLINE_SCHEDULER_BATCH_SIZE", "500"))
+DEADLINE_SCHEDULER_RETRY_SECONDS = int(os.environ.get("DEADLINE_SCHEDULER_RETRY_SECONDS", "60"))
+DEADLINE_SCHEDULER_LOCKED_RETRY_SECONDS = int(os.environ.get("DEADLINE_SCHEDULER_LOCKED_RETRY_SECONDS", "5"))
+
+# Realtime events: 'direct' sends them from the web process; 'outbox' writes them
+# to OutboxEvent in the caller's transaction for run_outbox_relay to deliver, so
+# only set it where the relay runs (docker-compose does)
+REALTIME_DELIVERY = os.environ.get("REALTIME_DELIVERY", "direct")
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_INTERVAL = float(os.environ.get("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", "30"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "10"))
+OUTBOX_RETENTION_HOURS = int(os.environ.get("OUTBOX_RETENTION_HOURS", "24"))
+
+# Unread chat summaries (chat.unread): one Redis hash per user
+UNREAD_CACHE_REDIS_URL = os.environ.get(
+    'UNREAD_CACHE_REDIS_URL', f"redis://{os.environ.get('REDIS_HOST', '127.0.0.1')}:6379/3"
+)
+UNREAD_CACHE_TTL = int(os.environ.get("UNREAD_CACHE_TTL", str(24 * 60 * 60)))
+
+# Latest messages per chat room (chat.history): a capped Redis list, 0 disables it
+CHAT_HISTORY_REDIS_URL = os.environ.get('CHAT_HISTORY_REDIS_URL', UNREAD_CACHE_REDIS_URL)
+CHAT_HISTORY_BUFFER_SIZE = int(os.environ.get("CHAT_HISTORY_BUFFER_SIZE", "100"))
+CHAT_HISTORY_TTL = int(os.environ.get("CHAT_HISTORY_TTL", str(24 * 60 * 60)))
+
 stripe.api_key = STRIPE_SECRET_KEY
@@ -1,36 +1,42 @@
+import asyncio
+import json
+from functools import partial
 from typing import Any, Dict, List, Tuple
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from django.contrib.auth import get_user_model
 from django.db import DatabaseError
-from service_request.models import ServiceRequest, WorkshopConnection, ServiceExecution
+from service_request.counters import get_counter
+from service_request.dispatch import encode_frame
+from service_request.participants import get_participants
+from service_request.models import ServiceRequest
+from . import history, unread
+from .history import HISTORY_PAGE_SIZE
 from .models import ChatMessage, ChatMessageRecipient
+from .utils import create_chat_message, serialize_chat_message
 import logging
+from urllib.parse import parse_qs
 
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
+# Most messages replayed to a reconnecting client before it gets a fresh page
+RESUME_LIMIT = 200
+
+# Most streams one StreamConsumer socket may subscribe to
+MAX_STREAMS = 50
+
 
 @database_sync_to_async
 def _user_can_subscribe_service_flow( user: User, service_request_id: int) -> bool:
 
     try:
-        sr = ServiceRequest.objects.get(
-            pk=service_request_id
-        )
-
-    except ServiceRequest.DoesNotExist:
-        logger.warning(
-            "ServiceRequest not found during service flow "
-            "subscription check. service_request_id=%s",
-            service_request_id
-        )
-        return False
+        participants = get_participants(service_request_id)
 
     except DatabaseError:
         logger.exception(
-            "Database error while fetching ServiceRequest "
+            "Database error while resolving participants "
             "for subscription check. "
             "service_request_id=%s",
             service_request_id
@@ -39,84 +45,33 @@ def _user_can_subscribe_service_flow( user: User, service_request_id: int) -> bo
 
     except Exception:
         logger.exception(
-            "Unexpected error while fetching "
-            "ServiceRequest for subscription check. "
+            "Unexpected error while resolving "
+            "participants for subscription check. "
             "service_request_id=%s",
             service_request_id
         )
         return False
 
-    try:
-        # Customer
-        if sr.user_id == user.id:
-            logger.info(
-                "Service flow subscription allowed for "
-                "customer user_id=%s service_request_id=%s",
-                user.id,
-                service_request_id
-            )
-
-            return True
-
-        # Workshop Admin
-        if (user.role == "workshop_admin" and hasattr(user, "workshop")):
-            is_connected = (
-                WorkshopConnection.objects.filter(
-                    service_request=sr,
-                    workshop=user.workshop,
-                    status="ACCEPTED"
-                ).exists()
-            )
-
-            if is_connected:
-                logger.info(
-                    "Service flow subscription allowed for "
-                    "workshop admin user_id=%s "
-                    "service_request_id=%s",
-                    user.id,
-                    service_request_id
-                )
-                return True
-
-        # Mechanic
-        if (user.role == "mechanic" and hasattr(user, "mechanic")):
-
-            if hasattr(sr, "execution") and sr.execution:
-                is_assigned = (
-                    sr.execution.mechanics.filter(
-                        user=user
-                    ).exists()
-                )
-
-                if is_assigned:
-                    logger.info(
-                        "Service flow subscription allowed "
-                        "for mechanic user_id=%s "
-                        "service_request_id=%s",
-                        user.id,
-                        service_request_id
-                    )
-                    return True
-
-    except DatabaseError:
-        logger.exception(
-            "Database error while checking service flow "
-            "subscription permission. user_id=%s "
-            "service_request_id=%s",
-            user.id,
+    if not participants.exists:
+        logger.warning(
+            "ServiceRequest not found during service flow "
+            "subscription check. service_request_id=%s",
             service_request_id
         )
         return False
 
-    except Exception:
-        logger.exception(
-            "Unexpected error while checking service "
-            "flow subscription permission. user_id=%s "
-            "service_request_id=%s",
+    if (
+        participants.is_owner(user)
+        or participants.is_connected_workshop(user)
+        or participants.is_assigned_mechanic(user)
+    ):
+        logger.info(
+            "Service flow subscription allowed for "
+            "user_id=%s service_request_id=%s",
             user.id,
             service_request_id
         )
-        return False
+        return True
 
     logger.warning(
         "Service flow subscription denied. "
@@ -153,24 +108,7 @@ def _user_has_active_connection(user: User, service_request: ServiceRequest) ->
         return False
 
     try:
-        if service_request.user_id == user.id:
-            return WorkshopConnection.objects.filter(
-                service_request=service_request,
-                status="ACCEPTED",
-            ).exists()
-
-        if user.role == "workshop_admin" and hasattr(user, "workshop"):
-            return WorkshopConnection.objects.filter(
-                service_request=service_request,
-                workshop=user.workshop,
-                status="ACCEPTED",
-            ).exists()
-
-        if user.role == "mechanic" and hasattr(user, "mechanic"):
-            if hasattr(service_request, "execution") and service_request.execution:
-                return service_request.execution.mechanics.filter(user=user).exists()
-
-        return False
+        return get_participants(service_request.id).can_chat(user)
 
     except DatabaseError:
         logger.exception("DB error in active connection check user_id=%s sr_id=%s",
@@ -185,8 +123,9 @@ def _user_has_active_connection(user: User, service_request: ServiceRequest) ->
 @database_sync_to_async
 def _get_chat_history(
     service_request: ServiceRequest,
-    limit: int = 50,
-    before_id: int | None = None
+    limit: int = HISTORY_PAGE_SIZE,
+    before_id: int | None = None,
+    after_id: int | None = None
 ) -> List[Dict[str, Any]]:
 
     try:
@@ -194,12 +133,17 @@ def _get_chat_history(
             service_request=service_request
         ).select_related("sender")
 
-        if before_id is not None:
-            qs = qs.filter(id__lt=before_id)
+        if after_id is not None:
+            # Oldest first: the messages right after what the client has
+            messages = list(qs.filter(id__gt=after_id).order_by("id")[:limit])
 
-        messages = list(
-            reversed(list(qs.order_by("-id")[:limit]))
-        )
+        else:
+            if before_id is not None:
+                qs = qs.filter(id__lt=before_id)
+
+            messages = list(
+                reversed(list(qs.order_by("-id")[:limit]))
+            )
 
     except DatabaseError:
         logger.exception(
@@ -215,19 +159,39 @@ def _get_chat_history(
         )
         return []
 
-    return [
-        {
-            "id": m.id,
-            "service_request_id": m.service_request_id,
-            "sender_id": m.sender_id,
-            "sender_name": m.sender.full_name,
-            "content": m.content,
-            "created_at": m.created_at.isoformat(),
-            "image_url": m.image_url,
-            "message_type": m.message_type,
-        }
-        for m in messages
-    ]
+    return [serialize_chat_message(m, m.sender.full_name) for m in messages]
+
+
+@database_sync_to_async
+def _get_recent_messages(service_request: ServiceRequest) -> Tuple[List[Dict[str, Any]], bool]:
+    try:
+        return history.recent(service_request.id)
+
+    except DatabaseError:
+        logger.exception(
+            "DB error while fetching recent messages service_request_id=%s",
+            service_request.id
+        )
+        return [], False
+
+    except Exception:
+        logger.exception(
+            "Unexpected error while fetching recent messages service_request_id=%s",
+            service_request.id
+        )
+        return [], False
+
+
+def _parse_int(value) -> int | None:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_after_id(scope) -> int | None:
+    values = parse_qs(scope.get("query_string", b"").decode()).get("after_id")
+    return _parse_int(values[0]) if values else None
 
 
 
@@ -239,65 +203,25 @@ def _create_message(
 ) -> Tuple[Dict[str, Any], list[int]]:
 
     try:
-        connection = WorkshopConnection.objects.filter(
-            service_request=service_request,
-            status="ACCEPTED",
-        ).first()
+        participants = get_participants(service_request.id)
     except DatabaseError:
         logger.exception("DB error while verifying connection sr_id=%s", service_request.id)
         raise PermissionError("Cannot verify connection at this moment")
 
-    if not connection:
+    if not participants.is_connected:
         raise PermissionError("No active connection for this service")
 
     if service_request.status in ["EXPIRED", "CANCELLED"]:
         raise PermissionError("Service request is no longer active")
 
     try:
-        msg = ChatMessage.objects.create(
-            service_request=service_request,
-            sender=user,
-            content=content,
-        )
-
-        participants = []
-
-        if service_request.user:
-            participants.append(service_request.user)
-
-        if hasattr(connection.workshop, "user"):
-            participants.append(connection.workshop.user)
-
-        if hasattr(service_request, "execution") and service_request.execution:
-            for mechanic in service_request.execution.mechanics.all():
-                if hasattr(mechanic, "user"):
-                    participants.append(mechanic.user)
-
-        receiver_ids = []
-        for p in set(participants):
-            if p.id != user.id:
-                ChatMessageRecipient.objects.create(
-                    message=msg,
-                    user=p,
-                    is_read=False
-                )
-                receiver_ids.append(p.id)
+        msg, receiver_ids = create_chat_message(service_request, user, participants, content=content)
 
     except DatabaseError:
         logger.exception("DB error while creating chat message sr_id=%s", service_request.id)
         raise PermissionError("Failed to create message at this time")
 
-    return {
-        "id": msg.id,
-        "service_request_id": msg.service_request_id,
-        "sender_id": msg.sender_id,
-        "sender_name": msg.sender.full_name,
-        "content": msg.content,
-        "created_at": msg.created_at.isoformat(),
-        "image_url": msg.image_url,
-        "message_type": msg.message_type,
-    }, receiver_ids
-
+    return serialize_chat_message(msg, user.full_name), receiver_ids
 
 
 @database_sync_to_async
@@ -308,6 +232,7 @@ def _mark_messages_as_read(user: User, service_request: ServiceRequest) -> None:
             user=user,
             is_read=False,
         ).update(is_read=True)
+        unread.mark_read(user.id, [service_request.id])
 
     except DatabaseError:
         logger.exception(
@@ -324,108 +249,11 @@ def _mark_messages_as_read(user: User, service_request: ServiceRequest) -> None:
         )
 
 
-def _build_unread_summary_item_sync(
-    receiver: User,
-    service_request: ServiceRequest
-) -> Dict[str, Any]:
-
-    try:
-        unread_qs = ChatMessageRecipient.objects.filter(
-            message__service_request=service_request,
-            user=receiver,
-            is_read=False,
-        ).select_related("message__sender")
-
-        count = unread_qs.count()
-
-        if count == 0:
-            return {
-                "service_request_id": service_request.id,
-                "unread_count": 0,
-                "counterpart_name": "",
-            }
-
-        last_receipt = unread_qs.order_by(
-            "-message__created_at"
-        ).first()
-
-        counterpart_name = (
-            last_receipt.message.sender.full_name
-            if last_receipt and last_receipt.message and last_receipt.message.sender
-            else ""
-        )
-
-        return {
-            "service_request_id": service_request.id,
-            "unread_count": count,
-            "counterpart_name": counterpart_name,
-        }
-
-    except DatabaseError:
-        logger.exception(
-            "DB error while building unread summary user_id=%s sr_id=%s",
-            receiver.id,
-            service_request.id
-        )
-        return {
-            "service_request_id": service_request.id,
-            "unread_count": 0,
-            "counterpart_name": "",
-        }
-
-    except Exception:
-        logger.exception(
-            "Unexpected error while building unread summary user_id=%s sr_id=%s",
-            receiver.id,
-            service_request.id
-        )
-        return {
-            "service_request_id": service_request.id,
-            "unread_count": 0,
-            "counterpart_name": "",
-        }
-
-
-@database_sync_to_async
-def _build_unread_summary_item(
-    receiver: User, service_request: ServiceRequest
-) -> Dict[str, Any]:
-    return _build_unread_summary_item_sync(receiver, service_request)
-
-
 @database_sync_to_async
 def _get_unread_summaries_for_user(user: User) -> List[Dict[str, Any]]:
 
-    ACTIVE_SR_STATUSES = [
-        "CONNECTED",
-        "ESTIMATE_SHARED",
-        "SERVICE_AMOUNT_PAID",
-        "IN_PROGRESS",
-    ]
-
     try:
-        service_request_ids = (
-            ChatMessageRecipient.objects.filter(
-                user=user,
-                is_read=False,
-                message__service_request__status__in=ACTIVE_SR_STATUSES,
-            )
-            .values_list("message__service_request_id", flat=True)
-            .distinct()
-        )
-
-        summaries: List[Dict[str, Any]] = []
-
-        for sr_id in service_request_ids:
-            try:
-                sr = ServiceRequest.objects.get(pk=sr_id)
-            except ServiceRequest.DoesNotExist:
-                continue
-
-            item = _build_unread_summary_item_sync(user, sr)
-            summaries.append(item)
-
-        return summaries
+        return unread.get_summaries(user.id)
 
     except DatabaseError:
         logger.exception(
@@ -443,109 +271,71 @@ def _get_unread_summaries_for_user(user: User) -> List[Dict[str, Any]]:
     
 
 @database_sync_to_async
-def _get_pending_connection_count_for_workshop(user : User) -> int:
-    try:
-        if user.role != 'workshop_admin' or not hasattr(user, 'workshop'):
-            return 0
-        return WorkshopConnection.objects.filter(
-            workshop = user.workshop,
-            status = 'REQUESTED'
-        ).count()
-    except Exception:
-        return 0
-
-
-@database_sync_to_async
-def _get_assigned_task_count_for_mechanic(user: User) -> int:
+def _get_badge_counts(user: User) -> Tuple[int, int]:
+    """(pending connection requests, assigned active tasks) from the user's counter row."""
     try:
-        if user.role != "mechanic" or not hasattr(user, "mechanic"):
-            return 0
-
-        service_status = [
-            "CONNECTED",
-            "ESTIMATE_SHARED",
-            "SERVICE_AMOUNT_PAID",
-            "IN_PROGRESS",
-        ]
+        if user.role not in ('workshop_admin', 'mechanic'):
+            return 0, 0
 
-        count = ServiceExecution.objects.filter(
-            mechanics=user.mechanic,
-            service_request__status__in=service_status,
-        ).count()
-
-        return count
+        counter = get_counter(user.id)
+        if user.role == 'workshop_admin':
+            return counter.pending_connections, 0
+        return 0, counter.active_tasks
 
     except DatabaseError:
         logger.exception(
-            "DB error while fetching mechanic task count user_id=%s",
+            "DB error while fetching notification counters user_id=%s",
             user.id,
         )
-        return 0
+        return 0, 0
 
     except Exception:
         logger.exception(
-            "Unexpected error while fetching mechanic task count user_id=%s",
+            "Unexpected error while fetching notification counters user_id=%s",
             user.id,
         )
-        return 0
-
-
-class ChatConsumer(AsyncJsonWebsocketConsumer):
-
-    async def connect(self):
-        try:
-            self.service_request_id = int(
-                self.scope["url_route"]["kwargs"]["service_request_id"]
-            )
-            self.room_group_name = f"chat_{self.service_request_id}"
-
-            user: User = self.scope.get("user")
-            if not user or not user.is_authenticated:
-                await self.close()
-                return
-
-            service_request = await _get_service_request(self.service_request_id)
-            if not service_request:
-                await self.close()
-                return
-
-            allowed = await _user_has_active_connection(user, service_request)
-            if not allowed:
-                await self.close()
-                return
-
-            self.service_request = service_request
-
-            await self.channel_layer.group_add(
-                self.room_group_name,
-                self.channel_name
-            )
-            await self.accept()
+        return 0, 0
+
+
+class ChatRoom:
+    """
+    One socket's membership of a service request's chat: history on join,
+    the client's chat actions and the unread fan-out of what it sends.
+    ChatConsumer holds one; StreamConsumer one per subscribed chat stream.
+    `send_json` delivers a frame to the client.
+    """
+
+    def __init__(self, consumer, user: User, service_request: ServiceRequest, send_json):
+        self.consumer = consumer
+        self.user = user
+        self.service_request = service_request
+        self.send_json = send_json
+        self.group_name = f"chat_{service_request.id}"
+        self._unread_update_tasks = set()
+
+    async def join(self, after_id: int | None = None):
+        await self.consumer.channel_layer.group_add(
+            self.group_name,
+            self.consumer.channel_name
+        )
 
-            history = await _get_chat_history(service_request)
-            await self.send_json({
-                "type": "chat.history",
-                "messages": history
-            })
+        await self.send_history(after_id)
 
-            await _mark_messages_as_read(user, service_request)
-            await self._notify_unread_update(user)
+        await _mark_messages_as_read(self.user, self.service_request)
+        await self._notify_unread_update()
 
-        except Exception:
-            logger.exception("Error in ChatConsumer connect")
-            await self.close()
+    async def leave(self):
+        await self.consumer.channel_layer.group_discard(
+            self.group_name,
+            self.consumer.channel_name
+        )
 
-    async def disconnect(self, code):
-        if hasattr(self, "room_group_name"):
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
-            )
+        if self._unread_update_tasks:
+            await asyncio.gather(*self._unread_update_tasks, return_exceptions=True)
 
-    async def receive_json(self, content: Dict[str, Any], **kwargs):
+    async def receive(self, content: Dict[str, Any]):
         try:
             msg_type = content.get("type")
-            user: User = self.scope.get("user")
 
             if msg_type == "message":
                 raw_message = (content.get("message") or "").strip()
@@ -554,7 +344,7 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
                 try:
                     message_data, receiver_ids = await _create_message(
-                        user, self.service_request, raw_message
+                        self.user, self.service_request, raw_message
                     )
                 except PermissionError:
                     await self.send_json({
@@ -563,16 +353,22 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
                     })
                     return
 
-                await self.channel_layer.group_send(
-                    self.room_group_name,
+                # Encoded once here; every socket in the room forwards the text
+                await self.consumer.channel_layer.group_send(
+                    self.group_name,
                     {
                         "type": "chat.message",
-                        "message": message_data,
+                        "service_request_id": self.service_request.id,
+                        "frame": encode_frame({
+                            "type": "chat.message",
+                            "message": message_data,
+                        }),
                     },
                 )
 
-                for rid in receiver_ids:
-                    await self._send_notification_to_user(rid)
+                # The room broadcast above is the sender's acknowledgement;
+                # receivers' badges are updated in the background.
+                self._start_unread_updates(message_data["sender_name"], receiver_ids)
 
             elif msg_type == "fetch_history":
                 before_id = content.get("before_id")
@@ -581,22 +377,21 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
 
                 older_messages = await _get_chat_history(
                     self.service_request,
-                    limit=50,
                     before_id=int(before_id)
                 )
 
                 await self.send_json({
                     "type": "chat.history_page",
                     "messages": older_messages,
-                    "has_more": len(older_messages) == 50,
+                    "has_more": len(older_messages) == HISTORY_PAGE_SIZE,
                 })
 
             elif msg_type == "mark_read":
-                await _mark_messages_as_read(user, self.service_request)
-                await self._notify_unread_update(user)
+                await _mark_messages_as_read(self.user, self.service_request)
+                await self._notify_unread_update()
 
         except Exception:
-            logger.exception("Error in ChatConsumer receive_json")
+            logger.exception("Error in chat receive sr_id=%s", self.service_request.id)
             try:
                 await self.send_json({
                     "type": "chat.error",
@@ -605,46 +400,153 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             except Exception:
                 pass
 
-    async def chat_message(self, event: Dict[str, Any]):
+    async def send_history(self, after_id: int | None):
+        """
+        Full first page on a fresh join, from the room's history buffer
+        (chat.history). A client rejoining with the last id it has as
+        after_id only gets the newer messages, unless more than RESUME_LIMIT
+        arrived meanwhile: then it gets the latest page with has_gap set and
+        should replace what it shows.
+        """
+        recent, complete = await _get_recent_messages(self.service_request)
+
+        if after_id is not None:
+            if complete or (recent and recent[0]["id"] <= after_id):
+                # Everything newer than after_id is in the buffer
+                newer = [m for m in recent if m["id"] > after_id]
+            else:
+                newer = await _get_chat_history(
+                    self.service_request,
+                    limit=RESUME_LIMIT + 1,
+                    after_id=after_id
+                )
+
+            if len(newer) <= RESUME_LIMIT:
+                await self.send_json({
+                    "type": "chat.resume",
+                    "messages": newer,
+                    "has_gap": False,
+                })
+                return
+
+        first_page = recent[-HISTORY_PAGE_SIZE:]
+
+        if after_id is not None:
+            await self.send_json({
+                "type": "chat.resume",
+                "messages": first_page,
+                "has_gap": True,
+            })
+            return
+
         await self.send_json({
-            "type": "chat.message",
-            "message": event["message"]
+            "type": "chat.history",
+            "messages": first_page
         })
 
-    async def _send_notification_to_user(self, user_id: int):
-        sr = self.service_request
+    def _start_unread_updates(self, sender_name: str, receiver_ids: List[int]):
+        if not receiver_ids:
+            return
 
+        task = asyncio.create_task(self._send_unread_updates(sender_name, receiver_ids))
+        self._unread_update_tasks.add(task)
+        task.add_done_callback(self._unread_update_tasks.discard)
+
+    async def _send_unread_updates(self, sender_name: str, receiver_ids: List[int]):
         try:
-            receiver = await database_sync_to_async(
-                User.objects.get
-            )(pk=user_id)
-        except User.DoesNotExist:
-            return
+            # One DB/Redis hop for every receiver, then all sends at once
+            items = await database_sync_to_async(unread.record_message)(
+                self.service_request, sender_name, receiver_ids
+            )
 
-        summary = await _build_unread_summary_item(receiver, sr)
+            results = await asyncio.gather(
+                *(
+                    self.consumer.channel_layer.group_send(
+                        f"notifications_user_{user_id}",
+                        {
+                            "type": "notification.update",
+                            "item": item,
+                        },
+                    )
+                    for user_id, item in items.items()
+                ),
+                return_exceptions=True,
+            )
 
-        await self.channel_layer.group_send(
-            f"notifications_user_{user_id}",
-            {
-                "type": "notification.update",
-                "item": summary,
-            },
-        )
+            for user_id, result in zip(items, results):
+                if isinstance(result, Exception):
+                    logger.error("Failed to send unread update user_id=%s: %r", user_id, result)
 
-    async def _notify_unread_update(self, user: User):
-        summary = await _build_unread_summary_item(
-            user,
-            self.service_request
-        )
+        except Exception:
+            logger.exception(
+                "Error sending unread updates sr_id=%s",
+                self.service_request.id
+            )
 
-        await self.channel_layer.group_send(
-            f"notifications_user_{user.id}",
+    async def _notify_unread_update(self):
+        await self.consumer.channel_layer.group_send(
+            f"notifications_user_{self.user.id}",
             {
                 "type": "notification.update",
-                "item": summary,
+                "item": {
+                    "service_request_id": self.service_request.id,
+                    "unread_count": 0,
+                    "counterpart_name": "",
+                },
             },
         )
 
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        try:
+            self.service_request_id = int(
+                self.scope["url_route"]["kwargs"]["service_request_id"]
+            )
+
+            user: User = self.scope.get("user")
+            if not user or not user.is_authenticated:
+                await self.close()
+                return
+
+            service_request = await _get_service_request(self.service_request_id)
+            if not service_request:
+                await self.close()
+                return
+
+            allowed = await _user_has_active_connection(user, service_request)
+            if not allowed:
+                await self.close()
+                return
+
+            self.room = ChatRoom(self, user, service_request, self.send_json)
+
+            await self.accept()
+            await self.room.join(_parse_after_id(self.scope))
+
+        except Exception:
+            logger.exception("Error in ChatConsumer connect")
+            await self.close()
+
+    async def disconnect(self, code):
+        if hasattr(self, "room"):
+            await self.room.leave()
+
+    async def receive_json(self, content: Dict[str, Any], **kwargs):
+        if hasattr(self, "room"):
+            await self.room.receive(content)
+
+    async def chat_message(self, event: Dict[str, Any]):
+        if "frame" in event:
+            await self.send(text_data=event["frame"])
+            return
+
+        await self.send_json({
+            "type": "chat.message",
+            "message": event["message"]
+        })
+
 class NotificationConsumer(AsyncJsonWebsocketConsumer):
 
     async def connect(self):
@@ -662,22 +564,23 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
                 self.channel_name
             )
             await self.accept()
-
-            summaries = await _get_unread_summaries_for_user(user)
-            pending_count = await _get_pending_connection_count_for_workshop(user)
-            task_count = await _get_assigned_task_count_for_mechanic(user)
-
-            await self.send_json({
-                "type": "notifications.initial",
-                "items": summaries,
-                "connection_request_count": pending_count,
-                "assigned_task_count": task_count,
-            })
+            await self._send_initial_notifications()
 
         except Exception:
             logger.exception("Error in NotificationConsumer connect")
             await self.close()
 
+    async def _send_initial_notifications(self):
+        summaries = await _get_unread_summaries_for_user(self.user)
+        pending_count, task_count = await _get_badge_counts(self.user)
+
+        await self.send_json({
+            "type": "notifications.initial",
+            "items": summaries,
+            "connection_request_count": pending_count,
+            "assigned_task_count": task_count,
+        })
+
     async def disconnect(self, code):
         if hasattr(self, "user_group_name"):
             await self.channel_layer.group_discard(
@@ -712,6 +615,16 @@ class NotificationConsumer(AsyncJsonWebsocketConsumer):
         except Exception:
             logger.exception("Error in assigned_task_count_update")
 
+    async def connection_inbox_update(self, event: Dict[str, Any]):
+        try:
+            await self.send_json({
+                "type": "notifications.connection_inbox",
+                "connection": event["connection"],
+                "counts": event["counts"],
+            })
+        except Exception:
+            logger.exception("Error in connection_inbox_update")
+
 
 class ServiceFlowConsumer(AsyncJsonWebsocketConsumer):
 
@@ -760,9 +673,165 @@ class ServiceFlowConsumer(AsyncJsonWebsocketConsumer):
 
     async def service_flow_update(self, event: Dict[str, Any]):
         try:
+            if "frame" in event:
+                await self.send(text_data=event["frame"])
+                return
+
             await self.send_json({
                 "type": "service_flow.update",
                 "event": event.get("event", "update"),
             })
         except Exception:
-            logger.exception("Error in service_flow_update")
\ No newline at end of file
+            logger.exception("Error in service_flow_update")
+
+
+class StreamConsumer(NotificationConsumer):
+    """
+    One multiplexed socket per client session (ws/stream/) instead of a
+    notifications socket plus a chat and a service flow socket per open
+    service request. The client subscribes to streams over it:
+
+        {"action": "subscribe", "stream": "chat:12", "after_id": 340}
+        {"action": "unsubscribe", "stream": "service_flow:12"}
+        {"stream": "chat:12", "type": "message", "message": "Hello"}
+
+    Streams are "notifications", "chat:<service_request_id>" and
+    "service_flow:<service_request_id>". Every frame sent back is wrapped as
+    {"stream": <name>, "data": <frame>}, where the frame is what the
+    stream's own socket would have sent. A stream is authorized once, when
+    it is subscribed, and the grant is kept for the life of the socket like
+    the per-stream sockets do on connect.
+    """
+
+    async def connect(self):
+        user: User = self.scope.get("user")
+        if not user or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.user = user
+        # stream name -> ChatRoom, or the channel layer group it is fed from
+        self.streams = {}
+        await self.accept()
+
+    async def disconnect(self, code):
+        for stream in list(getattr(self, "streams", ())):
+            await self._unsubscribe(stream)
+
+    async def receive_json(self, content: Dict[str, Any], **kwargs):
+        try:
+            stream = content.get("stream")
+            action = content.get("action")
+
+            if action == "subscribe":
+                await self._subscribe(stream, content)
+            elif action == "unsubscribe":
+                await self._unsubscribe(stream)
+            else:
+                target = self.streams.get(stream)
+                if isinstance(target, ChatRoom):
+                    await target.receive(content)
+
+        except Exception:
+            logger.exception("Error in StreamConsumer receive_json user_id=%s", self.user.id)
+
+    async def _subscribe(self, stream: str, content: Dict[str, Any]):
+        after_id = _parse_int(content.get("after_id"))
+
+        target = self.streams.get(stream)
+        if target is not None:
+            # Already authorized; subscribing again only resumes the chat
+            if isinstance(target, ChatRoom):
+                await target.send_history(after_id)
+            return
+
+        if len(self.streams) >= MAX_STREAMS:
+            await self._send_stream_error(stream, "Too many streams.")
+            return
+
+        kind, _, raw_id = (stream or "").partition(":")
+
+        if stream == "notifications":
+            self.user_group_name = f"notifications_user_{self.user.id}"
+            await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+            self.streams[stream] = self.user_group_name
+            await self._send_stream_json(stream, {"type": "stream.subscribed"})
+            await self._send_initial_notifications()
+            return
+
+        service_request_id = _parse_int(raw_id)
+        if service_request_id is None or kind not in ("chat", "service_flow"):
+            await self._send_stream_error(stream, "Unknown stream.")
+            return
+
+        if kind == "chat":
+            service_request = await _get_service_request(service_request_id)
+            if not service_request or not await _user_has_active_connection(self.user, service_request):
+                await self._send_stream_error(stream, "Chat not available.")
+                return
+
+            room = ChatRoom(self, self.user, service_request, partial(self._send_stream_json, stream))
+            self.streams[stream] = room
+            await self._send_stream_json(stream, {"type": "stream.subscribed"})
+            await room.join(after_id)
+            return
+
+        if not await _user_can_subscribe_service_flow(self.user, service_request_id):
+            await self._send_stream_error(stream, "Service flow not available.")
+            return
+
+        group_name = f"service_flow_{service_request_id}"
+        await self.channel_layer.group_add(group_name, self.channel_name)
+        self.streams[stream] = group_name
+        await self._send_stream_json(stream, {"type": "stream.subscribed"})
+
+    async def _unsubscribe(self, stream: str):
+        target = self.streams.pop(stream, None)
+        if target is None:
+            return
+
+        if isinstance(target, ChatRoom):
+            await target.leave()
+        else:
+            await self.channel_layer.group_discard(target, self.channel_name)
+
+    async def _send_stream_frame(self, stream: str, frame: str):
+        # Frames arrive already encoded; wrap the text instead of decoding it
+        await self.send(text_data=f'{{"stream": {json.dumps(stream)}, "data": {frame}}}')
+
+    async def _send_stream_json(self, stream: str, content: Dict[str, Any]):
+        await self._send_stream_frame(stream, await self.encode_json(content))
+
+    async def _send_stream_error(self, stream: str, message: str):
+        await self._send_stream_json(stream, {"type": "stream.error", "message": message})
+
+    async def send_json(self, content, close=False):
+        # NotificationConsumer's handlers all feed the notifications stream
+        await self._send_stream_json("notifications", content)
+        if close:
+            await self.close()
+
+    async def chat_message(self, event: Dict[str, Any]):
+        stream = f"chat:{event.get('service_request_id')}"
+        if stream not in self.streams:
+            return
+
+        frame = event.get("frame") or await self.encode_json({
+            "type": "chat.message",
+            "message": event["message"],
+        })
+        await self._send_stream_frame(stream, frame)
+
+    async def service_flow_update(self, event: Dict[str, Any]):
+        try:
+            stream = f"service_flow:{event.get('service_request_id')}"
+            if stream not in self.streams:
+                return
+
+            frame = event.get("frame") or await self.encode_json({
+                "type": "service_flow.update",
+                "event": event.get("event", "update"),
+            })
+            await self._send_stream_frame(stream, frame)
+        except Exception:
+            logger.exception("Error in stream service_flow_update")
@@ -0,0 +1,136 @@
+"""
+Redis ring buffer of each room's latest messages.
+
+chat_history:<service_request_id> is a list of the room's last
+CHAT_HISTORY_BUFFER_SIZE serialized messages, oldest first. New messages
+are RPUSHX'ed after commit and the list LTRIM'ed to size. RPUSHX only
+appends to a list that already exists, so a missing list is a miss and is
+rebuilt from the database on the next read. The list is dropped when the
+request is expired or cancelled.
+
+Connects and the first history page are served from it. Older pages
+(fetch_history / before_id) still read the database.
+"""
+import json
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from .models import ChatMessage
+from .utils import serialize_chat_message
+
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PAGE_SIZE = 50
+
+_client = None
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.CHAT_HISTORY_REDIS_URL, decode_responses=True)
+    return _client
+
+
+def use_redis(client):
+    """Point the buffer at another client, e.g. fakeredis.FakeRedis(decode_responses=True) in tests."""
+    global _client
+    _client = client
+
+
+def _key(service_request_id):
+    return f"chat_history:{service_request_id}"
+
+
+def _buffer_size():
+    return max(settings.CHAT_HISTORY_BUFFER_SIZE, 0)
+
+
+def _from_db(service_request_id, limit):
+    messages = ChatMessage.objects.filter(
+        service_request_id=service_request_id
+    ).select_related("sender").order_by("-id")[:limit]
+    return [serialize_chat_message(m, m.sender.full_name) for m in reversed(list(messages))]
+
+
+def load(service_request_id):
+    """Rebuild the room's buffer from the database; returns the messages."""
+    messages = _from_db(service_request_id, _buffer_size())
+    if not messages:
+        return messages
+
+    key = _key(service_request_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.delete(key)
+        pipe.rpush(key, *[json.dumps(m) for m in messages])
+        pipe.expire(key, settings.CHAT_HISTORY_TTL)
+        pipe.execute()
+    except redis.RedisError:
+        logger.exception(f"Failed to buffer chat history for service request {service_request_id}")
+    return messages
+
+
+def recent(service_request_id):
+    """
+    (messages, complete): the room's latest messages, oldest first, and
+    whether they are the room's whole history.
+    """
+    size = _buffer_size()
+    if not size:
+        messages = _from_db(service_request_id, HISTORY_PAGE_SIZE)
+        return messages, len(messages) < HISTORY_PAGE_SIZE
+
+    try:
+        cached = get_redis().lrange(_key(service_request_id), 0, -1)
+    except redis.RedisError:
+        logger.exception(f"Failed to read chat history for service request {service_request_id}, using the database")
+        cached = None
+
+    if cached:
+        # Appends run after commit and can land slightly out of order
+        messages = sorted((json.loads(m) for m in cached), key=lambda m: m["id"])
+    else:
+        messages = load(service_request_id)
+    return messages, len(messages) < size
+
+
+def append(service_request_id, message):
+    """Add a serialized message to the room's buffer once the transaction commits."""
+    size = _buffer_size()
+    if not size:
+        return
+
+    key = _key(service_request_id)
+    payload = json.dumps(message)
+
+    def push():
+        try:
+            pipe = get_redis().pipeline()
+            pipe.rpushx(key, payload)
+            pipe.ltrim(key, -size, -1)
+            pipe.expire(key, settings.CHAT_HISTORY_TTL)
+            pipe.execute()
+        except redis.RedisError:
+            logger.exception(f"Failed to buffer chat message for service request {service_request_id}")
+
+    transaction.on_commit(push)
+
+
+def drop(service_request_ids):
+    """Delete the rooms' buffers once the transaction commits."""
+    keys = [_key(pk) for pk in set(service_request_ids)]
+    if not keys:
+        return
+
+    def delete():
+        try:
+            get_redis().delete(*keys)
+        except redis.RedisError:
+            logger.exception(f"Failed to drop chat history of {len(keys)} service request(s)")
+
+    transaction.on_commit(delete)
@@ -2,7 +2,8 @@ from urllib.parse import parse_qs
 
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from accounts.authentication import CachedJWTAuthentication
 
 
 User = get_user_model()
@@ -10,7 +11,7 @@ User = get_user_model()
 
 @database_sync_to_async
 def _get_user_from_token(token: str):
-    jwt_auth = JWTAuthentication()
+    jwt_auth = CachedJWTAuthentication()
     validated_token = jwt_auth.get_validated_token(token)
     return jwt_auth.get_user(validated_token)
 
@@ -19,5 +19,10 @@ websocket_urlpatterns = [
         consumers.NotificationConsumer.as_asgi(),
         name="notifications_ws",
     ),
+    re_path(
+        r"ws/stream/$",
+        consumers.StreamConsumer.as_asgi(),
+        name="stream_ws",
+    ),
 ]
 
@@ -1,3 +1,246 @@
-from django.test import TestCase
+import json
+from unittest import skipUnless
 
-# Create your tests here.
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from accounts.models import User, Workshop
+from service_request.models import ServiceRequest, WorkshopConnection
+from service_request.participants import Participants
+from service_request.utils import ACTIVE_SERVICE_STATUSES
+from . import history, unread
+from .consumers import StreamConsumer
+from .models import ChatMessage, ChatMessageRecipient
+from .utils import create_chat_message, get_unread_summaries, get_unread_summary
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class ChatFixtures:
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+
+    def _chat(self, status='CONNECTED', unread=(), read=()):
+        service_request = ServiceRequest.objects.create(
+            user=self.owner, vehicle_type='Bike', vehicle_model='Model', issue_category='Engine',
+            description='Engine makes a noise when starting', user_latitude=12.9, user_longitude=77.5,
+            status=status,
+        )
+        for sender, is_read in [(s, False) for s in unread] + [(s, True) for s in read]:
+            message = ChatMessage.objects.create(service_request=service_request, sender=sender, content='Hi')
+            ChatMessageRecipient.objects.create(message=message, user=self.owner, is_read=is_read)
+        return service_request
+
+    def _user(self, name):
+        return User.objects.create_user(f'{name.lower()}@example.com', name, 'pass1234', role='workshop_admin')
+
+
+class UnreadSummaryTests(ChatFixtures, TestCase):
+
+    def test_summaries_come_from_one_query(self):
+        alpha, beta = self._user('Alpha'), self._user('Beta')
+        first = self._chat(unread=[alpha, alpha, beta], read=[alpha])
+        second = self._chat(status='IN_PROGRESS', unread=[beta])
+        self._chat(status='COMPLETED', unread=[alpha])
+        self._chat(read=[alpha])
+        for _ in range(10):
+            self._chat(unread=[alpha, beta])
+
+        with self.assertNumQueries(1):
+            summaries = get_unread_summaries(self.owner.id, service_statuses=ACTIVE_SERVICE_STATUSES)
+
+        self.assertEqual(len(summaries), 12)
+        self.assertEqual(summaries[0], {'service_request_id': first.id, 'unread_count': 3, 'counterpart_name': 'Beta'})
+        self.assertEqual(summaries[1], {'service_request_id': second.id, 'unread_count': 1, 'counterpart_name': 'Beta'})
+
+    def test_single_summary_without_unread_messages(self):
+        service_request = self._chat(read=[self._user('Alpha')])
+        self.assertEqual(
+            get_unread_summary(self.owner.id, service_request.id),
+            {'service_request_id': service_request.id, 'unread_count': 0, 'counterpart_name': ''},
+        )
+
+
+class CreateChatMessageTests(ChatFixtures, TestCase):
+
+    def test_receipts_are_bulk_inserted(self):
+        service_request = self._chat()
+        others = [self._user(f'Mechanic{i}') for i in range(5)]
+        participants = Participants(service_request.id, self.owner.id, [others[0].id], (), [u.id for u in others[1:]])
+
+        with self.assertNumQueries(4):  # savepoint, message, receipts, release
+            msg, receiver_ids = create_chat_message(service_request, others[0], participants, content='On my way')
+
+        self.assertEqual(receiver_ids, sorted([self.owner.id] + [u.id for u in others[1:]]))
+        self.assertEqual(
+            sorted(msg.recipients.filter(is_read=False).values_list('user_id', flat=True)), receiver_ids,
+        )
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class UnreadCacheTests(ChatFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        unread.use_redis(fakeredis.FakeRedis(decode_responses=True))
+        self.addCleanup(unread.use_redis, None)
+
+    def _message(self, service_request, sender):
+        message = ChatMessage.objects.create(service_request=service_request, sender=sender, content='Hi')
+        ChatMessageRecipient.objects.create(message=message, user=self.owner)
+        return unread.record_message(service_request, sender.full_name, [self.owner.id])[self.owner.id]
+
+    def test_messages_are_counted_without_queries_once_loaded(self):
+        alpha, beta = self._user('Alpha'), self._user('Beta')
+        chat = self._chat(unread=[alpha])
+        self.assertEqual(unread.get_summaries(self.owner.id)[0]['unread_count'], 1)
+
+        self._message(chat, alpha)
+        message = ChatMessage.objects.create(service_request=chat, sender=beta, content='Hi')
+        ChatMessageRecipient.objects.create(message=message, user=self.owner)
+        with self.assertNumQueries(0):
+            item = unread.record_message(chat, 'Beta', [self.owner.id])[self.owner.id]
+            summaries = unread.get_summaries(self.owner.id)
+
+        expected = {'service_request_id': chat.id, 'unread_count': 3, 'counterpart_name': 'Beta'}
+        self.assertEqual(item, expected)
+        self.assertEqual(summaries, [expected])
+        self.assertEqual(summaries, get_unread_summaries(self.owner.id, service_statuses=ACTIVE_SERVICE_STATUSES))
+
+    def test_cache_miss_falls_back_to_the_database(self):
+        alpha = self._user('Alpha')
+        chat = self._chat(unread=[alpha, alpha])
+
+        self.assertEqual(self._message(chat, alpha)['unread_count'], 3)
+        self.assertEqual(unread.get_summaries(self.owner.id)[0]['unread_count'], 3)
+
+    def test_mark_read_and_closing_reset_the_counts(self):
+        alpha = self._user('Alpha')
+        first, second = self._chat(unread=[alpha]), self._chat(unread=[alpha])
+        unread.load(self.owner.id)
+
+        unread.mark_read(self.owner.id, [first.id])
+        self.assertEqual([item['service_request_id'] for item in unread.get_summaries(self.owner.id)], [second.id])
+
+        second.status = 'COMPLETED'
+        with self.captureOnCommitCallbacks(execute=True):
+            second.save()
+        self.assertEqual(unread.get_summaries(self.owner.id), [])
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+@override_settings(CHAT_HISTORY_BUFFER_SIZE=3)
+class ChatHistoryBufferTests(ChatFixtures, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        history.use_redis(fakeredis.FakeRedis(decode_responses=True))
+        self.addCleanup(history.use_redis, None)
+        self.workshop = self._user('Alpha')
+        self.service_request = self._chat()
+        self.participants = Participants(self.service_request.id, self.owner.id, [self.workshop.id])
+
+    def _send(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_chat_message(self.service_request, self.workshop, self.participants, content=content)[0]
+
+    def test_buffer_is_rebuilt_then_appended_and_trimmed(self):
+        self._send('one')  # nothing buffered yet, so nothing appended
+        self.assertFalse(history.get_redis().exists(f'chat_history:{self.service_request.id}'))
+
+        with self.assertNumQueries(1):
+            messages, complete = history.recent(self.service_request.id)
+        self.assertEqual([m['content'] for m in messages], ['one'])
+        self.assertTrue(complete)
+
+        for content in ('two', 'three', 'four'):
+            self._send(content)
+        with self.assertNumQueries(0):
+            messages, complete = history.recent(self.service_request.id)
+        self.assertEqual([m['content'] for m in messages], ['two', 'three', 'four'])
+        self.assertFalse(complete)
+
+    def test_buffer_dropped_when_request_expires(self):
+        self._send('one')
+        history.load(self.service_request.id)
+
+        self.service_request.status = 'EXPIRED'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service_request.save()
+        self.assertFalse(history.get_redis().exists(f'chat_history:{self.service_request.id}'))
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class StreamConsumerTests(ChatFixtures, TransactionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for module in (unread, history):
+            module.use_redis(fakeredis.FakeRedis(decode_responses=True))
+            self.addCleanup(module.use_redis, None)
+
+        workshop_admin = self._user('Alpha')
+        workshop = Workshop.objects.create(
+            user=workshop_admin, workshop_name='Alpha', address_line='Street', city='City',
+            state='State', pincode='000000', verification_status='APPROVED',
+        )
+        self.service_request = self._chat(status='IN_PROGRESS', read=[workshop_admin])
+        WorkshopConnection.objects.create(service_request=self.service_request, workshop=workshop, status='ACCEPTED')
+        self.stranger_request = ServiceRequest.objects.create(
+            user=workshop_admin, vehicle_type='Bike', vehicle_model='Model', issue_category='Engine',
+            description='Engine makes a noise when starting', user_latitude=12.9, user_longitude=77.5,
+        )
+
+    async def _connect(self):
+        communicator = WebsocketCommunicator(StreamConsumer.as_asgi(), '/ws/stream/')
+        communicator.scope['user'] = self.owner
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def _frames(self, communicator):
+        """(stream, frame type) of everything sent until the socket goes quiet."""
+        frames = []
+        while not await communicator.receive_nothing(timeout=0.2):
+            envelope = json.loads(await communicator.receive_from())
+            frames.append((envelope['stream'], envelope['data']['type']))
+        return frames
+
+    async def test_streams_are_multiplexed_over_one_socket(self):
+        chat = f'chat:{self.service_request.id}'
+        flow = f'service_flow:{self.service_request.id}'
+        communicator = await self._connect()
+
+        for stream in ('notifications', chat, flow, f'chat:{self.stranger_request.id}', 'bogus'):
+            await communicator.send_json_to({'action': 'subscribe', 'stream': stream})
+        frames = await self._frames(communicator)
+        self.assertEqual(frames[:2], [('notifications', 'stream.subscribed'), ('notifications', 'notifications.initial')])
+        self.assertIn((chat, 'chat.history'), frames)
+        self.assertIn(('notifications', 'notifications.update'), frames)
+        self.assertIn((flow, 'stream.subscribed'), frames)
+        self.assertIn((f'chat:{self.stranger_request.id}', 'stream.error'), frames)
+        self.assertIn(('bogus', 'stream.error'), frames)
+
+        await communicator.send_json_to({'stream': chat, 'type': 'message', 'message': 'Any update?'})
+        self.assertIn((chat, 'chat.message'), await self._frames(communicator))
+
+        await communicator.send_json_to({'action': 'unsubscribe', 'stream': chat})
+        await self._frames(communicator)
+        await get_channel_layer().group_send(f'chat_{self.service_request.id}', {
+            'type': 'chat.message', 'service_request_id': self.service_request.id, 'frame': '{}',
+        })
+        await get_channel_layer().group_send(f'service_flow_{self.service_request.id}', {
+            'type': 'service_flow.update', 'service_request_id': self.service_request.id,
+            'frame': '{"type": "service_flow.update", "event": "update"}',
+        })
+        self.assertEqual(await self._frames(communicator), [(flow, 'service_flow.update')])
+
+        await communicator.disconnect()
@@ -0,0 +1,171 @@
+"""
+Redis cache of unread chat summaries.
+
+Each user has one hash, unread:<user_id>, holding for every active service
+request with unread messages its count ("<sr_id>") and the name of the
+latest sender ("<sr_id>:name"). The "loaded" field marks a hash that was
+filled from the database. Without it the hash is a miss and is rebuilt
+with one grouped query (chat.utils.get_unread_summaries).
+
+- new messages HINCRBY the receivers' counts;
+- marking a chat read, or the request leaving the active statuses, drops
+  its fields.
+
+The database stays authoritative. Redis errors fall back to it, and every
+hash expires after UNREAD_CACHE_TTL so any drift is bounded.
+"""
+import logging
+
+import redis
+from django.conf import settings
+from django.db import transaction
+
+from service_request.utils import ACTIVE_SERVICE_STATUSES
+from .models import ChatMessageRecipient
+from .utils import get_unread_summaries, get_unread_summary
+
+
+logger = logging.getLogger(__name__)
+
+LOADED = 'loaded'
+
+_client = None
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.UNREAD_CACHE_REDIS_URL, decode_responses=True)
+    return _client
+
+
+def use_redis(client):
+    """Point the cache at another client, e.g. fakeredis.FakeRedis(decode_responses=True) in tests."""
+    global _client
+    _client = client
+
+
+def _key(user_id):
+    return f"unread:{user_id}"
+
+
+def _item(service_request_id, count, name):
+    return {
+        "service_request_id": service_request_id,
+        "unread_count": int(count or 0),
+        "counterpart_name": name or "",
+    }
+
+
+def load(user_id):
+    """Rebuild the user's hash from the database; returns the summaries."""
+    summaries = get_unread_summaries(user_id, service_statuses=ACTIVE_SERVICE_STATUSES)
+
+    mapping = {LOADED: 1}
+    for item in summaries:
+        mapping[str(item['service_request_id'])] = item['unread_count']
+        mapping[f"{item['service_request_id']}:name"] = item['counterpart_name']
+
+    key = _key(user_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, settings.UNREAD_CACHE_TTL)
+        pipe.execute()
+    except redis.RedisError:
+        logger.exception(f"Failed to cache unread summaries for user {user_id}")
+    return summaries
+
+
+def get_summaries(user_id):
+    """Unread summaries of the user's active service requests (the notifications.initial items)."""
+    try:
+        cached = get_redis().hgetall(_key(user_id))
+    except redis.RedisError:
+        logger.exception(f"Failed to read unread summaries for user {user_id}, using the database")
+        return get_unread_summaries(user_id, service_statuses=ACTIVE_SERVICE_STATUSES)
+
+    if LOADED not in cached:
+        return load(user_id)
+
+    counts = sorted((int(field), int(count)) for field, count in cached.items() if field.isdigit())
+    return [_item(pk, count, cached.get(f"{pk}:name")) for pk, count in counts if count > 0]
+
+
+def record_message(service_request, sender_name, receiver_ids):
+    """
+    Count a new message for its receivers; returns their summary items for
+    this service request as {user_id: item}.
+    """
+    if not receiver_ids:
+        return {}
+    if service_request.status not in ACTIVE_SERVICE_STATUSES:
+        return {user_id: get_unread_summary(user_id, service_request.id) for user_id in receiver_ids}
+
+    field = str(service_request.id)
+    try:
+        pipe = get_redis().pipeline()
+        for user_id in receiver_ids:
+            key = _key(user_id)
+            pipe.hexists(key, LOADED)
+            pipe.hincrby(key, field, 1)
+            pipe.hset(key, f"{field}:name", sender_name)
+            pipe.expire(key, settings.UNREAD_CACHE_TTL)
+        results = pipe.execute()
+    except redis.RedisError:
+        logger.exception(f"Failed to count unread message for service request {service_request.id}")
+        return {user_id: get_unread_summary(user_id, service_request.id) for user_id in receiver_ids}
+
+    items = {}
+    for index, user_id in enumerate(receiver_ids):
+        loaded, count = results[index * 4], results[index * 4 + 1]
+        if loaded:
+            items[user_id] = _item(service_request.id, count, sender_name)
+        else:
+            # The hash only holds this increment; the next read rebuilds it.
+            items[user_id] = get_unread_summary(user_id, service_request.id)
+    return items
+
+
+def mark_read(user_id, service_request_ids):
+    """Drop the given service requests from the user's hash once their messages are read."""
+    fields = [name for pk in service_request_ids for name in (str(pk), f"{pk}:name")]
+    if not fields:
+        return
+    try:
+        get_redis().hdel(_key(user_id), *fields)
+    except redis.RedisError:
+        logger.exception(f"Failed to reset unread summaries for user {user_id}")
+
+
+def clear_service_requests(service_request_ids):
+    """
+    Drop the service requests from every hash that may hold them. Call it
+    before their receipts are marked read; Redis is touched after commit.
+    """
+    service_request_ids = list(service_request_ids)
+    if not service_request_ids:
+        return
+
+    by_user = {}
+    receipts = ChatMessageRecipient.objects.filter(
+        message__service_request_id__in=service_request_ids,
+        is_read=False,
+    ).order_by().values_list('user_id', 'message__service_request_id').distinct()
+    for user_id, service_request_id in receipts:
+        by_user.setdefault(user_id, []).append(service_request_id)
+
+    if not by_user:
+        return
+
+    def drop():
+        try:
+            pipe = get_redis().pipeline()
+            for user_id, ids in by_user.items():
+                pipe.hdel(_key(user_id), *[name for pk in ids for name in (str(pk), f"{pk}:name")])
+            pipe.execute()
+        except redis.RedisError:
+            logger.exception(f"Failed to reset unread summaries for {len(by_user)} user(s)")
+
+    transaction.on_commit(drop)
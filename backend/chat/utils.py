@@ -0,0 +1,93 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+
+from .models import ChatMessage, ChatMessageRecipient
+
+
+def create_chat_message(service_request, sender, participants, content='', image_url='', message_type='text'):
+    """
+    Save a message and an unread receipt for every other participant
+    (service_request.participants) in one transaction, with a single
+    bulk INSERT for the receipts, and add it to the room's history buffer.
+    Returns (message, receiver_ids).
+    """
+    from .history import append
+
+    receiver_ids = sorted(participants.user_ids - {sender.id})
+
+    with transaction.atomic():
+        msg = ChatMessage.objects.create(
+            service_request=service_request,
+            sender=sender,
+            content=content,
+            image_url=image_url,
+            message_type=message_type,
+        )
+        ChatMessageRecipient.objects.bulk_create([
+            ChatMessageRecipient(message=msg, user_id=user_id, is_read=False)
+            for user_id in receiver_ids
+        ])
+        append(service_request.id, serialize_chat_message(msg, sender.full_name))
+
+    return msg, receiver_ids
+
+
+def serialize_chat_message(msg, sender_name):
+    return {
+        "id": msg.id,
+        "service_request_id": msg.service_request_id,
+        "sender_id": msg.sender_id,
+        "sender_name": sender_name,
+        "content": msg.content,
+        "created_at": msg.created_at.isoformat(),
+        "image_url": msg.image_url,
+        "message_type": msg.message_type,
+    }
+
+
+def get_unread_summaries(user_id, service_request_ids=None, service_statuses=None):
+    """
+    Unread chat summary per service request for one user, from a single
+    grouped query: [{service_request_id, unread_count, counterpart_name}]
+    where counterpart_name is the sender of the latest unread message.
+    Requests without unread messages are left out.
+    """
+    unread = ChatMessageRecipient.objects.filter(user_id=user_id, is_read=False)
+    if service_request_ids is not None:
+        unread = unread.filter(message__service_request_id__in=service_request_ids)
+    if service_statuses is not None:
+        unread = unread.filter(message__service_request__status__in=service_statuses)
+
+    latest_sender = ChatMessageRecipient.objects.filter(
+        user_id=user_id,
+        is_read=False,
+        message__service_request_id=OuterRef('message__service_request_id'),
+    ).order_by('-message__created_at', '-message_id').values('message__sender__full_name')[:1]
+
+    rows = (
+        unread.order_by()
+        .values('message__service_request_id')
+        .annotate(unread_count=Count('id'), counterpart_name=Subquery(latest_sender))
+        .order_by('message__service_request_id')
+    )
+
+    return [
+        {
+            "service_request_id": row['message__service_request_id'],
+            "unread_count": row['unread_count'],
+            "counterpart_name": row['counterpart_name'] or "",
+        }
+        for row in rows
+    ]
+
+
+def get_unread_summary(user_id, service_request_id):
+    """Unread summary of one service request, with a zero count when nothing is unread."""
+    summaries = get_unread_summaries(user_id, service_request_ids=[service_request_id])
+    if summaries:
+        return summaries[0]
+    return {
+        "service_request_id": service_request_id,
+        "unread_count": 0,
+        "counterpart_name": "",
+    }
@@ -3,10 +3,11 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from service_request.models import ServiceRequest, WorkshopConnection
-from .models import ChatMessage, ChatMessageRecipient
+from service_request import dispatch
+from service_request.models import ServiceRequest
+from service_request.participants import get_participants
+from . import unread
+from .utils import create_chat_message, serialize_chat_message
 from django.contrib.auth import get_user_model
 import logging
 from django.db import DatabaseError
@@ -191,21 +192,22 @@ class ChatImageUploadView(APIView):
             )
 
         # =========================================================
-        # Create Chat Message
+        # Create Chat Message and recipients
         # =========================================================
         try:
-            msg = ChatMessage.objects.create(
-                service_request=sr,
-                sender=user,
-                content='',
+            msg, receiver_ids = create_chat_message(
+                sr,
+                user,
+                get_participants(sr.id),
                 image_url=image_url,
                 message_type='image',
             )
 
             logger.info(
                 "Chat image message created successfully. "
-                "message_id=%s",
-                msg.id
+                "message_id=%s recipient_count=%s",
+                msg.id,
+                len(receiver_ids)
             )
 
         except DatabaseError:
@@ -234,97 +236,26 @@ class ChatImageUploadView(APIView):
                 status=500
             )
 
-        # =========================================================
-        # Find participants
-        # =========================================================
-        try:
-            connection = WorkshopConnection.objects.filter(
-                service_request=sr,
-                status='ACCEPTED'
-            ).first()
-
-            participants = []
-
-            if sr.user:
-                participants.append(sr.user)
-
-            if (
-                connection
-                and hasattr(connection.workshop, 'user')
-            ):
-                participants.append(
-                    connection.workshop.user
-                )
-
-            if hasattr(sr, 'execution') and sr.execution:
-
-                for mechanic in (
-                    sr.execution.mechanics.all()
-                ):
-                    if hasattr(mechanic, 'user'):
-                        participants.append(
-                            mechanic.user
-                        )
-
-            receiver_ids = []
-
-            for p in set(participants):
-
-                if p.id != user.id:
-
-                    ChatMessageRecipient.objects.create(
-                        message=msg,
-                        user=p,
-                        is_read=False
-                    )
-
-                    receiver_ids.append(p.id)
-
-            logger.info(
-                "Chat recipients created successfully. "
-                "message_id=%s recipient_count=%s",
-                msg.id,
-                len(receiver_ids)
-            )
-
-        except Exception:
-
-            logger.exception(
-                "Failed to create chat recipients. "
-                "message_id=%s",
-                msg.id
-            )
-
-        # =========================================================
-        # Prepare websocket payload
-        # =========================================================
-        message_data = {
-            'id': msg.id,
-            'service_request_id': msg.service_request_id,
-            'sender_id': msg.sender_id,
-            'sender_name': msg.sender.full_name,
-            'content': msg.content,
-            'image_url': msg.image_url,
-            'message_type': msg.message_type,
-            'created_at': msg.created_at.isoformat(),
-        }
+        message_data = serialize_chat_message(msg, user.full_name)
 
         # =========================================================
         # Send websocket event
         # =========================================================
         try:
-            channel_layer = get_channel_layer()
-
-            async_to_sync(channel_layer.group_send)(
+            dispatch.publish(
                 f'chat_{service_request_id}',
                 {
                     'type': 'chat.message',
-                    'message': message_data
+                    'service_request_id': sr.id,
+                    'frame': dispatch.encode_frame({
+                        'type': 'chat.message',
+                        'message': message_data
+                    })
                 }
             )
 
             logger.info(
-                "WebSocket chat image event sent "
+                "WebSocket chat image event queued "
                 "successfully. message_id=%s",
                 msg.id
             )
@@ -337,41 +268,39 @@ class ChatImageUploadView(APIView):
                 msg.id
             )
 
-        return Response(message_data, status=201)
-
-    def _user_can_chat(self, user, sr):
-
+        # =========================================================
+        # Update receivers' unread summaries
+        # =========================================================
         try:
-            if sr.user_id == user.id:
-
-                return WorkshopConnection.objects.filter(
-                    service_request=sr,
-                    status='ACCEPTED'
-                ).exists()
+            items = unread.record_message(
+                sr,
+                user.full_name,
+                receiver_ids
+            )
 
-            if (
-                user.role == 'workshop_admin'
-                and hasattr(user, 'workshop')
-            ):
+            for receiver_id, item in items.items():
+                dispatch.publish(
+                    f'notifications_user_{receiver_id}',
+                    {
+                        'type': 'notification.update',
+                        'item': item
+                    }
+                )
 
-                return WorkshopConnection.objects.filter(
-                    service_request=sr,
-                    workshop=user.workshop,
-                    status='ACCEPTED'
-                ).exists()
+        except Exception:
 
-            if (
-                user.role == 'mechanic'
-                and hasattr(user, 'mechanic')
-            ):
+            logger.exception(
+                "Failed to update unread summaries for chat "
+                "image. message_id=%s",
+                msg.id
+            )
 
-                if hasattr(sr, 'execution') and sr.execution:
+        return Response(message_data, status=201)
 
-                    return sr.execution.mechanics.filter(
-                        user=user
-                    ).exists()
+    def _user_can_chat(self, user, sr):
 
-            return False
+        try:
+            return get_participants(sr.id).can_chat(user)
 
         except Exception:
 
@@ -7,7 +7,7 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Payment, Wallet, WalletTransaction
 from .serializers import WalletSerializer, WalletTransactionSerializer, PaymentHistorySerializer
 from service_request.models import ServiceRequest, ServiceExecution, Estimate, WorkshopConnection, MechanicEarning
-from service_request.utils import notify_service_flow_update,  push_connection_count_to_workshop
+from service_request.utils import notify_service_flow_update,  push_connection_count_to_workshop, push_connection_inbox_update
 from .utils import get_platform_admin
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
@@ -799,7 +799,7 @@ class StripeWebhookView(APIView):
                             and previous_attempts < 3
                         ):
 
-                            WorkshopConnection.objects.create(
+                            connection = WorkshopConnection.objects.create(
                                 service_request=service_request,
                                 workshop=workshop,
                                 status='REQUESTED'
@@ -808,6 +808,7 @@ class StripeWebhookView(APIView):
                             push_connection_count_to_workshop(
                                 workshop.user.id
                             )
+                            push_connection_inbox_update(connection.id)
 
                             service_request.status = 'CONNECTING'
 
@@ -1596,7 +1597,7 @@ class PayPlatformFeeWithWalletView(APIView):
                             and previous_attempts < 3
                         ):
 
-                            WorkshopConnection.objects.create(
+                            connection = WorkshopConnection.objects.create(
                                 service_request=service_request,
                                 workshop=workshop,
                                 status='REQUESTED'
@@ -1605,6 +1606,7 @@ class PayPlatformFeeWithWalletView(APIView):
                             push_connection_count_to_workshop(
                                 workshop.user.id
                             )
+                            push_connection_inbox_update(connection.id)
 
                             service_request.status = (
                                 'CONNECTING'
@@ -0,0 +1,198 @@
+"""
+Maintained notification counters.
+
+NotificationCounter holds, per user, the pending connection requests of a
+workshop admin and the active tasks of a mechanic. Every transition that
+changes either adjusts the row with an F() increment inside the same
+transaction, so pushes and socket connects read one row instead of
+re-running COUNT joins. A missing row is created from real counts on first
+read, and reconcile_counters() recomputes everything to correct drift.
+"""
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from accounts.models import Mechanic, User
+from .models import NotificationCounter, ServiceExecution, WorkshopConnection
+
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_CHUNK_SIZE = 1000
+
+
+def _active_service_statuses():
+    from .utils import ACTIVE_SERVICE_STATUSES
+    return ACTIVE_SERVICE_STATUSES
+
+
+def _apply(field, lookup, deltas):
+    # One UPDATE per distinct delta, usually just +1 or -1
+    by_delta = defaultdict(list)
+    for key, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(key)
+
+    for delta, keys in by_delta.items():
+        NotificationCounter.objects.filter(**{f'{lookup}__in': keys}).update(
+            **{field: F(field) + delta},
+            updated_at=timezone.now(),
+        )
+
+
+def adjust_pending_connections(deltas):
+    """Apply {workshop_id: delta} to the workshop admins' pending connection counts."""
+    _apply('pending_connections', 'user__workshop', deltas)
+
+
+def adjust_active_tasks(deltas):
+    """Apply {mechanic user id: delta} to the mechanics' active task counts."""
+    _apply('active_tasks', 'user_id', deltas)
+
+
+def connection_status_changed(workshop_id, old_status, new_status):
+    delta = (new_status == 'REQUESTED') - (old_status == 'REQUESTED')
+    if delta:
+        adjust_pending_connections({workshop_id: delta})
+
+
+def mechanics_changed(service_request_status, mechanic_user_ids, delta):
+    """Mechanics were added to (delta=1) or removed from (delta=-1) an execution."""
+    if service_request_status in _active_service_statuses():
+        adjust_active_tasks({user_id: delta for user_id in mechanic_user_ids})
+
+
+def service_status_changed(service_request_ids, old_statuses, new_status):
+    """
+    Requests in `service_request_ids` moved from `old_statuses` (one per id,
+    or a single status for all) to `new_status`; their mechanics gain or lose
+    an active task when that crosses ACTIVE_SERVICE_STATUSES, and requests
+    leaving it drop out of the cached unread summaries. Expired or cancelled
+    requests also lose their chat history buffer.
+    """
+    if new_status in ('EXPIRED', 'CANCELLED'):
+        from chat.history import drop
+        drop(service_request_ids)
+
+    active = _active_service_statuses()
+    if isinstance(old_statuses, str):
+        old_statuses = dict.fromkeys(service_request_ids, old_statuses)
+
+    crossing = {
+        pk: (new_status in active) - (old_statuses[pk] in active)
+        for pk in service_request_ids
+    }
+    crossing = {pk: delta for pk, delta in crossing.items() if delta}
+    if not crossing:
+        return
+
+    closed = [pk for pk, delta in crossing.items() if delta < 0]
+    if closed:
+        from chat.unread import clear_service_requests
+        clear_service_requests(closed)
+
+    deltas = defaultdict(int)
+    assignments = ServiceExecution.mechanics.through.objects.filter(
+        serviceexecution__service_request_id__in=crossing,
+    ).values_list('serviceexecution__service_request_id', 'mechanic__user_id')
+    for service_request_id, user_id in assignments:
+        deltas[user_id] += crossing[service_request_id]
+    adjust_active_tasks(deltas)
+
+
+def _count_pending_connections(user_ids):
+    return dict(
+        WorkshopConnection.objects.filter(workshop__user_id__in=user_ids, status='REQUESTED')
+        .order_by().values('workshop__user_id').annotate(total=Count('id'))
+        .values_list('workshop__user_id', 'total')
+    )
+
+
+def _count_active_tasks(user_ids):
+    return dict(
+        Mechanic.objects.filter(
+            user_id__in=user_ids,
+            assigned_executions__service_request__status__in=_active_service_statuses(),
+        ).order_by().values('user_id').annotate(total=Count('assigned_executions'))
+        .values_list('user_id', 'total')
+    )
+
+
+def get_counters(user_ids):
+    """{user id: NotificationCounter}, creating missing rows from real counts."""
+    user_ids = set(user_ids)
+    counters = NotificationCounter.objects.in_bulk(user_ids)
+
+    missing = user_ids - counters.keys()
+    if missing:
+        pending = _count_pending_connections(missing)
+        active = _count_active_tasks(missing)
+        NotificationCounter.objects.bulk_create([
+            NotificationCounter(
+                user_id=user_id,
+                pending_connections=pending.get(user_id, 0),
+                active_tasks=active.get(user_id, 0),
+            )
+            for user_id in missing
+        ], ignore_conflicts=True)
+        counters.update(NotificationCounter.objects.in_bulk(missing))
+
+    return counters
+
+
+def get_counter(user_id):
+    return get_counters([user_id])[user_id]
+
+
+def reconcile_counters(chunk_size=RECONCILE_CHUNK_SIZE):
+    """
+    Recompute the counters of every workshop admin and mechanic, chunk by
+    chunk, and fix the rows that drifted. Each chunk locks its counter rows
+    before counting, so transitions committing meanwhile are either already
+    counted or applied on top of the corrected value. Returns the number of
+    rows fixed or created.
+    """
+    users = User.objects.filter(
+        Q(workshop__isnull=False) | Q(mechanic__isnull=False)
+    ).order_by('pk').values_list('pk', flat=True)
+
+    fixed = 0
+    last_pk = 0
+    while True:
+        user_ids = list(users.filter(pk__gt=last_pk)[:chunk_size])
+        if not user_ids:
+            return fixed
+        last_pk = user_ids[-1]
+
+        with transaction.atomic():
+            counters = {
+                counter.user_id: counter
+                for counter in NotificationCounter.objects.select_for_update().filter(user_id__in=user_ids)
+            }
+            pending = _count_pending_connections(user_ids)
+            active = _count_active_tasks(user_ids)
+
+            stale = []
+            created = []
+            for user_id in user_ids:
+                expected = (pending.get(user_id, 0), active.get(user_id, 0))
+                counter = counters.get(user_id)
+                if counter is None:
+                    created.append(NotificationCounter(
+                        user_id=user_id, pending_connections=expected[0], active_tasks=expected[1],
+                    ))
+                elif (counter.pending_connections, counter.active_tasks) != expected:
+                    logger.warning(
+                        f"Counter drift for user #{user_id}: "
+                        f"{(counter.pending_connections, counter.active_tasks)} -> {expected}"
+                    )
+                    counter.pending_connections, counter.active_tasks = expected
+                    counter.updated_at = timezone.now()
+                    stale.append(counter)
+
+            NotificationCounter.objects.bulk_create(created, ignore_conflicts=True)
+            NotificationCounter.objects.bulk_update(stale, ['pending_connections', 'active_tasks', 'updated_at'])
+            fixed += len(created) + len(stale)
@@ -0,0 +1,201 @@
+"""
+Coalescing notification dispatcher.
+
+Notification helpers (service_request.utils) enqueue items under a topic
+instead of each registering their own on_commit callback and group_send.
+
+With REALTIME_DELIVERY = 'outbox' every enqueue is written to the
+OutboxEvent table in the caller's transaction and run_outbox_relay delivers
+it (see service_request.outbox), so write endpoints never wait on the
+channel layer. With 'direct' (the default) items are sent from the web
+process:
+
+- inside a transaction, items join one batch per savepoint, flushed by a
+  single on_commit callback registered in that savepoint;
+- inside a request (NotificationBatchMiddleware), batches are merged into
+  one per request and flushed when the response is ready;
+- otherwise the batch is flushed right away.
+
+Items are de-duplicated per topic, each topic's builder turns its items
+into (group, message) pairs with as few queries as it can, and the whole
+batch goes to the channel layer in one concurrent send pass.
+
+Django discards on_commit callbacks registered inside a savepoint that is
+rolled back, so items enqueued there are dropped with it, the same as the
+OutboxEvent rows written in 'outbox' mode.
+"""
+import asyncio
+import json
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+
+logger = logging.getLogger(__name__)
+
+_builders = {}
+
+_request_batch = ContextVar('notification_request_batch', default=None)
+
+
+def builder(topic):
+    """Register `func(items) -> iterable of (group, message)` for `topic`."""
+
+    def register(func):
+        _builders[topic] = func
+        return func
+
+    return register
+
+
+class NotificationBatch:
+
+    def __init__(self):
+        # topic -> {item: None}, an insertion-ordered set
+        self.items = {}
+        self.flushed = False
+
+    def add(self, topic, items):
+        self.items.setdefault(topic, {}).update(dict.fromkeys(items))
+
+    def merge(self, other):
+        for topic, items in other.items.items():
+            self.add(topic, items)
+
+    def messages(self, raise_errors=False):
+        messages = []
+        for topic, items in self.items.items():
+            try:
+                messages.extend(_builders[topic](list(items)))
+            except Exception:
+                if raise_errors:
+                    raise
+                logger.exception(f"Failed to build '{topic}' notifications for {len(items)} item(s)")
+        return messages
+
+    def flush(self):
+        if self.flushed:
+            return
+        self.flushed = True
+
+        outer = _request_batch.get()
+        if outer is not None and outer is not self:
+            outer.merge(self)
+            return
+
+        send(self.messages())
+
+
+async def _group_send_many(channel_layer, messages):
+    results = await asyncio.gather(
+        *(channel_layer.group_send(group, message) for group, message in messages),
+        return_exceptions=True,
+    )
+    for (group, _), result in zip(messages, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to send notification to {group}: {result!r}")
+
+
+def send(messages):
+    """Send (group, message) pairs to the channel layer in one pass."""
+    if not messages:
+        return
+
+    channel_layer = get_channel_layer()
+    if not channel_layer:
+        logger.warning(f"Channel layer not configured. {len(messages)} notification(s) skipped.")
+        return
+
+    try:
+        async_to_sync(_group_send_many)(channel_layer, messages)
+        logger.info(f"Sent {len(messages)} notification(s)")
+    except Exception:
+        logger.exception(f"Failed to send {len(messages)} notification(s)")
+
+
+def _is_pending(connection, batch):
+    return not batch.flushed and any(
+        entry[1] == batch.flush for entry in connection.run_on_commit
+    )
+
+
+def _transaction_batch(connection):
+    # One batch per savepoint, so a rolled back savepoint takes its items along
+    key = tuple(connection.savepoint_ids)
+    batches = getattr(connection, '_notification_batches', {})
+    batch = batches.get(key)
+    if batch is None or not _is_pending(connection, batch):
+        batches = {
+            sids: pending for sids, pending in batches.items()
+            if _is_pending(connection, pending)
+        }
+        batch = NotificationBatch()
+        batches[key] = batch
+        connection._notification_batches = batches
+        transaction.on_commit(batch.flush)
+    return batch
+
+
+def enqueue(topic, items):
+    items = list(items)
+    if not items:
+        return
+
+    if getattr(settings, 'REALTIME_DELIVERY', 'direct') == 'outbox':
+        from .models import OutboxEvent
+        OutboxEvent.objects.create(topic=topic, items=items)
+        return
+
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        _transaction_batch(connection).add(topic, items)
+        return
+
+    batch = _request_batch.get()
+    if batch is not None:
+        batch.add(topic, items)
+        return
+
+    batch = NotificationBatch()
+    batch.add(topic, items)
+    batch.flush()
+
+
+def encode_frame(payload):
+    """
+    JSON text of a websocket frame, built once for a group message. Consumers
+    forward event["frame"] as-is instead of re-encoding a dict per socket.
+    """
+    return json.dumps(payload, cls=JSONEncoder)
+
+
+def publish(group, message):
+    """Send a ready-made channel layer message to `group` through the dispatcher."""
+    enqueue('message', [(group, json.dumps(message, sort_keys=True, cls=JSONEncoder))])
+
+
+@builder('message')
+def _raw_messages(items):
+    return [(group, json.loads(message)) for group, message in items]
+
+
+@contextmanager
+def collect():
+    """Hold back every notification produced in the block and send them together at the end."""
+    if _request_batch.get() is not None:
+        yield _request_batch.get()
+        return
+
+    batch = NotificationBatch()
+    token = _request_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _request_batch.reset(token)
+        batch.flush()
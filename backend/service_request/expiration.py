@@ -0,0 +1,324 @@
+"""
+Set-based expiration of service requests.
+
+Overdue requests are claimed in chunks with SELECT ... FOR UPDATE SKIP LOCKED,
+so several sweepers (or a sweeper and a write endpoint) never process the
+same row twice, and every side effect of expiring is applied to the whole
+chunk with a handful of bulk statements:
+
+- platform fee refunds to the user's wallet (and the matching platform debit)
+- status -> EXPIRED
+- unread chat messages marked as read
+- assigned mechanics made AVAILABLE again and the execution removed
+- service flow and workshop inbox notifications, sent once after commit
+
+check_expired_connections auto-rejects connection requests a workshop left
+unanswered and expire_estimates lapses sent estimates. The deadline
+scheduler (service_request.scheduler) calls these right when a deadline
+passes; process_expirations sweeps periodically as a safety net, so read
+endpoints never have to.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, CharField, DecimalField, F, Min, Value, When
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+from accounts.models import Mechanic, Workshop
+from chat.models import ChatMessageRecipient
+from payments.models import Payment, Wallet, WalletTransaction
+from payments.utils import get_platform_admin
+from .counters import adjust_pending_connections, service_status_changed
+from .models import Estimate, ServiceRequest, ServiceExecution, WorkshopConnection
+from .participants import invalidate_participants
+from .utils import notify_service_flow_updates, push_connection_counts_to_workshops, push_connection_inbox_updates
+
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ['COMPLETED', 'CANCELLED', 'EXPIRED', 'VERIFIED']
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# How long a workshop has to answer a connection request
+CONNECTION_RESPONSE_WINDOW = timedelta(minutes=30)
+
+
+def overdue_requests(now=None):
+    return ServiceRequest.objects.filter(
+        expires_at__lt=now or timezone.now(),
+    ).exclude(status__in=TERMINAL_STATUSES)
+
+
+def is_effectively_expired(service_request, now=None):
+    """True when the request is past its deadline, even if no sweep has run yet."""
+    return (
+        service_request.status not in TERMINAL_STATUSES
+        and service_request.expires_at is not None
+        and service_request.expires_at < (now or timezone.now())
+    )
+
+
+def is_connection_overdue(connection, now=None):
+    """True when a connection request went unanswered past the response window, even if it is not auto-rejected yet."""
+    return (
+        connection.status == 'REQUESTED'
+        and connection.requested_at is not None
+        and connection.requested_at < (now or timezone.now()) - CONNECTION_RESPONSE_WINDOW
+    )
+
+
+def expire_due_requests(now=None, chunk_size=DEFAULT_CHUNK_SIZE, limit=None):
+    """
+    Expire every overdue request, chunk by chunk, each chunk in its own
+    transaction. Returns the number of requests expired.
+    """
+    now = now or timezone.now()
+    total = 0
+
+    while limit is None or total < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - total)
+        with transaction.atomic():
+            ids = list(
+                overdue_requests(now)
+                .select_for_update(skip_locked=True)
+                .order_by('expires_at', 'pk')
+                .values_list('pk', flat=True)[:size]
+            )
+            if not ids:
+                break
+            _expire_locked(ids, now)
+
+        total += len(ids)
+        logger.info(f"Expired {len(ids)} service request(s) ({total} so far)")
+
+    return total
+
+
+def expire_requests(service_request_ids, now=None):
+    """
+    Expire the given requests if they are (still) overdue and not locked by
+    someone else. Returns (expired ids, ids of overdue requests skipped
+    because another transaction held their lock).
+    """
+    now = now or timezone.now()
+    due = overdue_requests(now).filter(pk__in=service_request_ids)
+    with transaction.atomic():
+        ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True))
+        if ids:
+            _expire_locked(ids, now)
+        locked = list(due.exclude(pk__in=ids).values_list('pk', flat=True))
+    return ids, locked
+
+
+def check_expired_connections(queryset):
+    """
+    Auto-reject connection requests in `queryset` left unanswered for 30
+    minutes, all with one UPDATE ... RETURNING. Requests still CONNECTING go
+    back to PLATFORM_FEE_PAID in a second UPDATE; after commit every affected
+    request gets one flow update and every affected workshop one count
+    refresh. Returns the number of connections rejected.
+    """
+    now = timezone.now()
+    candidates = queryset.filter(
+        status='REQUESTED',
+        requested_at__lt=now - CONNECTION_RESPONSE_WINDOW
+    ).order_by().values('pk')
+
+    with transaction.atomic():
+        rows = _auto_reject(candidates, now)
+        if not rows:
+            return 0
+
+        connection_ids = [connection_id for connection_id, _, _ in rows]
+        service_request_ids = {service_request_id for _, service_request_id, _ in rows}
+
+        ServiceRequest.objects.filter(
+            pk__in=service_request_ids,
+            status='CONNECTING'
+        ).update(status='PLATFORM_FEE_PAID', updated_at=now)
+
+        rejected_per_workshop = Counter(workshop_id for _, _, workshop_id in rows)
+        adjust_pending_connections({workshop_id: -count for workshop_id, count in rejected_per_workshop.items()})
+        invalidate_participants(service_request_ids)
+
+        notify_service_flow_updates(service_request_ids)
+        push_connection_inbox_updates(connection_ids)
+        push_connection_counts_to_workshops(
+            Workshop.objects.filter(pk__in=rejected_per_workshop).values_list('user_id', flat=True)
+        )
+
+    logger.info(f"Auto-rejected {len(rows)} unanswered connection request(s)")
+    return len(rows)
+
+
+def _auto_reject(candidates, now):
+    """
+    UPDATE the connections selected by the `candidates` pk subquery to
+    AUTO_REJECTED and return their (id, service_request_id, workshop_id).
+    The status is re-checked on the row itself, so a connection accepted
+    concurrently is left alone.
+    """
+    meta = WorkshopConnection._meta
+    qn = connection.ops.quote_name
+    subquery, params = candidates.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {qn(meta.db_table)} "
+            f"SET {qn(meta.get_field('status').column)} = %s, {qn(meta.get_field('responded_at').column)} = %s "
+            f"WHERE {qn(meta.get_field('status').column)} = %s AND {qn(meta.pk.column)} IN ({subquery}) "
+            f"RETURNING {qn(meta.pk.column)}, {qn(meta.get_field('service_request').column)}, "
+            f"{qn(meta.get_field('workshop').column)}",
+            [
+                'AUTO_REJECTED',
+                meta.get_field('responded_at').get_db_prep_value(now, connection),
+                'REQUESTED',
+                *params,
+            ],
+        )
+        return cursor.fetchall()
+
+
+def expire_connections(connection_ids):
+    return check_expired_connections(WorkshopConnection.objects.filter(pk__in=connection_ids))
+
+
+def expire_estimates(estimate_ids, now=None):
+    """
+    Mark SENT estimates past their expires_at as EXPIRED so they can no longer
+    be approved. Returns (expired ids, ids of lapsed estimates skipped because
+    another transaction held their lock).
+    """
+    now = now or timezone.now()
+    due = Estimate.objects.filter(pk__in=estimate_ids, status='SENT', expires_at__lt=now)
+    with transaction.atomic():
+        expired = dict(due.select_for_update(skip_locked=True).values_list('pk', 'service_request_id'))
+        if expired:
+            Estimate.objects.filter(pk__in=expired).update(status='EXPIRED', updated_at=now)
+            notify_service_flow_updates(set(expired.values()), event='estimate_expired')
+        locked = list(due.exclude(pk__in=expired).values_list('pk', flat=True))
+    return list(expired), locked
+
+
+def _expire_locked(ids, now):
+    refunded = _refund_platform_fees(ids)
+    if refunded:
+        logger.info(f"Refunded platform fee for {len(refunded)} expired service request(s)")
+
+    service_status_changed(
+        ids, dict(ServiceRequest.objects.filter(pk__in=ids).values_list('pk', 'status')), 'EXPIRED'
+    )
+    ServiceRequest.objects.filter(pk__in=ids).update(status='EXPIRED', updated_at=now)
+
+    ChatMessageRecipient.objects.filter(
+        message__service_request_id__in=ids,
+        is_read=False,
+    ).update(is_read=True)
+
+    executions = ServiceExecution.objects.filter(service_request_id__in=ids)
+    Mechanic.objects.filter(
+        pk__in=executions.values('mechanics'),
+    ).update(availability='AVAILABLE')
+    executions.delete()
+    invalidate_participants(ids)
+
+    notify_service_flow_updates(ids)
+    push_connection_inbox_updates(
+        WorkshopConnection.objects.filter(service_request_id__in=ids).values_list('pk', flat=True)
+    )
+
+
+def _refund_platform_fees(ids):
+    """
+    Refund the platform fee of every eligible request among `ids` to its
+    owner's wallet, with the same eligibility rules as
+    payments.utils.check_and_process_refund. Returns the refunded request ids.
+
+    Runs in a savepoint: if refunding fails the requests still expire, just
+    without a refund, as the per-row path did.
+    """
+    eligible = ServiceRequest.objects.filter(
+        pk__in=ids,
+        platform_fee_paid=True,
+    ).exclude(connections__status__in=['ACCEPTED', 'CANCELLED'])
+
+    # First completed platform fee payment of each eligible request
+    first_payments = Payment.objects.filter(
+        service_request__in=eligible,
+        payment_type='PLATFORM_FEE',
+        status='COMPLETED',
+    ).order_by().values('service_request').annotate(first_id=Min('pk')).values('first_id')
+
+    payments = list(
+        Payment.objects.filter(pk__in=first_payments, is_refunded=False)
+        .select_related('service_request')
+        .only('pk', 'amount', 'service_request__id', 'service_request__user')
+    )
+    if not payments:
+        return []
+
+    try:
+        with transaction.atomic():
+            credits = {}
+            for payment in payments:
+                user_id = payment.service_request.user_id
+                credits[user_id] = credits.get(user_id, 0) + payment.amount
+
+            Wallet.objects.bulk_create(
+                [Wallet(user_id=user_id) for user_id in credits],
+                ignore_conflicts=True,
+            )
+            wallets = dict(Wallet.objects.filter(user_id__in=credits).values_list('user_id', 'pk'))
+
+            Wallet.objects.filter(user_id__in=credits).update(
+                balance=F('balance') + Case(
+                    *[When(user_id=user_id, then=Value(amount)) for user_id, amount in credits.items()],
+                    output_field=DecimalField(max_digits=10, decimal_places=2),
+                ),
+                updated_at=timezone.now(),
+            )
+
+            transactions = [
+                WalletTransaction(
+                    wallet_id=wallets[payment.service_request.user_id],
+                    amount=payment.amount,
+                    transaction_type='CREDIT',
+                    description=f"Refund for Service Request #{payment.service_request_id} (Expired/Unconnected)",
+                )
+                for payment in payments
+            ]
+
+            Payment.objects.filter(pk__in=[payment.pk for payment in payments]).update(
+                status='REFUNDED',
+                is_refunded=True,
+                refund_txn_id=Concat(Value('WALLET-REFUND-'), Cast('id', CharField())),
+                updated_at=timezone.now(),
+            )
+
+            admin_user = get_platform_admin()
+            if admin_user:
+                admin_wallet, _ = Wallet.objects.get_or_create(user=admin_user)
+                admin_wallet.balance = F('balance') - sum(payment.amount for payment in payments)
+                admin_wallet.save()
+
+                transactions.extend(
+                    WalletTransaction(
+                        wallet=admin_wallet,
+                        amount=payment.amount,
+                        transaction_type='DEBIT',
+                        description=f"Platform Fee Refunded to User for Service Request #{payment.service_request_id}",
+                    )
+                    for payment in payments
+                )
+
+            WalletTransaction.objects.bulk_create(transactions, batch_size=1000)
+
+    except Exception:
+        logger.exception(f"Failed to refund platform fees for {len(payments)} expiring service request(s)")
+        return []
+
+    return [payment.service_request_id for payment in payments]
@@ -0,0 +1,109 @@
+import asyncio
+import statistics
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import re_path
+
+from accounts.models import User, Workshop
+from chat import history
+from chat.consumers import ChatConsumer
+from chat.models import ChatMessage
+from service_request.models import ServiceRequest, WorkshopConnection
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark chat connect latency (connect until the first history frame) under concurrent room joins, '
+        'reading history from the database vs the Redis buffer. Seeded rows are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--joins', type=int, default=1000, help='Concurrent room joins per run')
+        parser.add_argument('--rooms', type=int, default=100)
+        parser.add_argument('--messages', type=int, default=60, help='Messages per room')
+
+    def handle(self, *args, **options):
+        tag = f"{time.time_ns()}"
+        rooms = self._seed(tag, options['rooms'], options['messages'])
+        application = URLRouter([
+            re_path(r"ws/chat/(?P<service_request_id>\d+)/$", ChatConsumer.as_asgi()),
+        ])
+
+        try:
+            for label, buffer_size in (('database', 0), ('buffer', settings.CHAT_HISTORY_BUFFER_SIZE)):
+                with override_settings(CHAT_HISTORY_BUFFER_SIZE=buffer_size):
+                    if buffer_size:
+                        for service_request_id, _ in rooms:
+                            history.load(service_request_id)
+
+                    started = time.perf_counter()
+                    latencies = asyncio.run(self._join_all(application, rooms, options['joins']))
+                    elapsed = time.perf_counter() - started
+                self._report(label, latencies, elapsed)
+        finally:
+            history.drop([service_request_id for service_request_id, _ in rooms])
+            User.objects.filter(email__endswith=f'-{tag}@example.invalid').delete()
+
+    async def _join_all(self, application, rooms, joins):
+        return await asyncio.gather(*(
+            self._join(application, *rooms[i % len(rooms)]) for i in range(joins)
+        ))
+
+    async def _join(self, application, service_request_id, user):
+        communicator = WebsocketCommunicator(application, f"/ws/chat/{service_request_id}/")
+        communicator.scope["user"] = user
+
+        started = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=120)
+        if connected:
+            await communicator.receive_json_from(timeout=120)
+        latency = time.perf_counter() - started
+
+        await communicator.disconnect()
+        return latency if connected else None
+
+    def _report(self, label, latencies, elapsed):
+        ok = sorted(latency for latency in latencies if latency is not None)
+        if not ok:
+            self.stdout.write(self.style.ERROR(f"  {label}: no join succeeded"))
+            return
+
+        def pct(p):
+            return ok[min(len(ok) - 1, int(len(ok) * p))] * 1000
+
+        self.stdout.write(
+            f"  {label:>8}: {len(ok)}/{len(latencies)} joins in {elapsed:.2f}s, "
+            f"p50 {statistics.median(ok) * 1000:.0f} ms, p95 {pct(0.95):.0f} ms, "
+            f"p99 {pct(0.99):.0f} ms, max {ok[-1] * 1000:.0f} ms"
+        )
+
+    def _seed(self, tag, room_count, messages_per_room):
+        self.stdout.write(f"Seeding {room_count} rooms with {messages_per_room} messages each...")
+        rooms = []
+        for i in range(room_count):
+            owner = User.objects.create(email=f'bench-connect-owner{i}-{tag}@example.invalid', full_name=f'Owner {i}', password='!')
+            workshop_user = User.objects.create(
+                email=f'bench-connect-workshop{i}-{tag}@example.invalid', full_name=f'Workshop {i}',
+                role='workshop_admin', password='!',
+            )
+            workshop = Workshop.objects.create(
+                user=workshop_user, workshop_name=f'Bench Workshop {i}', address_line='Synthetic', city='Bench',
+                state='Bench', pincode='000000', verification_status='APPROVED',
+            )
+            service_request = ServiceRequest.objects.create(
+                user=owner, vehicle_type='Bike', vehicle_model='Bench', issue_category='Engine',
+                description='Synthetic request for the chat connect benchmark', user_latitude=12.97,
+                user_longitude=77.59, status='IN_PROGRESS',
+            )
+            WorkshopConnection.objects.create(service_request=service_request, workshop=workshop, status='ACCEPTED')
+            ChatMessage.objects.bulk_create([
+                ChatMessage(service_request=service_request, sender=(owner, workshop_user)[n % 2], content=f'Bench {n}')
+                for n in range(messages_per_room)
+            ])
+            rooms.extend([(service_request.pk, owner), (service_request.pk, workshop_user)])
+        return rooms
@@ -0,0 +1,99 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User, Workshop, Mechanic
+from chat.models import ChatMessage, ChatMessageRecipient
+from chat.utils import create_chat_message
+from service_request.models import ServiceRequest, ServiceExecution, WorkshopConnection
+from service_request.participants import get_participants
+
+
+def _per_recipient_message(service_request, sender, content):
+    """The previous write path: participants walked through lazy relations, one INSERT per receipt."""
+    msg = ChatMessage.objects.create(service_request=service_request, sender=sender, content=content)
+
+    accepted = WorkshopConnection.objects.filter(service_request=service_request, status='ACCEPTED').first()
+    participants = [service_request.user, accepted.workshop.user]
+    execution = ServiceExecution.objects.get(service_request=service_request)
+    participants.extend(mechanic.user for mechanic in execution.mechanics.all())
+
+    receiver_ids = []
+    for participant in set(participants):
+        if participant.id != sender.id:
+            ChatMessageRecipient.objects.create(message=msg, user=participant, is_read=False)
+            receiver_ids.append(participant.id)
+    return msg, receiver_ids
+
+
+class Command(BaseCommand):
+    help = 'Benchmark chat message writes for a team workshop: per-recipient inserts vs bulk fan-out (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mechanics', type=int, default=25, help='Mechanics assigned to the service request')
+        parser.add_argument('--messages', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = options['messages']
+        self.stdout.write(f"Database: {connection.vendor}")
+
+        with transaction.atomic():
+            service_request, sender = self._seed(options['mechanics'])
+
+            for label, send in (
+                ('per-recipient', lambda i: _per_recipient_message(
+                    ServiceRequest.objects.select_related('user').get(pk=service_request.pk), sender, f'Bench {i}',
+                )),
+                ('bulk', lambda i: create_chat_message(
+                    service_request, sender, get_participants(service_request.pk), content=f'Bench {i}',
+                )),
+            ):
+                with CaptureQueriesContext(connection) as ctx:
+                    _, receiver_ids = send(0)
+                queries = len(ctx.captured_queries)
+
+                started = time.perf_counter()
+                for i in range(count):
+                    send(i)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"  {label:>13}: {count / elapsed:.0f} messages/s, {queries} queries/message, "
+                    f"{len(receiver_ids)} receipts each"
+                )
+
+            transaction.set_rollback(True)
+
+    def _seed(self, mechanic_count):
+        self.stdout.write(f"Seeding a workshop with {mechanic_count} mechanics on one service request...")
+        owner = User.objects.create(email='bench-chat-owner@example.invalid', full_name='Bench Owner', password='!')
+        workshop_user = User.objects.create(
+            email='bench-chat-workshop@example.invalid', full_name='Bench Workshop', role='workshop_admin', password='!',
+        )
+        workshop = Workshop.objects.create(
+            user=workshop_user, workshop_name='Bench Workshop', address_line='Synthetic', city='Bench',
+            state='Bench', pincode='000000', verification_status='APPROVED',
+        )
+        mechanics = [
+            Mechanic.objects.create(
+                user=User.objects.create(
+                    email=f'bench-chat-mechanic-{i}@example.invalid', full_name=f'Bench Mechanic {i}',
+                    role='mechanic', password='!',
+                ),
+                workshop=workshop, availability='BUSY',
+            )
+            for i in range(mechanic_count)
+        ]
+
+        service_request = ServiceRequest.objects.create(
+            user=owner, vehicle_type='Bike', vehicle_model='Bench', issue_category='Engine',
+            description='Synthetic request for the chat benchmark', user_latitude=12.97,
+            user_longitude=77.59, status='IN_PROGRESS',
+        )
+        WorkshopConnection.objects.create(service_request=service_request, workshop=workshop, status='ACCEPTED')
+        execution = ServiceExecution.objects.create(
+            service_request=service_request, workshop=workshop, assigned_to=workshop_user,
+        )
+        execution.mechanics.add(*mechanics)
+        return service_request, workshop_user
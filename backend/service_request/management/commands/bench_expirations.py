@@ -0,0 +1,131 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User, Workshop, Mechanic
+from chat.models import ChatMessage, ChatMessageRecipient
+from payments.models import Payment
+from service_request.expiration import expire_due_requests
+from service_request.models import ServiceRequest, ServiceExecution, WorkshopConnection
+from service_request.utils import check_request_expiration
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the batch expiration engine against synthetic overdue requests (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100_000)
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--per-row-sample', type=int, default=500,
+            help='Also time this many requests through the single-request path for comparison (0 to skip)',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            ids = self._seed(rng, options['requests'])
+
+            sample = options['per_row_sample']
+            if sample:
+                started = time.perf_counter()
+                for service_request in ServiceRequest.objects.filter(pk__in=ids[:sample]):
+                    check_request_expiration(service_request)
+                per_row = (time.perf_counter() - started) / sample
+                self.stdout.write(
+                    f"  single-request path: {per_row * 1000:.2f} ms/request "
+                    f"(~{per_row * len(ids):.1f}s projected for {len(ids)})"
+                )
+
+            started = time.perf_counter()
+            expired = expire_due_requests(chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  batch engine: {expired} requests in {elapsed:.2f}s "
+                f"({expired / elapsed if elapsed else 0:.0f} requests/s, chunk size {options['chunk_size']})"
+            )
+
+            remaining = ServiceRequest.objects.filter(pk__in=ids).exclude(status='EXPIRED').count()
+            unread = ChatMessageRecipient.objects.filter(message__service_request_id__in=ids, is_read=False).count()
+            refunded = Payment.objects.filter(service_request_id__in=ids, is_refunded=True).count()
+            self.stdout.write(f"  not expired: {remaining}, unread receipts left: {unread}, refunded payments: {refunded}")
+
+            if remaining or unread:
+                self.stdout.write(self.style.ERROR('Some requests were not fully expired!'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Every request expired.'))
+
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, count):
+        self.stdout.write(f"Seeding {count} overdue service requests...")
+        past = timezone.now() - timedelta(hours=1)
+
+        owner = User.objects.create(email='bench-expire-owner@example.invalid', full_name='Bench Owner', password='!')
+        workshop_user = User.objects.create(
+            email='bench-expire-workshop@example.invalid', full_name='Bench Workshop', role='workshop_admin', password='!',
+        )
+        workshop = Workshop.objects.create(
+            user=workshop_user, workshop_name='Bench Workshop', address_line='Synthetic', city='Bench',
+            state='Bench', pincode='000000', verification_status='APPROVED',
+        )
+        mechanics = [
+            Mechanic.objects.create(
+                user=User.objects.create(
+                    email=f'bench-expire-mechanic-{i}@example.invalid', full_name=f'Bench Mechanic {i}',
+                    role='mechanic', password='!',
+                ),
+                workshop=workshop, availability='BUSY',
+            )
+            for i in range(20)
+        ]
+
+        requests = []
+        for i in range(count):
+            kind = rng.random()
+            requests.append(ServiceRequest(
+                user=owner, vehicle_type='Bike', vehicle_model='Bench', issue_category='Engine',
+                description='Synthetic request for the expiration benchmark', user_latitude=12.97,
+                user_longitude=77.59, expires_at=past,
+                status='CONNECTED' if kind < 0.2 else 'PLATFORM_FEE_PAID' if kind < 0.6 else 'CREATED',
+                platform_fee_paid=kind < 0.6,
+            ))
+        ServiceRequest.objects.bulk_create(requests, batch_size=5000)
+        ids = [r.pk for r in requests]
+
+        paid = [r for r in requests if r.platform_fee_paid]
+        Payment.objects.bulk_create([
+            Payment(
+                user=owner, service_request=r, amount=Decimal('49.00'), stripe_checkout_id=f'bench-expire-{r.pk}',
+                payment_type='PLATFORM_FEE', status='COMPLETED',
+            )
+            for r in paid
+        ], batch_size=5000)
+
+        connected = [r for r in requests if r.status == 'CONNECTED']
+        WorkshopConnection.objects.bulk_create([
+            WorkshopConnection(service_request=r, workshop=workshop, status='ACCEPTED') for r in connected
+        ], batch_size=5000)
+        executions = ServiceExecution.objects.bulk_create([
+            ServiceExecution(service_request=r, workshop=workshop, assigned_to=workshop_user) for r in connected
+        ], batch_size=5000)
+        ServiceExecution.mechanics.through.objects.bulk_create([
+            ServiceExecution.mechanics.through(serviceexecution_id=e.pk, mechanic_id=rng.choice(mechanics).pk)
+            for e in executions
+        ], batch_size=5000)
+
+        messages = ChatMessage.objects.bulk_create([
+            ChatMessage(service_request=r, sender=workshop_user, content='Bench message') for r in connected
+        ], batch_size=5000)
+        ChatMessageRecipient.objects.bulk_create([
+            ChatMessageRecipient(message=m, user=owner) for m in messages
+        ], batch_size=5000)
+
+        return ids
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from channels_redis.serializers import registry
+from django.core.management.base import BaseCommand
+
+from chat.consumers import ChatConsumer
+from service_request.dispatch import encode_frame
+
+
+def _sample_message(i):
+    return {
+        "id": i,
+        "service_request_id": 4242,
+        "sender_id": 17,
+        "sender_name": "Bench Workshop",
+        "content": "The replacement part arrives tomorrow morning, we will start right after.",
+        "created_at": datetime(2026, 1, 1, tzinfo=timezone.utc).isoformat(),
+        "image_url": "",
+        "message_type": "text",
+    }
+
+
+class _Socket(ChatConsumer):
+    """A ChatConsumer whose socket just counts the frames it is handed."""
+
+    def __init__(self):
+        super().__init__()
+        self.frames = 0
+        self.base_send = self._count
+
+    async def _count(self, message):
+        self.frames += 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Microbenchmark CPU per delivered chat.message: a dict re-encoded by every socket vs a frame encoded '
+        'once, both through the channels_redis msgpack serializer as they would be per receiving channel'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--sizes', default='2,5,10,25,50', help='Comma separated group sizes')
+
+    def handle(self, *args, **options):
+        serializer = registry.get_serializer('msgpack')
+        sizes = [int(size) for size in options['sizes'].split(',')]
+
+        for size in sizes:
+            results = {}
+            for label in ('per-socket', 'encode-once'):
+                results[label] = asyncio.run(self._run(serializer, label, size, options['messages']))
+            self.stdout.write(
+                f"  group of {size:>2}: per-socket {results['per-socket']:.1f} us/delivery, "
+                f"encode-once {results['encode-once']:.1f} us/delivery "
+                f"({results['per-socket'] / results['encode-once']:.1f}x)"
+            )
+
+    async def _run(self, serializer, label, size, messages):
+        sockets = [_Socket() for _ in range(size)]
+
+        started = time.process_time()
+        for i in range(messages):
+            payload = _sample_message(i)
+            if label == 'per-socket':
+                event = {"type": "chat.message", "message": payload}
+            else:
+                event = {"type": "chat.message", "frame": encode_frame({"type": "chat.message", "message": payload})}
+
+            for n, socket in enumerate(sockets):
+                # channels_redis serializes the event once per receiving channel
+                wire = serializer.serialize({**event, "__asgi_channel__": f"specific.{n}"})
+                await socket.chat_message(serializer.deserialize(wire))
+        elapsed = time.process_time() - started
+
+        assert all(socket.frames == messages for socket in sockets)
+        return elapsed / (messages * size) * 1_000_000
@@ -0,0 +1,92 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from accounts.geohash import encode
+from accounts.models import User, Workshop
+from service_request.utils import get_nearby_workshops
+
+
+class Command(BaseCommand):
+    help = 'Benchmark get_nearby_workshops against synthetic workshops (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workshops', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--radius', type=float, default=20)
+        parser.add_argument('--lat', type=float, default=12.97)
+        parser.add_argument('--lon', type=float, default=77.59)
+        parser.add_argument('--spread', type=float, default=1.0, help='Degrees around the centre to scatter workshops')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            self._seed(rng, options)
+
+            points = [
+                (
+                    options['lat'] + rng.uniform(-options['spread'], options['spread']),
+                    options['lon'] + rng.uniform(-options['spread'], options['spread']),
+                )
+                for _ in range(options['queries'])
+            ]
+
+            results = {}
+            for label, use_index in (('bounding box', False), ('geohash cells', True)):
+                started = time.perf_counter()
+                results[label] = [
+                    [ws.id for ws in get_nearby_workshops(lat, lon, options['radius'], use_spatial_index=use_index)]
+                    for lat, lon in points
+                ]
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{label:>14}: {elapsed * 1000 / len(points):.2f} ms/query "
+                    f"({sum(map(len, results[label])) / len(points):.1f} workshops/query)"
+                )
+
+            if results['bounding box'] == results['geohash cells']:
+                self.stdout.write(self.style.SUCCESS('Results identical for every query.'))
+            else:
+                self.stdout.write(self.style.ERROR('Results differ between the two lookups!'))
+
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, options):
+        count = options['workshops']
+        self.stdout.write(f"Seeding {count} synthetic workshops...")
+
+        users = User.objects.bulk_create(
+            [
+                User(
+                    email=f'bench-workshop-{i}@example.invalid',
+                    full_name=f'Bench Workshop {i}',
+                    role='workshop_admin',
+                    password='!',
+                )
+                for i in range(count)
+            ],
+            batch_size=5000,
+        )
+
+        workshops = []
+        for i, user in enumerate(users):
+            lat = options['lat'] + rng.uniform(-options['spread'], options['spread'])
+            lon = options['lon'] + rng.uniform(-options['spread'], options['spread'])
+            workshops.append(Workshop(
+                user=user,
+                workshop_name=f'Bench Workshop {i}',
+                address_line='Synthetic',
+                city='Bench',
+                state='Bench',
+                pincode='000000',
+                latitude=lat,
+                longitude=lon,
+                geohash=encode(lat, lon),
+                verification_status='APPROVED' if rng.random() < 0.9 else 'PENDING',
+            ))
+
+        Workshop.objects.bulk_create(workshops, batch_size=5000)
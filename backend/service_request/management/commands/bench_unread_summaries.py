@@ -0,0 +1,110 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import User, Workshop
+from chat.models import ChatMessage, ChatMessageRecipient
+from chat.utils import get_unread_summaries
+from service_request.models import ServiceRequest
+from service_request.utils import ACTIVE_SERVICE_STATUSES
+
+
+def _per_request_summaries(user):
+    """The previous NotificationConsumer path: one lookup, COUNT and first() per service request."""
+    service_request_ids = (
+        ChatMessageRecipient.objects.filter(
+            user=user, is_read=False, message__service_request__status__in=ACTIVE_SERVICE_STATUSES,
+        ).values_list('message__service_request_id', flat=True).distinct()
+    )
+
+    summaries = []
+    for sr_id in service_request_ids:
+        service_request = ServiceRequest.objects.get(pk=sr_id)
+        unread_qs = ChatMessageRecipient.objects.filter(
+            message__service_request=service_request, user=user, is_read=False,
+        ).select_related('message__sender')
+        count = unread_qs.count()
+        last_receipt = unread_qs.order_by('-message__created_at').first()
+        summaries.append({
+            'service_request_id': service_request.id,
+            'unread_count': count,
+            'counterpart_name': last_receipt.message.sender.full_name if last_receipt else '',
+        })
+    return summaries
+
+
+class Command(BaseCommand):
+    help = 'Benchmark unread chat summaries: per-request queries vs the single grouped query (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=30, help='Active service requests with unread messages')
+        parser.add_argument('--messages', type=int, default=20, help='Unread messages per chat')
+        parser.add_argument('--rounds', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rounds = options['rounds']
+
+        with transaction.atomic():
+            owner = self._seed(rng, options['chats'], options['messages'])
+
+            results = {}
+            for label, func in (
+                ('per-request', lambda: _per_request_summaries(owner)),
+                ('grouped', lambda: get_unread_summaries(owner.id, service_statuses=ACTIVE_SERVICE_STATUSES)),
+            ):
+                with CaptureQueriesContext(connection) as ctx:
+                    results[label] = func()
+                queries = len(ctx.captured_queries)
+
+                started = time.perf_counter()
+                for _ in range(rounds):
+                    func()
+                elapsed = (time.perf_counter() - started) / rounds
+                self.stdout.write(f"  {label:>11}: {queries} queries, {elapsed * 1000:.2f} ms per connect")
+
+            by_id = lambda rows: sorted(rows, key=lambda row: row['service_request_id'])
+            if by_id(results['per-request']) == by_id(results['grouped']):
+                self.stdout.write(self.style.SUCCESS(f"Both paths agree on {len(results['grouped'])} summaries."))
+            else:
+                self.stdout.write(self.style.ERROR('The summaries differ!'))
+
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, chats, messages_per_chat):
+        self.stdout.write(f"Seeding {chats} chats with {messages_per_chat} unread messages each...")
+        owner = User.objects.create(email='bench-unread-owner@example.invalid', full_name='Bench Owner', password='!')
+        senders = []
+        for i in range(chats):
+            sender = User.objects.create(
+                email=f'bench-unread-workshop-{i}@example.invalid', full_name=f'Bench Workshop {i}',
+                role='workshop_admin', password='!',
+            )
+            Workshop.objects.create(
+                user=sender, workshop_name=f'Bench Workshop {i}', address_line='Synthetic', city='Bench',
+                state='Bench', pincode='000000', verification_status='APPROVED',
+            )
+            senders.append(sender)
+
+        requests = ServiceRequest.objects.bulk_create([
+            ServiceRequest(
+                user=owner, vehicle_type='Bike', vehicle_model='Bench', issue_category='Engine',
+                description='Synthetic request for the unread summary benchmark', user_latitude=12.97,
+                user_longitude=77.59, status=rng.choice(ACTIVE_SERVICE_STATUSES),
+            )
+            for _ in range(chats)
+        ])
+
+        messages = ChatMessage.objects.bulk_create([
+            ChatMessage(service_request=r, sender=rng.choice([sender, owner]), content='Bench message')
+            for r, sender in zip(requests, senders)
+            for _ in range(messages_per_chat)
+        ], batch_size=5000)
+        ChatMessageRecipient.objects.bulk_create([
+            ChatMessageRecipient(message=m, user=owner) for m in messages if m.sender_id != owner.id
+        ], batch_size=5000)
+        return owner
@@ -0,0 +1,495 @@
+import asyncio
+import json
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import Mechanic, User, Workshop
+from chat import history, unread
+from chat.models import ChatMessage
+from service_request import outbox
+from service_request.models import ServiceExecution, ServiceRequest, WorkshopConnection
+from service_request.utils import notify_service_flow_updates
+
+
+CHAT_PREFIX = 'loadtest '
+FLOW_PREFIX = 'loadtest_'
+
+# Readers block on their socket until the run closes it
+READ_TIMEOUT = 24 * 60 * 60
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2)
+
+    return {
+        'count': len(ordered),
+        'p50': round(statistics.median(ordered), 2),
+        'p95': pct(0.95),
+        'p99': pct(0.99),
+        'max': round(ordered[-1], 2),
+    }
+
+
+class _Stats:
+
+    def __init__(self):
+        self.sockets = 0
+        self.connect_ms = []
+        self.connect_failures = 0
+        # seq -> perf_counter() when it was sent
+        self.chat_sent = {}
+        self.chat_expected = 0
+        self.chat_fanout_ms = []
+        self.flow_sent = {}
+        self.flow_expected = 0
+        self.flow_fanout_ms = []
+        self.notifications = 0
+        self.last_delivery = None
+
+    def delivered(self, sent, samples, seq, now):
+        if seq in sent:
+            samples.append((now - sent[seq]) * 1000)
+            self.last_delivery = now
+
+
+class _Client:
+    """
+    One participant's sockets: notifications, chat and service flow, either as
+    the three per-stream endpoints or as streams of one ws/stream/ socket.
+    """
+
+    def __init__(self, stats, token, room, multiplexed):
+        self.stats = stats
+        self.token = token
+        self.room = room
+        self.multiplexed = multiplexed
+        self.sockets = {}
+        self.readers = []
+        self.ready = {kind: asyncio.Event() for kind in ('notifications', 'chat', 'service_flow')}
+
+    async def connect(self, application, timeout):
+        if self.multiplexed:
+            started = time.perf_counter()
+            communicator = await self._open(application, None, '/ws/stream/', timeout)
+            if communicator is None:
+                return
+            for stream in ('notifications', f'chat:{self.room}', f'service_flow:{self.room}'):
+                await communicator.send_json_to({'action': 'subscribe', 'stream': stream})
+            await self._wait_ready(self.ready.values(), started, timeout)
+            return
+
+        await asyncio.gather(
+            self._connect_one(application, 'notifications', '/ws/notifications/', timeout),
+            self._connect_one(application, 'chat', f'/ws/chat/{self.room}/', timeout),
+            self._connect_one(application, 'service_flow', f'/ws/service-flow/{self.room}/', timeout),
+        )
+
+    async def _connect_one(self, application, kind, path, timeout):
+        started = time.perf_counter()
+        if await self._open(application, kind, path, timeout) is None:
+            return
+        if kind == 'service_flow':
+            # Nothing is sent on connect; accepted is ready
+            self.ready[kind].set()
+        await self._wait_ready([self.ready[kind]], started, timeout)
+
+    async def _open(self, application, kind, path, timeout):
+        communicator = WebsocketCommunicator(application, f'{path}?token={self.token}')
+        try:
+            connected, _ = await communicator.connect(timeout=timeout)
+        except asyncio.TimeoutError:
+            connected = False
+        if not connected:
+            self.stats.connect_failures += 1
+            return None
+
+        self.stats.sockets += 1
+        self.sockets[kind or 'stream'] = communicator
+        self.readers.append(asyncio.create_task(self._read(communicator, kind)))
+        return communicator
+
+    async def _wait_ready(self, events, started, timeout):
+        try:
+            await asyncio.wait_for(asyncio.gather(*(event.wait() for event in events)), timeout)
+        except asyncio.TimeoutError:
+            self.stats.connect_failures += 1
+            return
+        self.stats.connect_ms.append((time.perf_counter() - started) * 1000)
+
+    async def _read(self, communicator, kind):
+        while True:
+            try:
+                text = await communicator.receive_from(timeout=READ_TIMEOUT)
+            except (AssertionError, asyncio.TimeoutError):
+                # Closed by the server
+                return
+            now = time.perf_counter()
+
+            data = json.loads(text)
+            if kind is None:
+                kind_of_frame = data['stream'].partition(':')[0]
+                data = data['data']
+            else:
+                kind_of_frame = kind
+            self._on_frame(kind_of_frame, data, now)
+
+    def _on_frame(self, kind, data, now):
+        frame_type = data.get('type', '')
+
+        if frame_type in ('notifications.initial', 'chat.history'):
+            self.ready[kind].set()
+        elif frame_type == 'stream.subscribed' and kind == 'service_flow':
+            self.ready[kind].set()
+        elif frame_type == 'chat.message':
+            content = data['message'].get('content') or ''
+            if content.startswith(CHAT_PREFIX):
+                self.stats.delivered(
+                    self.stats.chat_sent, self.stats.chat_fanout_ms, int(content[len(CHAT_PREFIX):]), now,
+                )
+        elif frame_type == 'service_flow.update':
+            event = data.get('event') or ''
+            if event.startswith(FLOW_PREFIX):
+                self.stats.delivered(
+                    self.stats.flow_sent, self.stats.flow_fanout_ms, int(event[len(FLOW_PREFIX):]), now,
+                )
+        elif frame_type.startswith('notifications.'):
+            self.stats.notifications += 1
+
+    @property
+    def has_chat(self):
+        return 'chat' in self.sockets or ('stream' in self.sockets and self.ready['chat'].is_set())
+
+    @property
+    def has_service_flow(self):
+        return 'service_flow' in self.sockets or ('stream' in self.sockets and self.ready['service_flow'].is_set())
+
+    async def send_chat(self, seq):
+        content = f'{CHAT_PREFIX}{seq}'
+        if self.multiplexed:
+            await self.sockets['stream'].send_json_to({'stream': f'chat:{self.room}', 'type': 'message', 'message': content})
+        else:
+            await self.sockets['chat'].send_json_to({'type': 'message', 'message': content})
+
+    async def close(self):
+        for reader in self.readers:
+            reader.cancel()
+        await asyncio.gather(
+            *(communicator.disconnect() for communicator in self.sockets.values()),
+            return_exceptions=True,
+        )
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the chat, notification and service flow sockets through the ASGI application: '
+        'concurrent sessions in seeded rooms, paced chat messages and service flow updates. Reports connect '
+        'latency, fan-out p50/p99, throughput and memory per socket; --json writes the results for comparing '
+        'runs across commits. With --delivery outbox a relay runs in-process and fan-out includes its polling. '
+        'Uses the configured database (SQLite or Postgres); seeded rows are deleted afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=50, help='Service requests, one chat room each')
+        parser.add_argument(
+            '--users-per-room', type=int, default=3,
+            help='Participants per room: the owner, the workshop admin and the rest as assigned mechanics',
+        )
+        parser.add_argument(
+            '--mode', choices=('endpoints', 'stream'), default='endpoints',
+            help='endpoints: a notifications, chat and service-flow socket per user; stream: one ws/stream/ socket',
+        )
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of traffic')
+        parser.add_argument('--chat-rate', type=float, default=50.0, help='Chat messages per second, over all rooms')
+        parser.add_argument('--flow-rate', type=float, default=5.0, help='Service flow updates per second, over all rooms')
+        parser.add_argument('--history', type=int, default=20, help='Seeded messages per room')
+        parser.add_argument(
+            '--layer', choices=('memory', 'redis', 'settings'), default='memory',
+            help='In-memory channel layer, channels_redis at --redis-url, or CHANNEL_LAYERS as configured',
+        )
+        parser.add_argument('--redis-url', default='redis://127.0.0.1:6379/0')
+        parser.add_argument(
+            '--delivery', choices=('direct', 'outbox', 'settings'), default='direct',
+            help='REALTIME_DELIVERY for dispatched events such as service flow updates; settings keeps the configured value',
+        )
+        parser.add_argument('--connect-concurrency', type=int, default=100, help='Sessions connecting at once')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a connect counts as failed')
+        parser.add_argument('--drain', type=float, default=5.0, help='Seconds to wait for in-flight deliveries')
+        parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc, which slows everything down')
+        parser.add_argument('--json', dest='json_path', help="Write the results as JSON to this path, '-' for stdout")
+
+    def handle(self, *args, **options):
+        if options['users_per_room'] < 2:
+            raise CommandError('--users-per-room must be at least 2 (owner and workshop admin)')
+
+        from backend.asgi import application
+
+        delivery = settings.REALTIME_DELIVERY if options['delivery'] == 'settings' else options['delivery']
+        overrides = {'REALTIME_DELIVERY': delivery}
+        if options['layer'] == 'memory':
+            overrides['CHANNEL_LAYERS'] = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+        elif options['layer'] == 'redis':
+            overrides['CHANNEL_LAYERS'] = {'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [options['redis_url']]},
+            }}
+
+        tag = f"{time.time_ns()}"
+        rooms = self._seed(tag, options['rooms'], options['users_per_room'], options['history'])
+        try:
+            # Minting touches the database, so it is done before the event loop starts
+            sessions = [
+                (room, str(RefreshToken.for_user(user).access_token))
+                for room, users in rooms.items() for user in users
+            ]
+            with override_settings(**overrides):
+                stats, elapsed, memory = asyncio.run(self._run(application, sessions, options, delivery))
+        finally:
+            self._cleanup(tag, list(rooms))
+
+        report = self._report(options, delivery, stats, elapsed, memory)
+        if options['json_path'] == '-':
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+        self._print(report)
+
+    async def _run(self, application, sessions, options, delivery):
+        stats = _Stats()
+        multiplexed = options['mode'] == 'stream'
+        clients = [_Client(stats, token, room, multiplexed) for room, token in sessions]
+
+        if not options['no_memory']:
+            tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+
+        async def connect(client):
+            async with semaphore:
+                await client.connect(application, options['timeout'])
+
+        self.stderr.write(f"Connecting {len(clients)} sessions ({options['mode']})...")
+        connect_started = time.perf_counter()
+        await asyncio.gather(*(connect(client) for client in clients))
+        connect_elapsed = time.perf_counter() - connect_started
+
+        memory = None
+        if baseline is not None:
+            in_use = tracemalloc.get_traced_memory()[0] - baseline
+            tracemalloc.stop()
+            memory = {
+                'bytes_total': in_use,
+                'bytes_per_socket': round(in_use / stats.sockets) if stats.sockets else None,
+            }
+
+        by_room = {}
+        for client in clients:
+            by_room.setdefault(client.room, []).append(client)
+
+        # Outbox rows are only delivered by a relay, so one runs alongside the traffic
+        relay = asyncio.create_task(outbox.run_relay()) if delivery == 'outbox' else None
+
+        self.stderr.write(f"Sending traffic for {options['duration']}s ({delivery} delivery)...")
+        traffic_started = time.perf_counter()
+        await asyncio.gather(
+            self._pace(options['chat_rate'], options['duration'], lambda seq: self._send_chat(stats, by_room, seq)),
+            self._pace(options['flow_rate'], options['duration'], lambda seq: self._send_flow(stats, by_room, seq)),
+        )
+        sending_elapsed = time.perf_counter() - traffic_started
+
+        drain_until = time.perf_counter() + options['drain']
+        while time.perf_counter() < drain_until and (
+            len(stats.chat_fanout_ms) < stats.chat_expected or len(stats.flow_fanout_ms) < stats.flow_expected
+        ):
+            await asyncio.sleep(0.05)
+        delivery_elapsed = (stats.last_delivery or time.perf_counter()) - traffic_started
+
+        if relay is not None:
+            relay.cancel()
+            await asyncio.gather(relay, return_exceptions=True)
+        await asyncio.gather(*(client.close() for client in clients))
+        return stats, {
+            'connect': connect_elapsed,
+            'sending': sending_elapsed,
+            'delivery': delivery_elapsed,
+        }, memory
+
+    async def _pace(self, rate, duration, send):
+        if rate <= 0:
+            return
+        started = time.perf_counter()
+        for seq in range(int(rate * duration)):
+            delay = started + seq / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await send(seq)
+
+    async def _send_chat(self, stats, by_room, seq):
+        rooms = list(by_room)
+        clients = by_room[rooms[seq % len(rooms)]]
+        senders = [client for client in clients[:2] if client.has_chat]
+        if not senders:
+            return
+
+        # Owner and workshop take turns
+        sender = senders[(seq // len(rooms)) % len(senders)]
+        stats.chat_expected += sum(client.has_chat for client in clients)
+        stats.chat_sent[seq] = time.perf_counter()
+        await sender.send_chat(seq)
+
+    async def _send_flow(self, stats, by_room, seq):
+        rooms = list(by_room)
+        room = rooms[seq % len(rooms)]
+        stats.flow_expected += sum(client.has_service_flow for client in by_room[room])
+        stats.flow_sent[seq] = time.perf_counter()
+        await database_sync_to_async(notify_service_flow_updates)([room], event=f'{FLOW_PREFIX}{seq}')
+
+    def _report(self, options, delivery, stats, elapsed, memory):
+        return {
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'commit': self._commit(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'channel_layer': (
+                    settings.CHANNEL_LAYERS['default']['BACKEND'] if options['layer'] == 'settings' else options['layer']
+                ),
+                'delivery': delivery,
+            },
+            'config': {
+                key: options[key] for key in (
+                    'mode', 'rooms', 'users_per_room', 'duration', 'chat_rate', 'flow_rate', 'history',
+                    'layer', 'delivery', 'connect_concurrency',
+                )
+            },
+            'connect': {
+                'sessions': options['rooms'] * options['users_per_room'],
+                'sockets': stats.sockets,
+                'failures': stats.connect_failures,
+                'seconds': round(elapsed['connect'], 3),
+                'latency_ms': _percentiles(stats.connect_ms),
+            },
+            'chat': {
+                'sent': len(stats.chat_sent),
+                'expected_deliveries': stats.chat_expected,
+                'delivered': len(stats.chat_fanout_ms),
+                'messages_per_second': round(len(stats.chat_sent) / elapsed['sending'], 1) if elapsed['sending'] else None,
+                'deliveries_per_second': (
+                    round(len(stats.chat_fanout_ms) / elapsed['delivery'], 1) if elapsed['delivery'] > 0 else None
+                ),
+                'fanout_ms': _percentiles(stats.chat_fanout_ms),
+            },
+            'service_flow': {
+                'sent': len(stats.flow_sent),
+                'expected_deliveries': stats.flow_expected,
+                'delivered': len(stats.flow_fanout_ms),
+                'updates_per_second': round(len(stats.flow_sent) / elapsed['sending'], 1) if elapsed['sending'] else None,
+                'fanout_ms': _percentiles(stats.flow_fanout_ms),
+            },
+            'notifications': {'received': stats.notifications},
+            'memory': memory,
+        }
+
+    def _print(self, report):
+        connect, chat, flow = report['connect'], report['chat'], report['service_flow']
+
+        def fmt(p):
+            return f"p50 {p['p50']:.1f} ms, p99 {p['p99']:.1f} ms, max {p['max']:.1f} ms" if p else 'n/a'
+
+        self.stdout.write(
+            f"  setup: {report['environment']['channel_layer']} channel layer, "
+            f"{report['environment']['delivery']} delivery, {report['environment']['database']}"
+        )
+        self.stdout.write(
+            f"  connect: {connect['sockets']} sockets for {connect['sessions']} sessions in {connect['seconds']}s, "
+            f"{connect['failures']} failed, {fmt(connect['latency_ms'])}"
+        )
+        self.stdout.write(
+            f"  chat: {chat['sent']} sent ({chat['messages_per_second']}/s), "
+            f"{chat['delivered']}/{chat['expected_deliveries']} delivered ({chat['deliveries_per_second']}/s), "
+            f"fan-out {fmt(chat['fanout_ms'])}"
+        )
+        self.stdout.write(
+            f"  service flow: {flow['sent']} sent ({flow['updates_per_second']}/s), "
+            f"{flow['delivered']}/{flow['expected_deliveries']} delivered, fan-out {fmt(flow['fanout_ms'])}"
+        )
+        self.stdout.write(f"  notifications: {report['notifications']['received']} frames")
+        if report['memory']:
+            self.stdout.write(f"  memory: {report['memory']['bytes_per_socket'] / 1024:.1f} KiB per socket")
+
+    def _commit(self):
+        try:
+            result = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            )
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return result.stdout.strip() or None
+
+    def _seed(self, tag, room_count, users_per_room, messages_per_room):
+        self.stderr.write(f"Seeding {room_count} rooms with {users_per_room} participants each...")
+        rooms = {}
+        for i in range(room_count):
+            owner = User.objects.create(email=f'loadtest-owner{i}-{tag}@example.invalid', full_name=f'Owner {i}', password='!')
+            workshop_user = User.objects.create(
+                email=f'loadtest-workshop{i}-{tag}@example.invalid', full_name=f'Workshop {i}',
+                role='workshop_admin', password='!',
+            )
+            workshop = Workshop.objects.create(
+                user=workshop_user, workshop_name=f'Load Test Workshop {i}', address_line='Synthetic', city='Load',
+                state='Load', pincode='000000', verification_status='APPROVED',
+            )
+            mechanics = [
+                Mechanic.objects.create(
+                    user=User.objects.create(
+                        email=f'loadtest-mechanic{i}-{n}-{tag}@example.invalid', full_name=f'Mechanic {i}-{n}',
+                        role='mechanic', password='!',
+                    ),
+                    workshop=workshop, availability='BUSY',
+                )
+                for n in range(users_per_room - 2)
+            ]
+
+            service_request = ServiceRequest.objects.create(
+                user=owner, vehicle_type='Bike', vehicle_model='Load', issue_category='Engine',
+                description='Synthetic request for the websocket load test', user_latitude=12.97,
+                user_longitude=77.59, status='IN_PROGRESS',
+            )
+            WorkshopConnection.objects.create(service_request=service_request, workshop=workshop, status='ACCEPTED')
+            execution = ServiceExecution.objects.create(
+                service_request=service_request, workshop=workshop, assigned_to=workshop_user,
+            )
+            execution.mechanics.add(*mechanics)
+            ChatMessage.objects.bulk_create([
+                ChatMessage(service_request=service_request, sender=(owner, workshop_user)[n % 2], content=f'Seed {n}')
+                for n in range(messages_per_room)
+            ])
+            rooms[service_request.pk] = [owner, workshop_user] + [mechanic.user for mechanic in mechanics]
+        return rooms
+
+    def _cleanup(self, tag, room_ids):
+        unread.clear_service_requests(room_ids)
+        history.drop(room_ids)
+        User.objects.filter(email__endswith=f'-{tag}@example.invalid').delete()
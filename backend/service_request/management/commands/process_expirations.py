@@ -1,33 +1,44 @@
+import time
+
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from service_request.models import ServiceRequest
-from payments.utils import check_and_process_refund
+
+from service_request.expiration import (
+    DEFAULT_CHUNK_SIZE, check_expired_connections, expire_due_requests, expire_estimates,
+)
+from service_request.models import Estimate, WorkshopConnection
+
 
 class Command(BaseCommand):
-    help = 'Process expired service requests and handle refunds'
-
-    def handle(self, *args, **kwargs):
-        now = timezone.now()
-        
-        # 1. Find requests that are EXPIRED based on time, but status is not updated
-        # Status candidates: CREATED, FEE_PAID, CONNECTING
-        expired_candidates = ServiceRequest.objects.filter(
-            expires_at__lt=now,
-            status__in=['CREATED', 'FEE_PAID', 'CONNECTING']
+    help = 'Expire overdue service requests (with refunds) and estimates, and auto-reject unanswered connection requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping instead of running once')
+        parser.add_argument('--interval', type=float, default=30, help='Seconds between sweeps with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            self._sweep(options['chunk_size'])
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def _sweep(self, chunk_size):
+        started = time.perf_counter()
+
+        rejected = check_expired_connections(WorkshopConnection.objects.all())
+        expired = expire_due_requests(timezone.now(), chunk_size=chunk_size)
+        # Locked estimates are left to whoever holds them, or to the next sweep
+        lapsed, _ = expire_estimates(
+            Estimate.objects.filter(status='SENT', expires_at__lt=timezone.now()).values_list('pk', flat=True)
         )
-        
-        for req in expired_candidates:
-            self.stdout.write(f"Processing expired request {req.id}...")
-            
-            # Check for refund eligibility
-            refunded, message = check_and_process_refund(req)
-            
-            req.status = 'EXPIRED'
-            req.save()
-            
-            if refunded:
-                self.stdout.write(self.style.SUCCESS(f"  -> Expired & Refunded: {message}"))
-            else:
-                 self.stdout.write(self.style.WARNING(f"  -> Expired (No Refund): {message}"))
-
-        self.stdout.write(self.style.SUCCESS('Expiration check complete.'))
+
+        elapsed = time.perf_counter() - started
+        if expired or rejected or lapsed:
+            self.stdout.write(self.style.SUCCESS(
+                f"Expired {expired} request(s) and {len(lapsed)} estimate(s), "
+                f"auto-rejected {rejected} connection(s) in {elapsed:.2f}s"
+            ))
+        else:
+            self.stdout.write('Expiration check complete, nothing due.')
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from service_request.counters import RECONCILE_CHUNK_SIZE, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute notification counters (pending connections, active tasks) and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=RECONCILE_CHUNK_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep reconciling instead of running once')
+        parser.add_argument('--interval', type=float, default=600, help='Seconds between runs with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            fixed = reconcile_counters(chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+
+            if fixed:
+                self.stdout.write(self.style.WARNING(f"Fixed {fixed} counter row(s) in {elapsed:.2f}s"))
+            else:
+                self.stdout.write(f"Counters consistent ({elapsed:.2f}s)")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from service_request import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Apply service request, connection and estimate deadlines as they fall due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-sleep', type=float, default=1.0, help='Longest pause between queue checks, in seconds')
+        parser.add_argument('--no-backfill', action='store_true', help='Skip registering deadlines already in the database')
+        parser.add_argument('--once', action='store_true', help='Apply what is due now and exit')
+
+    def handle(self, *args, **options):
+        if not options['no_backfill']:
+            registered = scheduler.backfill()
+            self.stdout.write(f"Registered {registered} pending deadline(s), {scheduler.pending_count()} queued")
+
+        while True:
+            handled = scheduler.run_due(batch_size=options['batch_size'])
+            if handled:
+                self.stdout.write(self.style.SUCCESS(f"Applied {handled} deadline(s)"))
+
+            if options['once']:
+                break
+
+            # New deadlines can be registered while we sleep, so never sleep
+            # longer than max_sleep even when the next known one is far away.
+            wait = scheduler.next_due_in()
+            time.sleep(options['max_sleep'] if wait is None else min(wait, options['max_sleep']))
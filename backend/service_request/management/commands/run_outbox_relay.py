@@ -0,0 +1,32 @@
+import asyncio
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from service_request import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver realtime events from the outbox table to the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds to wait when idle and not woken by NOTIFY')
+        parser.add_argument('--lease', type=float, default=None, help='Seconds a claimed batch stays reserved')
+        parser.add_argument('--prune-interval', type=float, default=300)
+        parser.add_argument('--replay-minutes', type=float, default=None, help='Re-deliver events created in the last N minutes first')
+        parser.add_argument('--once', action='store_true', help='Deliver what is pending and exit')
+
+    def handle(self, *args, **options):
+        if options['replay_minutes'] is not None:
+            since = timezone.now() - timedelta(minutes=options['replay_minutes'])
+            self.stdout.write(f"Re-queued {outbox.replay(since)} event(s) created since {since:%Y-%m-%d %H:%M:%S}")
+
+        asyncio.run(outbox.run_relay(
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+            lease_seconds=options['lease'],
+            prune_interval=options['prune_interval'],
+            once=options['once'],
+        ))
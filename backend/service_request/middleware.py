@@ -0,0 +1,16 @@
+from . import dispatch
+
+
+class NotificationBatchMiddleware:
+    """
+    Collect every notification a request produces and send them in one
+    batch once the response is ready, instead of one channel layer round
+    trip per notify/push call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with dispatch.collect():
+            return self.get_response(request)
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_request', '0012_serviceexecution_otp_attempts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='estimate',
+            name='status',
+            field=models.CharField(choices=[('DRAFT', 'Draft'), ('SENT', 'Sent'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected'), ('EXPIRED', 'Expired')], default='DRAFT', max_length=20),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+# Wake the outbox relay (LISTEN realtime_outbox) when a transaction that wrote
+# events commits. Postgres only; elsewhere the relay just polls.
+NOTIFY_TRIGGER_SQL = """
+CREATE OR REPLACE FUNCTION service_request_outbox_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('realtime_outbox', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER service_request_outbox_notify
+    AFTER INSERT ON service_request_outboxevent
+    FOR EACH STATEMENT EXECUTE FUNCTION service_request_outbox_notify();
+"""
+
+DROP_NOTIFY_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS service_request_outbox_notify ON service_request_outboxevent;
+DROP FUNCTION IF EXISTS service_request_outbox_notify();
+"""
+
+
+def create_notify_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(NOTIFY_TRIGGER_SQL)
+
+
+def drop_notify_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_NOTIFY_TRIGGER_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_request', '0014_notificationcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('topic', models.CharField(max_length=50)),
+                ('items', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('claimed_until', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('delivered_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('delivered_at__isnull', True)), fields=['id'], name='outbox_pending_idx')],
+            },
+        ),
+        migrations.RunPython(create_notify_trigger, drop_notify_trigger),
+    ]
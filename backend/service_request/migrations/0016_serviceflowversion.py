@@ -0,0 +1,22 @@
+# Generated by Django 6.0 on 2026-10-17 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_request', '0015_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceFlowVersion',
+            fields=[
+                ('service_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='flow_version', serialize=False, to='service_request.servicerequest')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
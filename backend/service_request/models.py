@@ -49,6 +49,8 @@ class ServiceRequest(models.Model):
     def save(self, *args, **kwargs):
 
         is_new = self.pk is None
+        previous_expires_at = None
+        previous_status = None
         
         if is_new:
             if not self.expires_at:
@@ -57,6 +59,8 @@ class ServiceRequest(models.Model):
         else:
             try:
                 old_instance = ServiceRequest.objects.get(pk=self.pk)
+                previous_expires_at = old_instance.expires_at
+                previous_status = old_instance.status
                 if not old_instance.platform_fee_paid and self.platform_fee_paid:
                     self.expires_at = timezone.now() + datetime.timedelta(days=7)
             except ServiceRequest.DoesNotExist:
@@ -64,6 +68,14 @@ class ServiceRequest(models.Model):
 
         super().save(*args, **kwargs)
 
+        if not is_new and previous_status is not None and previous_status != self.status:
+            from .counters import service_status_changed
+            service_status_changed([self.pk], previous_status, self.status)
+
+        if self.expires_at and self.expires_at != previous_expires_at:
+            from .scheduler import SERVICE_REQUEST, schedule_deadline
+            schedule_deadline(SERVICE_REQUEST, self.pk, self.expires_at)
+
 
 class WorkshopConnection(models.Model):
     STATUS_CHOICES = [
@@ -91,6 +103,32 @@ class WorkshopConnection(models.Model):
     requested_at = models.DateTimeField(auto_now_add=True)
     responded_at = models.DateTimeField(null=True, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = dict(zip(field_names, values)).get('status')
+        return instance
+
+    def save(self, *args, **kwargs):
+        is_new = self.pk is None
+        previous_status = None if is_new else getattr(self, '_loaded_status', None)
+        if not is_new and previous_status is None:
+            previous_status = WorkshopConnection.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+
+        super().save(*args, **kwargs)
+
+        if previous_status != self.status:
+            from .counters import connection_status_changed
+            from .participants import invalidate_participants
+            connection_status_changed(self.workshop_id, previous_status, self.status)
+            invalidate_participants([self.service_request_id])
+            self._loaded_status = self.status
+
+        if is_new and self.status == 'REQUESTED':
+            from .expiration import CONNECTION_RESPONSE_WINDOW
+            from .scheduler import CONNECTION, schedule_deadline
+            schedule_deadline(CONNECTION, self.pk, self.requested_at + CONNECTION_RESPONSE_WINDOW)
+
 
 class Estimate(models.Model):
     STATUS_CHOICES = [
@@ -98,6 +136,7 @@ class Estimate(models.Model):
         ('SENT', 'Sent'),
         ('APPROVED', 'Approved'),
         ('REJECTED', 'Rejected'),
+        ('EXPIRED', 'Expired'),
     ]
 
     LINE_ITEM_TYPE_CHOICES = [
@@ -146,6 +185,10 @@ class Estimate(models.Model):
             self.calculate_totals()
         super().save(*args, **kwargs)
 
+        if self.status == 'SENT' and self.expires_at:
+            from .scheduler import ESTIMATE, schedule_deadline
+            schedule_deadline(ESTIMATE, self.pk, self.expires_at)
+
     def __str__(self):
         return f"Estimate #{self.id} - {self.service_request.id} - {self.status}"
 
@@ -284,4 +327,62 @@ class MechanicReview(BaseReview):
         self.update_mechanic_average()
     def delete(self, *args, **kwargs):
         super().delete(*args, **kwargs)
-        self.update_mechanic_average()
\ No newline at end of file
+        self.update_mechanic_average()
+
+class NotificationCounter(models.Model):
+    """
+    Per-user notification badge counts, adjusted in place by every state
+    transition (see service_request.counters) so reading them is one row
+    lookup instead of a COUNT over connections or executions.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+
+    pending_connections = models.IntegerField(default=0)
+    active_tasks = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Counters for user #{self.user_id}: {self.pending_connections} pending, {self.active_tasks} active"
+
+
+class OutboxEvent(models.Model):
+    """
+    Realtime notification written in the same transaction as the change it
+    announces. run_outbox_relay delivers pending rows to the channel layer
+    at least once and prunes them after OUTBOX_RETENTION_HOURS.
+    """
+    id = models.BigAutoField(primary_key=True)
+
+    topic = models.CharField(max_length=50)
+    items = models.JSONField()
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    delivered_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(delivered_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"Outbox #{self.id} {self.topic} ({'delivered' if self.delivered_at else 'pending'})"
+
+
+class ServiceFlowVersion(models.Model):
+    """
+    Version of the service flow state pushed to the service flow socket.
+    Bumped once per service_flow.update so clients can tell whether a delta
+    follows the state they hold or whether they missed one and must refetch.
+    Kept off ServiceRequest because ServiceRequest.save writes every column.
+    """
+    service_request = models.OneToOneField(ServiceRequest, on_delete=models.CASCADE, primary_key=True, related_name='flow_version')
+
+    version = models.PositiveBigIntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Service request #{self.service_request_id} flow v{self.version}"
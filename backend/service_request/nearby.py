@@ -0,0 +1,268 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+import hashlib
+import logging
+
+from accounts.geohash import cells_in_box, encode
+
+
+logger = logging.getLogger(__name__)
+
+# Shared by every worker (CACHES['shared'])
+cache = ConnectionProxy(caches, 'shared')
+
+# Shared (cross-worker) log of workshop changes that affect nearby lookups.
+# Every change bumps a version counter and records the workshop id under that
+# version, so in-process snapshots can catch up by re-reading only those rows.
+CHANGE_VERSION_KEY = 'nearby:workshop_changes:version'
+CHANGE_ENTRY_KEY = 'nearby:workshop_changes:{}'
+CHANGE_ENTRY_TTL = 60 * 60
+
+# Cached nearby results. Each entry's key embeds the generation of every
+# invalidation cell its bounding box overlaps; a workshop change bumps the
+# generation of the cells it moved out of and into, so affected entries are
+# simply never read again and expire on their own.
+RESULT_KEY = 'nearby:results:{}'
+CELL_GENERATION_KEY = 'nearby:cell_generation:{}'
+CACHE_HITS_KEY = 'nearby:cache:hits'
+CACHE_MISSES_KEY = 'nearby:cache:misses'
+
+
+def _record_workshop_change(workshop_id, cells=()):
+    version = _incr(CHANGE_VERSION_KEY)
+    cache.set(CHANGE_ENTRY_KEY.format(version), workshop_id, timeout=CHANGE_ENTRY_TTL)
+
+    for cell in cells:
+        _incr(CELL_GENERATION_KEY.format(cell))
+    return version
+
+
+def record_workshop_change(workshop_id, locations=()):
+    """
+    Publish a workshop change once the surrounding transaction commits.
+
+    `locations` are the (latitude, longitude) pairs the workshop was visible
+    at before and after the change; cached results around them are dropped.
+    """
+    precision = settings.NEARBY_CACHE_CELL_PRECISION
+    cells = {
+        encode(lat, lon, precision)
+        for lat, lon in locations
+        if lat is not None and lon is not None
+    }
+
+    def send():
+        try:
+            _record_workshop_change(workshop_id, cells)
+        except Exception:
+            logger.exception(f"Failed to record nearby change for workshop_id {workshop_id}")
+
+    transaction.on_commit(send)
+
+
+def get_change_version():
+    return cache.get(CHANGE_VERSION_KEY, 0)
+
+
+def get_changes_since(version, current):
+    """
+    Workshop ids changed after `version` up to `current`, or None when part of
+    the log has already expired and the caller has to rebuild from scratch.
+    """
+    keys = [CHANGE_ENTRY_KEY.format(v) for v in range(version + 1, current + 1)]
+    if not keys:
+        return set()
+
+    entries = cache.get_many(keys)
+    if len(entries) != len(keys):
+        return None
+    return set(entries.values())
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # First increment; add() loses if another process got there first
+        if cache.add(key, 1, timeout=None):
+            return 1
+        return cache.incr(key)
+
+
+def quantize(value):
+    grid = settings.NEARBY_CACHE_GRID
+    return round(round(value / grid) * grid, 6)
+
+
+def _result_key(lat, lon, radius_km, limit):
+    from .utils import nearby_bounding_box
+
+    cells = sorted(cells_in_box(*nearby_bounding_box(lat, lon, radius_km), settings.NEARBY_CACHE_CELL_PRECISION))
+    generations = cache.get_many([CELL_GENERATION_KEY.format(cell) for cell in cells])
+    stamp = ','.join(
+        f"{cell}:{generations.get(CELL_GENERATION_KEY.format(cell), 0)}" for cell in cells
+    )
+    digest = hashlib.md5(f"{lat}:{lon}:{radius_km}:{limit}|{stamp}".encode()).hexdigest()
+    return RESULT_KEY.format(digest)
+
+
+def _serialized_nearby(user_lat, user_lon, radius_km, limit):
+    from .serializers import NearbyWorkshopSerializer
+    from .utils import get_k_nearest_workshops, get_nearby_workshops
+
+    if limit:
+        workshops = get_k_nearest_workshops(user_lat, user_lon, limit, radius_km)
+    else:
+        workshops = get_nearby_workshops(user_lat, user_lon, radius_km)
+    return list(NearbyWorkshopSerializer(workshops, many=True).data)
+
+
+def _grid_reach_km():
+    """Farthest any point of a grid square lies from the grid point it snaps to."""
+    from .utils import calculate_distance
+
+    half = settings.NEARBY_CACHE_GRID / 2
+    return calculate_distance(0, 0, half, half)
+
+
+def _cell_candidates(lat, lon, radius_km, limit):
+    """
+    Serialized workshops around the grid point (lat, lon) that hold the
+    results of every point snapping to it: everything within radius_km plus
+    the grid reach or, with `limit`, everything that can be among the `limit`
+    nearest of a point at most the reach away.
+    """
+    from .serializers import NearbyWorkshopSerializer
+    from .utils import get_k_nearest_workshops, get_nearby_workshops
+
+    reach = _grid_reach_km()
+    candidate_radius = radius_km + reach
+    if limit:
+        nearest = get_k_nearest_workshops(lat, lon, limit, radius_km)
+        if len(nearest) == limit:
+            # The point's own limit-th nearest is at most the reach further
+            # away, and it is at most the reach from here (plus rounding)
+            candidate_radius = min(candidate_radius, nearest[-1].distance + 2 * reach + 0.01)
+
+    return list(NearbyWorkshopSerializer(get_nearby_workshops(lat, lon, candidate_radius), many=True).data)
+
+
+def _exact_results(candidates, user_lat, user_lon, radius_km, limit):
+    """The candidates the uncached lookup for the exact point would return, in its order."""
+    from .utils import calculate_distance, nearby_bounding_box
+
+    min_lat, max_lat, min_lon, max_lon = nearby_bounding_box(user_lat, user_lon, radius_km)
+    results = []
+    for item in candidates:
+        if not (min_lat <= item['latitude'] <= max_lat and min_lon <= item['longitude'] <= max_lon):
+            continue
+        dist = calculate_distance(user_lat, user_lon, item['latitude'], item['longitude'])
+        if dist <= radius_km:
+            results.append(dict(item, distance=round(dist, 2)))
+
+    results.sort(key=lambda item: (item['distance'], item['id']))
+    return results[:limit] if limit else results
+
+
+def rank_nearby_workshops(nearby_workshops):
+    """
+    Re-order serialized nearby results by a weighted score of distance,
+    rating and current load (NEARBY_RANK_WEIGHTS), filling in each item's
+    `load` and `score`. Loads for the whole list come from one query.
+    """
+    from .utils import get_workshop_loads
+
+    if not nearby_workshops:
+        return nearby_workshops
+
+    weights = settings.NEARBY_RANK_WEIGHTS
+    loads = get_workshop_loads([item['id'] for item in nearby_workshops])
+    farthest = max(item['distance'] for item in nearby_workshops) or 1
+
+    for item in nearby_workshops:
+        load = loads.get(item['id'], 0)
+        item['load'] = load
+        item['score'] = round(
+            weights['distance'] * (1 - item['distance'] / farthest)
+            + weights['rating'] * float(item['rating_avg']) / 5
+            + weights['load'] / (1 + load),
+            4,
+        )
+
+    nearby_workshops.sort(key=lambda item: (-item['score'], item['distance'], item['id']))
+    return nearby_workshops
+
+
+def get_cached_nearby_workshops(user_lat, user_lon, radius_km=20, limit=None, sort='distance'):
+    """
+    Serialized NearbyWorkshopSerializer output for a point, served from the
+    cache when possible.
+
+    Coordinates are snapped to NEARBY_CACHE_GRID degrees, so every request
+    inside the same grid square shares one entry of candidates; distances
+    and the radius are then applied to the exact point, so results are the
+    same as without the cache. With `limit`, returns the `limit` nearest
+    workshops up to NEARBY_MAX_RADIUS_KM instead of everything in radius_km.
+    With sort='rank' the (cached) candidates are ranked against live load.
+    """
+    data = _cached_nearby(user_lat, user_lon, radius_km, limit)
+    if sort == 'rank':
+        return rank_nearby_workshops(data)
+    return data
+
+
+def _cached_nearby(user_lat, user_lon, radius_km, limit):
+    if limit:
+        radius_km = settings.NEARBY_MAX_RADIUS_KM
+    try:
+        user_lat, user_lon = float(user_lat), float(user_lon)
+    except (ValueError, TypeError):
+        return _serialized_nearby(user_lat, user_lon, radius_km, limit)
+
+    if settings.NEARBY_CACHE_TTL <= 0:
+        return _serialized_nearby(user_lat, user_lon, radius_km, limit)
+
+    lat, lon = quantize(user_lat), quantize(user_lon)
+    try:
+        # Invalidation has to cover every candidate, not just the results
+        key = _result_key(lat, lon, radius_km + _grid_reach_km(), limit)
+        candidates = cache.get(key)
+    except Exception:
+        logger.exception("Nearby cache unavailable, computing results directly")
+        return _serialized_nearby(user_lat, user_lon, radius_km, limit)
+
+    hit = candidates is not None
+    if not hit:
+        candidates = _cell_candidates(lat, lon, radius_km, limit)
+
+    # Stats and storing the entry are best effort; the candidates are already good
+    try:
+        _incr(CACHE_HITS_KEY if hit else CACHE_MISSES_KEY)
+        if not hit:
+            cache.set(key, candidates, timeout=settings.NEARBY_CACHE_TTL)
+    except Exception:
+        logger.exception("Failed to update the nearby cache")
+
+    return _exact_results(candidates, user_lat, user_lon, radius_km, limit)
+
+
+def get_cache_stats():
+    counters = cache.get_many([CACHE_HITS_KEY, CACHE_MISSES_KEY])
+    hits = counters.get(CACHE_HITS_KEY, 0)
+    misses = counters.get(CACHE_MISSES_KEY, 0)
+    total = hits + misses
+
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+        'grid_degrees': settings.NEARBY_CACHE_GRID,
+        'cell_precision': settings.NEARBY_CACHE_CELL_PRECISION,
+        'ttl_seconds': settings.NEARBY_CACHE_TTL,
+    }
+
+
+def reset_cache_stats():
+    cache.delete_many([CACHE_HITS_KEY, CACHE_MISSES_KEY])
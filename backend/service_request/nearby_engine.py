@@ -0,0 +1,214 @@
+"""
+In-memory nearby-workshop engine.
+
+Keeps every APPROVED workshop of this worker process in contiguous NumPy
+arrays and answers nearby queries with one vectorized haversine pass.
+Enabled with NEARBY_WORKSHOP_ENGINE=numpy; the snapshot is built lazily and
+caught up from the shared change log in service_request.nearby. NumPy is
+not in requirements.txt: install it on workers that enable the engine.
+"""
+import copy
+import threading
+import time
+import logging
+
+import numpy as np
+from django.conf import settings
+
+from accounts.models import Workshop
+from .nearby import get_change_version, get_changes_since
+from .utils import nearby_bounding_box
+
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371
+
+# Columns NearbyWorkshopSerializer needs, so results never touch the DB again
+SNAPSHOT_FIELDS = (
+    'id', 'workshop_name', 'city', 'rating_avg', 'latitude', 'longitude', 'address_line',
+)
+
+
+class _State:
+    """
+    Snapshot columns, one slot per workshop. A removed workshop leaves a hole
+    (NaN coordinates never fall inside a box) that the next insert reuses, so
+    applying a change only touches the slots of the workshops it names.
+    """
+    __slots__ = ('ids', 'lat', 'lon', 'ratings', 'workshops', 'slots', 'free', 'size')
+
+    COLUMNS = (('ids', -1), ('lat', np.nan), ('lon', np.nan), ('ratings', 0.0))
+
+    def __init__(self, workshops):
+        capacity = max(len(workshops), 16)
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.lat = np.full(capacity, np.nan)
+        self.lon = np.full(capacity, np.nan)
+        self.ratings = np.zeros(capacity)
+        self.workshops = [None] * capacity
+        # workshop id -> slot
+        self.slots = {}
+        self.free = []
+        self.size = 0
+
+        for ws in workshops:
+            self.put(ws)
+
+    def put(self, ws):
+        slot = self.slots.get(ws.id)
+        if slot is None:
+            slot = self.free.pop() if self.free else self._append()
+            self.slots[ws.id] = slot
+
+        self.ids[slot] = ws.id
+        self.lat[slot] = ws.latitude
+        self.lon[slot] = ws.longitude
+        self.ratings[slot] = float(ws.rating_avg)
+        self.workshops[slot] = ws
+
+    def remove(self, workshop_id):
+        slot = self.slots.pop(workshop_id, None)
+        if slot is None:
+            return
+
+        self.ids[slot] = -1
+        self.lat[slot] = self.lon[slot] = np.nan
+        self.workshops[slot] = None
+        self.free.append(slot)
+
+    def _append(self):
+        if self.size == len(self.ids):
+            capacity = len(self.ids) * 2
+            for name, fill in self.COLUMNS:
+                column = getattr(self, name)
+                grown = np.full(capacity, fill, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                setattr(self, name, grown)
+            self.workshops.extend([None] * (capacity - len(self.workshops)))
+
+        self.size += 1
+        return self.size - 1
+
+
+def _approved_workshops():
+    return Workshop.objects.filter(
+        verification_status='APPROVED',
+        latitude__isnull=False,
+        longitude__isnull=False,
+    ).only(*SNAPSHOT_FIELDS).order_by('pk')
+
+
+class WorkshopSnapshot:
+    """
+    Changes are applied in place, so lookups hold the lock while they scan
+    the columns. Workshop instances are replaced rather than modified, so
+    the ones a lookup picked stay valid after it releases the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        version = get_change_version()
+        self._state = _State(list(_approved_workshops()))
+        self._version = version
+        self._checked_at = time.monotonic()
+        logger.info(f"Nearby snapshot rebuilt with {len(self._state.slots)} workshops at version {version}")
+
+    def _apply_changes(self, workshop_ids):
+        fresh = {ws.id: ws for ws in _approved_workshops().filter(pk__in=workshop_ids)}
+        for workshop_id in workshop_ids:
+            if workshop_id in fresh:
+                self._state.put(fresh[workshop_id])
+            else:
+                # No longer approved or located
+                self._state.remove(workshop_id)
+
+    def sync(self):
+        interval = getattr(settings, 'NEARBY_ENGINE_SYNC_INTERVAL', 1.0)
+        if self._state is not None and time.monotonic() - self._checked_at < interval:
+            return
+
+        with self._lock:
+            # Another thread may have built or caught up the snapshot meanwhile
+            if self._state is None:
+                self._rebuild()
+                return
+            if time.monotonic() - self._checked_at < interval:
+                return
+
+            self._checked_at = time.monotonic()
+            current = get_change_version()
+            if current == self._version:
+                return
+
+            changed = get_changes_since(self._version, current) if current > self._version else None
+            if changed is None:
+                self._rebuild()
+                return
+            if changed:
+                self._apply_changes(changed)
+            self._version = current
+
+    def distances(self, user_lat, user_lon, radius_km):
+        """
+        (workshops, ids, distances_km) of workshops inside radius_km, using
+        the same bounding box pre-filter as the DB lookup so results match it.
+        """
+        self.sync()
+
+        min_lat, max_lat, min_lon, max_lon = nearby_bounding_box(user_lat, user_lon, radius_km)
+        with self._lock:
+            state = self._state
+            lat, lon = state.lat[:state.size], state.lon[:state.size]
+            in_box = np.flatnonzero(
+                (lat >= min_lat) & (lat <= max_lat)
+                & (lon >= min_lon) & (lon <= max_lon)
+            )
+
+            lat1 = np.radians(user_lat)
+            lat2 = np.radians(lat[in_box])
+            dlat = lat2 - lat1
+            dlon = np.radians(lon[in_box] - user_lon)
+            a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+            dist = EARTH_RADIUS_KM * 2 * np.arcsin(np.sqrt(a))
+
+            indices = in_box[dist <= radius_km]
+            return [state.workshops[i] for i in indices], state.ids[indices], dist[dist <= radius_km]
+
+    def _materialize(self, workshops, ids, dist):
+        order = np.lexsort((ids, np.round(dist, 2)))
+        results = []
+        for i in order:
+            ws = copy.copy(workshops[i])
+            ws.distance = round(float(dist[i]), 2)
+            results.append(ws)
+        return results
+
+    def nearby(self, user_lat, user_lon, radius_km):
+        return self._materialize(*self.distances(user_lat, user_lon, radius_km))
+
+    def k_nearest(self, user_lat, user_lon, k, max_radius_km):
+        workshops, ids, dist = self.distances(user_lat, user_lon, max_radius_km)
+
+        if len(ids) > k:
+            # Keep everything tied with the k-th rounded distance so the
+            # final (distance, id) ordering matches the database path.
+            rounded = np.round(dist, 2)
+            kth = np.partition(rounded, k - 1)[k - 1]
+            keep = rounded <= kth
+            workshops = [ws for ws, kept in zip(workshops, keep) if kept]
+            ids, dist = ids[keep], dist[keep]
+
+        return self._materialize(workshops, ids, dist)[:k]
+
+
+snapshot = WorkshopSnapshot()
@@ -0,0 +1,194 @@
+"""
+Transactional outbox relay.
+
+With REALTIME_DELIVERY = 'outbox', dispatch.enqueue writes OutboxEvent
+rows in the same transaction as the change they announce. run_outbox_relay
+streams them to the channel layer:
+
+- claim a batch of pending rows with a lease (FOR UPDATE SKIP LOCKED, so
+  several relays can run side by side);
+- merge their items per topic and build the messages with the same
+  builders the direct path uses, reading committed state;
+- send the batch concurrently and only then mark the rows delivered.
+
+A relay that dies mid-batch lets the lease expire and the rows are sent
+again, so delivery is at least once. Rows that keep failing stop being
+retried after OUTBOX_MAX_ATTEMPTS. Delivered rows are kept for
+OUTBOX_RETENTION_HOURS so they can be replayed, then pruned.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import dispatch
+from . import utils  # noqa: F401  registers the notification builders
+from .models import OutboxEvent
+
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'realtime_outbox'
+
+PRUNE_CHUNK_SIZE = 5000
+
+
+def claim_batch(batch_size, lease_seconds):
+    """Lease up to batch_size pending rows; returns [(id, topic, items)] in id order."""
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxEvent.objects.filter(
+                delivered_at__isnull=True,
+                attempts__lt=settings.OUTBOX_MAX_ATTEMPTS,
+            ).exclude(
+                claimed_until__gte=now,
+            ).order_by('pk').select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+
+        OutboxEvent.objects.filter(pk__in=ids).update(
+            claimed_until=now + timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1,
+        )
+
+    return list(OutboxEvent.objects.filter(pk__in=ids).order_by('pk').values_list('pk', 'topic', 'items'))
+
+
+def _hashable(item):
+    return tuple(item) if isinstance(item, list) else item
+
+
+def build_messages(rows):
+    batch = dispatch.NotificationBatch()
+    for _, topic, items in rows:
+        batch.add(topic, [_hashable(item) for item in items])
+    return batch.messages(raise_errors=True)
+
+
+def mark_delivered(ids):
+    OutboxEvent.objects.filter(pk__in=ids).update(delivered_at=timezone.now(), claimed_until=None)
+
+
+def prune(now=None):
+    """Delete delivered (and given-up) rows older than OUTBOX_RETENTION_HOURS."""
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+    expired = OutboxEvent.objects.filter(created_at__lt=cutoff).exclude(
+        delivered_at__isnull=True,
+        attempts__lt=settings.OUTBOX_MAX_ATTEMPTS,
+    )
+
+    deleted = 0
+    while True:
+        chunk = list(expired.values_list('pk', flat=True)[:PRUNE_CHUNK_SIZE])
+        if not chunk:
+            return deleted
+        deleted += OutboxEvent.objects.filter(pk__in=chunk).delete()[0]
+
+
+def replay(since):
+    """Queue every event created since `since` for delivery again."""
+    return OutboxEvent.objects.filter(created_at__gte=since).update(
+        delivered_at=None, claimed_until=None, attempts=0,
+    )
+
+
+async def _send_all(channel_layer, messages):
+    results = await asyncio.gather(
+        *(channel_layer.group_send(group, message) for group, message in messages),
+        return_exceptions=True,
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        raise failures[0]
+
+
+async def relay_once(channel_layer, batch_size, lease_seconds):
+    """Deliver one batch. Returns the number of rows delivered."""
+    rows = await database_sync_to_async(claim_batch)(batch_size, lease_seconds)
+    if not rows:
+        return 0
+
+    ids = [pk for pk, _, _ in rows]
+    try:
+        messages = await database_sync_to_async(build_messages)(rows)
+        await _send_all(channel_layer, messages)
+    except Exception:
+        logger.exception(f"Failed to deliver outbox rows {ids[0]}..{ids[-1]}, retrying after the lease expires")
+        return 0
+
+    await database_sync_to_async(mark_delivered)(ids)
+    logger.info(f"Delivered {len(ids)} outbox row(s) as {len(messages)} message(s)")
+    return len(ids)
+
+
+def _open_listener():
+    """
+    Dedicated connection LISTENing for commits that wrote outbox rows. Only
+    psycopg2 on PostgreSQL; returns None elsewhere and the relay just polls.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+
+    listener = connection.get_new_connection(connection.get_connection_params())
+    if not hasattr(listener, 'poll'):
+        listener.close()
+        return None
+
+    listener.autocommit = True
+    with listener.cursor() as cursor:
+        cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+    return listener
+
+
+async def run_relay(batch_size=None, poll_interval=None, lease_seconds=None, prune_interval=300, once=False):
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    poll_interval = poll_interval or settings.OUTBOX_POLL_INTERVAL
+    lease_seconds = lease_seconds or settings.OUTBOX_LEASE_SECONDS
+
+    channel_layer = get_channel_layer()
+    wakeup = asyncio.Event()
+    listener = None if once else await database_sync_to_async(_open_listener)()
+    if listener is not None:
+
+        def on_notify():
+            listener.poll()
+            listener.notifies.clear()
+            wakeup.set()
+
+        asyncio.get_running_loop().add_reader(listener.fileno(), on_notify)
+
+    last_prune = 0.0
+
+    try:
+        while True:
+            wakeup.clear()
+            delivered = await relay_once(channel_layer, batch_size, lease_seconds)
+
+            if time.monotonic() - last_prune >= prune_interval:
+                pruned = await database_sync_to_async(prune)()
+                if pruned:
+                    logger.info(f"Pruned {pruned} old outbox row(s)")
+                last_prune = time.monotonic()
+
+            if delivered:
+                continue
+            if once:
+                return
+
+            try:
+                await asyncio.wait_for(wakeup.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if listener is not None:
+            asyncio.get_running_loop().remove_reader(listener.fileno())
+            listener.close()
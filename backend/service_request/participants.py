@@ -0,0 +1,185 @@
+"""
+Who takes part in a service request: the owner, the workshops it is
+connected to and the mechanics assigned to it.
+
+get_participants answers that with one UNION query and caches the result
+per service request for PARTICIPANTS_CACHE_TTL. Every entry is stamped with
+the request's generation, a separate cache key that invalidate_participants
+replaces once the transaction commits (connection status changes, mechanic
+assignments); an entry from an older generation is a miss. The generation
+is read before the rows are loaded, so an entry written from rows read
+during an invalidation is already stale when it lands.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import CharField, F, Value
+from django.utils.connection import ConnectionProxy
+
+from accounts.models import Mechanic
+from .models import ServiceRequest, WorkshopConnection
+
+
+logger = logging.getLogger(__name__)
+
+# Invalidations have to reach every worker (CACHES['shared'])
+cache = ConnectionProxy(caches, 'shared')
+
+PARTICIPANTS_KEY = 'sr_participants:{}'
+GENERATION_KEY = 'sr_participants_gen:{}'
+
+# Generations are never reused, so letting one expire only costs misses
+GENERATION_TTL = 24 * 60 * 60
+
+OWNER = 'owner'
+MECHANIC = 'mechanic'
+
+# Connections that still give a workshop access to the request
+OPEN_CONNECTION_STATUSES = ('REQUESTED', 'ACCEPTED')
+
+
+class Participants:
+
+    def __init__(self, service_request_id, owner_id=None, workshop_user_ids=(),
+                 pending_workshop_user_ids=(), mechanic_user_ids=()):
+        self.service_request_id = service_request_id
+        self.owner_id = owner_id
+        # Workshops with an ACCEPTED connection
+        self.workshop_user_ids = frozenset(workshop_user_ids)
+        # Workshops whose connection request is still open
+        self.pending_workshop_user_ids = frozenset(pending_workshop_user_ids)
+        self.mechanic_user_ids = frozenset(mechanic_user_ids)
+
+    @property
+    def exists(self):
+        return self.owner_id is not None
+
+    @property
+    def is_connected(self):
+        return bool(self.workshop_user_ids)
+
+    @property
+    def user_ids(self):
+        """Everyone in the chat: owner, connected workshop and assigned mechanics."""
+        owner = {self.owner_id} if self.owner_id is not None else set()
+        return owner | self.workshop_user_ids | self.mechanic_user_ids
+
+    def is_owner(self, user):
+        return user.id == self.owner_id
+
+    def is_connected_workshop(self, user):
+        return user.id in self.workshop_user_ids
+
+    def is_assigned_mechanic(self, user):
+        return user.id in self.mechanic_user_ids
+
+    def can_chat(self, user):
+        """Owner of a connected request, the connected workshop or an assigned mechanic."""
+        if self.is_owner(user):
+            return self.is_connected
+        return self.is_connected_workshop(user) or self.is_assigned_mechanic(user)
+
+    def can_view(self, user):
+        """Any participant, including workshops whose connection request is still open."""
+        return (
+            self.is_owner(user)
+            or self.is_connected_workshop(user)
+            or user.id in self.pending_workshop_user_ids
+            or self.is_assigned_mechanic(user)
+        )
+
+    def to_cache(self):
+        return (
+            self.owner_id,
+            sorted(self.workshop_user_ids),
+            sorted(self.pending_workshop_user_ids),
+            sorted(self.mechanic_user_ids),
+        )
+
+
+def _rows(service_request_id):
+    """(kind, user_id) rows for the owner, open connections and assigned mechanics, in one query."""
+    owner = ServiceRequest.objects.filter(pk=service_request_id).annotate(
+        kind=Value(OWNER, output_field=CharField()),
+        member_id=F('user_id'),
+    ).values_list('kind', 'member_id')
+
+    workshops = WorkshopConnection.objects.filter(
+        service_request_id=service_request_id,
+        status__in=OPEN_CONNECTION_STATUSES,
+    ).annotate(
+        kind=F('status'),
+        member_id=F('workshop__user_id'),
+    ).values_list('kind', 'member_id')
+
+    mechanics = Mechanic.objects.filter(
+        assigned_executions__service_request_id=service_request_id,
+    ).annotate(
+        kind=Value(MECHANIC, output_field=CharField()),
+        member_id=F('user_id'),
+    ).values_list('kind', 'member_id')
+
+    return owner.union(workshops, mechanics, all=True)
+
+
+def load_participants(service_request_id):
+    owner_id = None
+    workshops, pending, mechanics = set(), set(), set()
+    for kind, user_id in _rows(service_request_id):
+        if kind == OWNER:
+            owner_id = user_id
+        elif kind == 'ACCEPTED':
+            workshops.add(user_id)
+        elif kind == MECHANIC:
+            mechanics.add(user_id)
+        else:
+            pending.add(user_id)
+    return Participants(service_request_id, owner_id, workshops, pending, mechanics)
+
+
+def get_participants(service_request_id):
+    generation_key = GENERATION_KEY.format(service_request_id)
+    key = PARTICIPANTS_KEY.format(service_request_id)
+    try:
+        cached = cache.get_many([generation_key, key])
+    except Exception:
+        logger.exception(f"Participant cache unavailable, resolving service request {service_request_id} directly")
+        return load_participants(service_request_id)
+
+    generation = cached.get(generation_key)
+    entry = cached.get(key)
+    if generation is not None and entry is not None and entry[0] == generation:
+        return Participants(service_request_id, *entry[1])
+
+    participants = load_participants(service_request_id)
+    if not participants.exists:
+        return participants
+
+    try:
+        if generation is None:
+            generation = time.time_ns()
+            if not cache.add(generation_key, generation, timeout=GENERATION_TTL):
+                # Someone else started (or invalidated) a generation meanwhile
+                return participants
+        cache.set(key, (generation, participants.to_cache()), timeout=settings.PARTICIPANTS_CACHE_TTL)
+    except Exception:
+        logger.exception(f"Failed to cache participants of service request {service_request_id}")
+    return participants
+
+
+def invalidate_participants(service_request_ids):
+    """Drop the cached participants of these service requests once the transaction commits."""
+    keys = [GENERATION_KEY.format(pk) for pk in set(service_request_ids)]
+    if not keys:
+        return
+
+    def bump():
+        try:
+            cache.set_many(dict.fromkeys(keys, time.time_ns()), timeout=GENERATION_TTL)
+        except Exception:
+            logger.exception(f"Failed to invalidate participants of {len(keys)} service request(s)")
+
+    transaction.on_commit(bump)
@@ -0,0 +1,216 @@
+"""
+Redis delay queue for service request deadlines.
+
+Every pending deadline is one member "<kind>:<id>" of a sorted set scored by
+its due time (epoch seconds). Registering or moving a deadline is a single
+O(log n) ZADD, and the worker (run_deadline_scheduler) only ever reads
+events that are already due instead of polling the tables.
+
+The database stays authoritative: handlers re-check every row before acting,
+so stale or duplicated events are harmless, and process_expirations remains
+the safety net for anything Redis lost.
+"""
+import logging
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+DUE_KEY = 'deadlines:due'
+
+SERVICE_REQUEST = 'service_request'
+CONNECTION = 'connection'
+ESTIMATE = 'estimate'
+
+_client = None
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.DEADLINE_SCHEDULER_REDIS_URL)
+    return _client
+
+
+def use_redis(client):
+    """Point the scheduler at another client, e.g. fakeredis.FakeRedis() in tests."""
+    global _client
+    _client = client
+
+
+def schedule_many(kind, deadlines):
+    """Register or move deadlines given as (object id, due datetime) pairs."""
+    mapping = {f"{kind}:{obj_id}": due_at.timestamp() for obj_id, due_at in deadlines if due_at is not None}
+    if mapping:
+        get_redis().zadd(DUE_KEY, mapping)
+    return len(mapping)
+
+
+def schedule_deadline(kind, obj_id, due_at):
+    """
+    Register a deadline once the current transaction commits. Redis errors are
+    logged, not raised: the periodic sweep still picks the row up.
+    """
+
+    def register():
+        try:
+            schedule_many(kind, [(obj_id, due_at)])
+        except redis.RedisError:
+            logger.exception(f"Failed to schedule {kind} deadline for id {obj_id}")
+
+    transaction.on_commit(register)
+
+
+def claim_due(now=None, batch_size=None):
+    """
+    Take up to batch_size due events off the queue and return them as
+    {kind: [ids]}. ZREM decides ownership, so concurrent workers never
+    handle the same event twice.
+    """
+    batch_size = batch_size or settings.DEADLINE_SCHEDULER_BATCH_SIZE
+    client = get_redis()
+
+    members = client.zrangebyscore(DUE_KEY, '-inf', (now or timezone.now()).timestamp(), start=0, num=batch_size)
+    if not members:
+        return {}
+
+    pipe = client.pipeline(transaction=False)
+    for member in members:
+        pipe.zrem(DUE_KEY, member)
+
+    claimed = {}
+    for member, removed in zip(members, pipe.execute()):
+        if not removed:
+            continue
+        kind, _, obj_id = member.decode().partition(':')
+        claimed.setdefault(kind, []).append(int(obj_id))
+    return claimed
+
+
+def next_due_in(now=None):
+    """Seconds until the earliest event is due, or None when the queue is empty."""
+    first = get_redis().zrange(DUE_KEY, 0, 0, withscores=True)
+    if not first:
+        return None
+    return max(0.0, first[0][1] - (now or timezone.now()).timestamp())
+
+
+def pending_count():
+    return get_redis().zcard(DUE_KEY)
+
+
+def _expire_connections(ids):
+    from .expiration import expire_connections
+
+    # The auto-reject UPDATE waits for row locks instead of skipping them
+    expire_connections(ids)
+    return []
+
+
+def _expire_requests(ids):
+    from .expiration import expire_requests
+
+    return expire_requests(ids)[1]
+
+
+def _expire_estimates(ids):
+    from .expiration import expire_estimates
+
+    return expire_estimates(ids)[1]
+
+
+def _handlers():
+    """kind -> handler(ids) returning the due ids it skipped because another transaction held their lock."""
+    return {
+        SERVICE_REQUEST: _expire_requests,
+        CONNECTION: _expire_connections,
+        ESTIMATE: _expire_estimates,
+    }
+
+
+def dispatch(claimed):
+    """
+    Apply the transition of every claimed event. A failing batch is put back
+    on the queue DEADLINE_SCHEDULER_RETRY_SECONDS later, due rows another
+    transaction had locked DEADLINE_SCHEDULER_LOCKED_RETRY_SECONDS later.
+    """
+    handlers = _handlers()
+    handled = 0
+
+    for kind, ids in claimed.items():
+        handler = handlers.get(kind)
+        if handler is None:
+            logger.warning(f"Dropping {len(ids)} deadline event(s) of unknown kind '{kind}'")
+            continue
+
+        try:
+            locked = handler(ids)
+        except Exception:
+            logger.exception(f"Failed to apply {len(ids)} {kind} deadline(s), retrying later")
+            retry_at = timezone.now() + timedelta(seconds=settings.DEADLINE_SCHEDULER_RETRY_SECONDS)
+            schedule_many(kind, [(obj_id, retry_at) for obj_id in ids])
+            continue
+
+        if locked:
+            logger.info(f"{len(locked)} {kind} deadline(s) locked by another transaction, retrying shortly")
+            retry_at = timezone.now() + timedelta(seconds=settings.DEADLINE_SCHEDULER_LOCKED_RETRY_SECONDS)
+            schedule_many(kind, [(obj_id, retry_at) for obj_id in locked])
+
+        handled += len(ids) - len(locked)
+
+    return handled
+
+
+def run_due(now=None, batch_size=None):
+    """Claim and apply due events batch by batch until none are left."""
+    handled = 0
+    while True:
+        claimed = claim_due(now, batch_size)
+        if not claimed:
+            return handled
+        handled += dispatch(claimed)
+
+
+def backfill():
+    """
+    Register every pending deadline currently in the database, e.g. when the
+    worker starts or after Redis lost its data.
+    """
+    from .expiration import CONNECTION_RESPONSE_WINDOW, TERMINAL_STATUSES
+    from .models import Estimate, ServiceRequest, WorkshopConnection
+
+    sources = [
+        (
+            SERVICE_REQUEST,
+            ServiceRequest.objects.filter(expires_at__isnull=False)
+            .exclude(status__in=TERMINAL_STATUSES)
+            .values_list('pk', 'expires_at').iterator(),
+        ),
+        (
+            CONNECTION,
+            ((pk, requested_at + CONNECTION_RESPONSE_WINDOW) for pk, requested_at in
+             WorkshopConnection.objects.filter(status='REQUESTED').values_list('pk', 'requested_at').iterator()),
+        ),
+        (
+            ESTIMATE,
+            Estimate.objects.filter(status='SENT', expires_at__isnull=False).values_list('pk', 'expires_at').iterator(),
+        ),
+    ]
+
+    total = 0
+    batch_size = settings.DEADLINE_SCHEDULER_BATCH_SIZE
+    for kind, rows in sources:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                total += schedule_many(kind, batch)
+                batch = []
+        total += schedule_many(kind, batch)
+
+    return total
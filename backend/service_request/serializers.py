@@ -1,5 +1,7 @@
 from rest_framework import serializers
-from .models import ServiceRequest, WorkshopConnection, Estimate, EstimateLineItem
+from django.db.models import Prefetch
+from .expiration import is_connection_overdue, is_effectively_expired
+from .models import ServiceRequest, WorkshopConnection, Estimate, EstimateLineItem, ServiceFlowVersion
 from accounts.models import Workshop
 from admin_panel.models import Complaint
 
@@ -35,6 +37,11 @@ class ServiceExecutionSerializer(serializers.ModelSerializer):
              }
         return None
 
+def _connection_status(connection):
+    # Unanswered requests read as AUTO_REJECTED before the sweep gets to them
+    return 'AUTO_REJECTED' if is_connection_overdue(connection) else connection.status
+
+
 class ServiceRequestSerializer(serializers.ModelSerializer):
     images = serializers.ListField(
         child=serializers.ImageField(),
@@ -55,8 +62,39 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
     latest_connection = serializers.SerializerMethodField()
     execution = serializers.SerializerMethodField()
 
+    INACTIVE_CONNECTION_STATUSES = ['REJECTED', 'AUTO_REJECTED', 'CANCELLED', 'WITHDRAWN']
+
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """
+        Load everything the serializer reads (connections with their workshop,
+        execution with lead technician and mechanics) for the whole queryset
+        in a constant number of queries. `prefix` is the lookup path to the
+        service request when it is nested, e.g. 'service_request__'.
+        """
+        return queryset.select_related(
+            f'{prefix}execution__assigned_to',
+        ).prefetch_related(
+            Prefetch(
+                f'{prefix}connections',
+                queryset=WorkshopConnection.objects.select_related('workshop').order_by('-requested_at', '-pk'),
+                to_attr='prefetched_connections',
+            ),
+            Prefetch(
+                f'{prefix}execution__mechanics',
+                queryset=Mechanic.objects.select_related('user'),
+            ),
+        )
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Overdue requests read as EXPIRED before the expiration sweep gets to them
+        if 'status' in data and is_effectively_expired(instance):
+            data['status'] = 'EXPIRED'
+        return data
+
     def get_execution(self, obj):
-        if obj.status in ['CREATED', 'PLATFORM_FEE_PAID', 'CONNECTING', 'EXPIRED', 'CANCELLED']:
+        if obj.status in ['CREATED', 'PLATFORM_FEE_PAID', 'CONNECTING', 'EXPIRED', 'CANCELLED'] or is_effectively_expired(obj):
              return None
         try:
             return ServiceExecutionSerializer(obj.execution).data
@@ -64,23 +102,36 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
             return None
 
     def get_latest_connection(self, obj):
-        connection = WorkshopConnection.objects.filter(service_request=obj).order_by('-requested_at').first()
+        connections = getattr(obj, 'prefetched_connections', None)
+        if connections is not None:
+            connection = connections[0] if connections else None
+        else:
+            connection = WorkshopConnection.objects.filter(service_request=obj).select_related('workshop').order_by('-requested_at').first()
         if connection:
             return {
                 "id": connection.id,
                 "workshop_id": connection.workshop.id,
                 "workshop_name": connection.workshop.workshop_name,
-                "status": connection.status,
+                "status": _connection_status(connection),
                 "requested_at": connection.requested_at,
                 "address": f"{connection.workshop.address_line}, {connection.workshop.city}",
             }
         return None
 
+    def _active_connection(self, obj):
+        connections = getattr(obj, 'prefetched_connections', None)
+        if connections is None:
+            connections = WorkshopConnection.objects.filter(
+                service_request=obj
+            ).exclude(status__in=self.INACTIVE_CONNECTION_STATUSES).select_related('workshop').order_by('pk')
+        return min(
+            (c for c in connections if _connection_status(c) not in self.INACTIVE_CONNECTION_STATUSES),
+            key=lambda c: c.pk,
+            default=None,
+        )
+
     def get_active_connection(self, obj):
-        active_connection = WorkshopConnection.objects.filter(
-            service_request=obj
-        ).exclude(status__in=['REJECTED', 'AUTO_REJECTED', 'CANCELLED', 'WITHDRAWN']).first()
-        
+        active_connection = self._active_connection(obj)
         if active_connection:
             return {
                 "id": active_connection.id,
@@ -153,12 +204,81 @@ class ServiceRequestSerializer(serializers.ModelSerializer):
         validated_data['image_urls'] = image_urls
         return super().create(validated_data)
 
+class ServiceFlowSerializer(ServiceRequestSerializer):
+    """
+    The service flow page's view of a request: the request plus a summary of
+    the active connection's latest estimate and the flow version the state
+    was read at (see ServiceFlowVersion).
+    """
+    estimate = serializers.SerializerMethodField()
+    flow_version = serializers.SerializerMethodField()
+
+    class Meta(ServiceRequestSerializer.Meta):
+        fields = ServiceRequestSerializer.Meta.fields + ['estimate', 'flow_version']
+        read_only_fields = ServiceRequestSerializer.Meta.read_only_fields + ['estimate', 'flow_version']
+
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        return ServiceRequestSerializer.setup_eager_loading(queryset, prefix).select_related(
+            f'{prefix}flow_version',
+        ).prefetch_related(
+            Prefetch(
+                f'{prefix}estimates',
+                queryset=Estimate.objects.order_by('-created_at', '-pk'),
+                to_attr='prefetched_estimates',
+            ),
+        )
+
+    def get_estimate(self, obj):
+        active_connection = self._active_connection(obj)
+        if not active_connection:
+            return None
+
+        estimates = getattr(obj, 'prefetched_estimates', None)
+        if estimates is not None:
+            estimate = next((e for e in estimates if e.workshop_connection_id == active_connection.id), None)
+        else:
+            estimate = Estimate.objects.filter(workshop_connection=active_connection).order_by('-created_at', '-pk').first()
+
+        if estimate:
+            return {
+                "id": estimate.id,
+                "status": estimate.status,
+                "total_amount": estimate.total_amount,
+                "expires_at": estimate.expires_at,
+                "sent_at": estimate.sent_at,
+            }
+        return None
+
+    def get_flow_version(self, obj):
+        try:
+            return obj.flow_version.version
+        except ServiceFlowVersion.DoesNotExist:
+            return 0
+
+
+class ServiceFlowStateSerializer(ServiceFlowSerializer):
+    """The fields a service_flow.update carries, applied over the client's ServiceFlowSerializer data."""
+
+    class Meta(ServiceFlowSerializer.Meta):
+        fields = ['id', 'status', 'platform_fee_paid', 'active_connection', 'latest_connection', 'execution', 'estimate']
+
+
 class NearbyWorkshopSerializer(serializers.ModelSerializer):
     distance = serializers.FloatField(read_only = True)
+    # Only filled in when results are ranked (?sort=rank)
+    load = serializers.SerializerMethodField()
+    score = serializers.SerializerMethodField()
 
     class Meta:
         model = Workshop
-        fields = ['id', 'workshop_name', 'city', 'rating_avg', 'latitude', 'longitude', 'distance', 'address_line']
+        fields = ['id', 'workshop_name', 'city', 'rating_avg', 'latitude', 'longitude', 'distance', 'address_line', 'load', 'score']
+
+    def get_load(self, obj):
+        return getattr(obj, 'load', None)
+
+    def get_score(self, obj):
+        return getattr(obj, 'score', None)
 
 
 class WorkshopConnectionSerializer(serializers.ModelSerializer):
@@ -174,6 +294,11 @@ class WorkshopConnectionSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'requested_at', 'responded_at']
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['status'] = _connection_status(instance)
+        return data
+
 
 class EstimateLineItemSerializer(serializers.ModelSerializer):
     class Meta:
@@ -1,3 +1,984 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.geohash import _cell_size
+from accounts.models import User, Workshop, Mechanic
+from chat.models import ChatMessage, ChatMessageRecipient
+from payments.models import Payment, Wallet, WalletTransaction
+from payments.utils import check_and_process_refund
+from . import dispatch, expiration, nearby, outbox, participants as participants_module, scheduler, utils
+from .counters import get_counter, mechanics_changed, reconcile_counters
+from .models import ServiceRequest, WorkshopConnection, ServiceExecution, Estimate, NotificationCounter, OutboxEvent
+from .participants import get_participants, invalidate_participants
+from .utils import (
+    get_nearby_workshops, notify_service_flow_update, notify_service_flow_updates, push_connection_count_to_workshop,
+)
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared'},
+}
+
+
+def _flow_events(messages):
+    """(group, event, version) for service_flow.update messages, other messages as they are."""
+    events = []
+    for group, message in messages:
+        if message['type'] == 'service_flow.update':
+            frame = json.loads(message['frame'])
+            events.append((group, frame['event'], frame['version']))
+        else:
+            events.append((group, message))
+    return events
+
+
+def _service_request(owner, **fields):
+    return ServiceRequest.objects.create(
+        user=owner, vehicle_type='Bike', vehicle_model='Model', issue_category='Engine',
+        description='Engine makes a noise when starting', user_latitude=12.9, user_longitude=77.5, **fields,
+    )
+
+
+class ServiceRequestListQueryCountTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+        self.mechanic_user = User.objects.create_user('mechanic@example.com', 'Mechanic', 'pass1234', role='mechanic')
+        self.created = 0
+
+    def _create_requests(self, count):
+        for _ in range(count):
+            self.created += 1
+            n = self.created
+
+            workshop_admin = User.objects.create_user(f'workshop{n}@example.com', f'Workshop {n}', 'pass1234', role='workshop_admin')
+            workshop = Workshop.objects.create(
+                user=workshop_admin, workshop_name=f'Workshop {n}', address_line='Street', city='City',
+                state='State', pincode='000000', latitude=12.9, longitude=77.5, verification_status='APPROVED',
+            )
+            helper = Mechanic.objects.create(
+                user=User.objects.create_user(f'helper{n}@example.com', f'Helper {n}', 'pass1234', role='mechanic'),
+                workshop=workshop,
+            )
+            mechanic, _ = Mechanic.objects.get_or_create(user=self.mechanic_user, defaults={'workshop': workshop})
+
+            service_request = ServiceRequest.objects.create(
+                user=self.owner, vehicle_type='Bike', vehicle_model='Model', issue_category='Engine',
+                description='Engine makes a noise when starting', user_latitude=12.9, user_longitude=77.5,
+                status='IN_PROGRESS',
+            )
+            WorkshopConnection.objects.create(service_request=service_request, workshop=workshop, status='REJECTED')
+            WorkshopConnection.objects.create(service_request=service_request, workshop=workshop, status='ACCEPTED')
+            execution = ServiceExecution.objects.create(
+                service_request=service_request, workshop=workshop, assigned_to=workshop_admin,
+            )
+            execution.mechanics.add(mechanic, helper)
+
+    def _assert_constant_queries(self, user, url):
+        self.client.force_authenticate(user)
+
+        self._create_requests(2)
+        with CaptureQueriesContext(connection) as small_page:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 2)
+
+        self._create_requests(8)
+        with self.assertNumQueries(len(small_page.captured_queries)):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 10)
+        return response
+
+    def test_user_request_list_query_count_is_constant(self):
+        response = self._assert_constant_queries(self.owner, '/api/service-request/user-requests/')
+
+        item = response.data[0]
+        self.assertEqual(item['active_connection']['status'], 'ACCEPTED')
+        self.assertEqual(item['latest_connection']['status'], 'ACCEPTED')
+        self.assertEqual(len(item['execution']['mechanics']), 2)
+        self.assertIsNotNone(item['execution']['lead_technician'])
+
+    def test_mechanic_assigned_services_query_count_is_constant(self):
+        self._assert_constant_queries(self.mechanic_user, '/api/service-request/mechanic/assigned-services/')
+
+
+class NearbySpatialIndexTests(TestCase):
+
+    def setUp(self):
+        self.created = 0
+
+    def _workshop(self, lat, lon):
+        self.created += 1
+        n = self.created
+        return Workshop.objects.create(
+            user=User.objects.create_user(f'workshop{n}@example.com', f'Workshop {n}', 'pass1234', role='workshop_admin'),
+            workshop_name=f'Workshop {n}', address_line='Street', city='City', state='State', pincode='000000',
+            latitude=lat, longitude=lon, verification_status='APPROVED',
+        )
+
+    def _assert_same_as_bounding_box(self, points, radii=(0.5, 1, 5, 20, 100)):
+        for lat, lon in points:
+            for radius in radii:
+                with self.subTest(lat=lat, lon=lon, radius=radius):
+                    expected = get_nearby_workshops(lat, lon, radius, use_spatial_index=False)
+                    actual = get_nearby_workshops(lat, lon, radius, use_spatial_index=True)
+                    self.assertEqual(
+                        [(ws.pk, ws.distance) for ws in actual],
+                        [(ws.pk, ws.distance) for ws in expected],
+                    )
+
+    def test_cell_edges(self):
+        # Workshops on, just below and just above cell boundaries of every
+        # precision the covering can pick
+        for precision in (4, 5, 6):
+            lat_height, lon_width = _cell_size(precision)
+            lat_edge = -90.0 + round((12.9 + 90.0) / lat_height) * lat_height
+            lon_edge = -180.0 + round((77.5 + 180.0) / lon_width) * lon_width
+            for offset in (-1e-9, 0.0, 1e-9):
+                self._workshop(lat_edge + offset, 77.5)
+                self._workshop(12.9, lon_edge + offset)
+                self._workshop(lat_edge + offset, lon_edge + offset)
+
+        self._assert_same_as_bounding_box([(12.9, 77.5), (12.93, 77.46), (12.88, 77.53)])
+        self.assertTrue(get_nearby_workshops(12.9, 77.5, 5))
+
+    def test_antimeridian_and_poles(self):
+        for lat, lon in ((0.0, 179.999), (0.0, -179.999), (0.0, 180.0), (0.0, -180.0),
+                         (89.95, 0.0), (89.99, 120.0), (90.0, -45.0), (-89.95, 10.0), (-90.0, 0.0)):
+            self._workshop(lat, lon)
+
+        self._assert_same_as_bounding_box([
+            (0.0, 179.99), (0.0, -179.99), (0.0, 180.0),
+            (89.9, 0.0), (89.99, -170.0), (-89.9, 5.0), (90.0, 0.0),
+        ])
+
+    def test_rows_without_a_geohash_are_kept(self):
+        workshop = self._workshop(12.9, 77.5)
+        self._workshop(12.91, 77.51)
+        # Rows saved before the backfill
+        Workshop.objects.filter(pk=workshop.pk).update(geohash=None)
+
+        self._assert_same_as_bounding_box([(12.9, 77.5)])
+        self.assertIn(workshop.pk, [ws.pk for ws in get_nearby_workshops(12.9, 77.5, 5)])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, NEARBY_CACHE_TTL=300, NEARBY_CACHE_GRID=0.005)
+class NearbyCacheTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.created = 0
+        # Snaps to (12.9, 77.5)
+        self.point = (12.9012, 77.5021)
+
+    def _workshop(self, lat, lon):
+        self.created += 1
+        n = self.created
+        return Workshop.objects.create(
+            user=User.objects.create_user(f'workshop{n}@example.com', f'Workshop {n}', 'pass1234', role='workshop_admin'),
+            workshop_name=f'Workshop {n}', address_line='Street', city='City', state='State', pincode='000000',
+            latitude=lat, longitude=lon, verification_status='APPROVED',
+        )
+
+    def _assert_cached_matches_uncached(self, points, **kwargs):
+        for lat, lon in points:
+            with self.subTest(lat=lat, lon=lon, **kwargs):
+                expected = nearby._serialized_nearby(
+                    lat, lon, settings.NEARBY_MAX_RADIUS_KM if kwargs.get('limit') else kwargs.get('radius_km', 20),
+                    kwargs.get('limit'),
+                )
+                self.assertEqual(nearby.get_cached_nearby_workshops(lat, lon, **kwargs), expected)
+
+    def test_results_are_those_of_the_exact_point(self):
+        lat, lon = self.point
+        # Inside 20 km of the point, but not of the grid point it snaps to
+        self._workshop(lat + 19.99 / 111.19, lon)
+        # The other way round
+        self._workshop(12.9 - 19.995 / 111.19, 77.5)
+        for n in range(10):
+            self._workshop(12.9 + (n - 5) / 100, 77.5 + (n % 3) / 100)
+
+        points = [self.point, (12.9024, 77.4976), (12.8976, 77.5024), (12.9, 77.5)]
+        self._assert_cached_matches_uncached(points)
+        self._assert_cached_matches_uncached(points, limit=3)
+        self._assert_cached_matches_uncached(points, radius_km=5)
+
+        # One entry per grid point and query, the rest were hits
+        stats = nearby.get_cache_stats()
+        self.assertEqual(stats['misses'], 3)
+        self.assertEqual(stats['hits'], 9)
+
+    def test_cache_failures_fall_back_to_the_database(self):
+        self._workshop(12.91, 77.51)
+        expected = nearby._serialized_nearby(*self.point, 20, None)
+
+        for method in ('get', 'incr', 'set'):
+            with self.subTest(method=method), mock.patch.object(
+                type(caches['shared']), method, side_effect=ConnectionError('cache down'),
+            ):
+                caches['shared'].clear()
+                self.assertEqual(nearby.get_cached_nearby_workshops(*self.point), expected)
+
+    def test_hits_and_misses_take_one_round_trip(self):
+        lat, lon = self.point
+        # The first miss and hit create the counters
+        nearby.get_cached_nearby_workshops(lat, lon)
+        nearby.get_cached_nearby_workshops(lat, lon)
+        with mock.patch.object(type(caches['shared']), 'add', wraps=caches['shared'].add) as add:
+            nearby.get_cached_nearby_workshops(lat, lon)
+            nearby.get_cached_nearby_workshops(lat + 0.01, lon)
+        add.assert_not_called()
+        stats = nearby.get_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 2))
+
+
+@skipUnless(numpy, 'numpy is not installed')
+@override_settings(CACHES=LOCMEM_CACHES, NEARBY_ENGINE_SYNC_INTERVAL=0)
+class NearbyEngineTests(TestCase):
+
+    def setUp(self):
+        from .nearby_engine import WorkshopSnapshot
+
+        caches['shared'].clear()
+        self.engine = WorkshopSnapshot()
+        self.created = 0
+
+    def _workshop(self, lat, lon, **fields):
+        self.created += 1
+        n = self.created
+        with self.captureOnCommitCallbacks(execute=True):
+            return Workshop.objects.create(
+                user=User.objects.create_user(f'workshop{n}@example.com', f'Workshop {n}', 'pass1234', role='workshop_admin'),
+                workshop_name=f'Workshop {n}', address_line='Street', city='City', state='State', pincode='000000',
+                latitude=lat, longitude=lon, verification_status=fields.pop('verification_status', 'APPROVED'), **fields,
+            )
+
+    def _assert_matches_database(self):
+        for radius in (1, 5, 50):
+            with self.subTest(radius=radius):
+                self.assertEqual(
+                    [(ws.pk, ws.distance) for ws in self.engine.nearby(12.9, 77.5, radius)],
+                    [(ws.pk, ws.distance) for ws in get_nearby_workshops(12.9, 77.5, radius)],
+                )
+
+    def test_changes_are_patched_in_place(self):
+        moved = self._workshop(12.9, 77.5)
+        revoked = self._workshop(12.91, 77.51)
+        self._workshop(13.2, 77.8)
+        self._assert_matches_database()
+
+        state = self.engine._state
+        with mock.patch.object(self.engine, '_rebuild', side_effect=AssertionError('rebuilt')):
+            with self.captureOnCommitCallbacks(execute=True):
+                moved.latitude = 12.95
+                moved.save()
+                revoked.verification_status = 'REJECTED'
+                revoked.save()
+            self._assert_matches_database()
+
+            # Enough new rows to grow the columns, one of them in the freed slot
+            for n in range(20):
+                self._workshop(12.9 + n / 1000, 77.5)
+            self._assert_matches_database()
+
+        self.assertIs(self.engine._state, state)
+        self.assertEqual(len(state.slots), 22)
+        self.assertEqual(state.size, 22)
+
+    def test_concurrent_first_lookups_build_once(self):
+        builds = []
+
+        def rebuild():
+            builds.append(1)
+            time.sleep(0.05)
+            self.engine._state = object()
+            self.engine._checked_at = time.monotonic()
+
+        with mock.patch.object(self.engine, '_rebuild', side_effect=rebuild), \
+                self.settings(NEARBY_ENGINE_SYNC_INTERVAL=60):
+            threads = [threading.Thread(target=self.engine.sync) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(builds), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ExpirationTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser('admin@example.com', 'Admin', 'pass1234')
+        self.owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+        self.other_owner = User.objects.create_user('other@example.com', 'Other', 'pass1234')
+        self.workshop_admin = User.objects.create_user('workshop@example.com', 'Workshop', 'pass1234', role='workshop_admin')
+        self.workshop = Workshop.objects.create(
+            user=self.workshop_admin, workshop_name='Workshop', address_line='Street', city='City',
+            state='State', pincode='000000', latitude=12.9, longitude=77.5, verification_status='APPROVED',
+        )
+        self.mechanics = [
+            Mechanic.objects.create(
+                user=User.objects.create_user(f'mechanic{n}@example.com', f'Mechanic {n}', 'pass1234', role='mechanic'),
+                workshop=self.workshop, availability='BUSY',
+            )
+            for n in range(2)
+        ]
+        self.payments = 0
+
+    def _overdue(self, owner, status='PLATFORM_FEE_PAID', fees=(), connection=None):
+        service_request = _service_request(owner, status=status, platform_fee_paid=bool(fees))
+        ServiceRequest.objects.filter(pk=service_request.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        for amount, payment_status in fees:
+            self.payments += 1
+            Payment.objects.create(
+                user=owner, service_request=service_request, amount=amount, payment_type='PLATFORM_FEE',
+                status=payment_status, is_refunded=payment_status == 'REFUNDED',
+                stripe_checkout_id=f'checkout-{self.payments}',
+            )
+        if connection:
+            WorkshopConnection.objects.create(service_request=service_request, workshop=self.workshop, status=connection)
+        return service_request
+
+    def _seed(self):
+        self._overdue(self.owner, fees=[('49.00', 'COMPLETED')])
+        # Only the first completed payment is refunded
+        self._overdue(self.owner, fees=[('30.00', 'COMPLETED'), ('10.00', 'COMPLETED')])
+        self._overdue(self.other_owner, fees=[('49.00', 'COMPLETED')], connection='CANCELLED')
+        self._overdue(self.other_owner, fees=[('49.00', 'REFUNDED')])
+        self._overdue(self.other_owner, status='CREATED')
+
+        connected = self._overdue(self.other_owner, status='CONNECTED', fees=[('49.00', 'COMPLETED')], connection='ACCEPTED')
+        execution = ServiceExecution.objects.create(
+            service_request=connected, workshop=self.workshop, assigned_to=self.workshop_admin,
+        )
+        execution.mechanics.add(*self.mechanics)
+        message = ChatMessage.objects.create(service_request=connected, sender=self.workshop_admin, content='On my way')
+        ChatMessageRecipient.objects.create(message=message, user=self.other_owner)
+
+        self.pending = _service_request(self.owner, status='PLATFORM_FEE_PAID', platform_fee_paid=True)
+        return connected
+
+    def _ledger(self):
+        return (
+            dict(Wallet.objects.values_list('user__email', 'balance')),
+            sorted(WalletTransaction.objects.values_list('wallet__user__email', 'amount', 'transaction_type', 'description')),
+            list(Payment.objects.order_by('pk').values_list('pk', 'status', 'is_refunded', 'refund_txn_id')),
+        )
+
+    def test_refunds_match_the_per_request_path(self):
+        self._seed()
+
+        with transaction.atomic():
+            for service_request in expiration.overdue_requests():
+                check_and_process_refund(service_request)
+            expected = self._ledger()
+            transaction.set_rollback(True)
+        self.assertEqual(expected[0][self.owner.email], Decimal('79.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expiration.expire_due_requests(chunk_size=2), 6)
+        self.assertEqual(self._ledger(), expected)
+
+    def test_side_effects_are_applied_chunk_by_chunk(self):
+        connected = self._seed()
+
+        with mock.patch.object(expiration, '_expire_locked', wraps=expiration._expire_locked) as expire_locked:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(expiration.expire_due_requests(chunk_size=2, limit=3), 3)
+            self.assertEqual([len(call.args[0]) for call in expire_locked.call_args_list], [2, 1])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(expiration.expire_due_requests(chunk_size=2), 3)
+            self.assertEqual([len(call.args[0]) for call in expire_locked.call_args_list], [2, 1, 2, 1])
+
+        self.assertEqual(
+            set(ServiceRequest.objects.exclude(status='EXPIRED').values_list('pk', flat=True)), {self.pending.pk},
+        )
+        self.assertEqual(set(Mechanic.objects.values_list('availability', flat=True)), {'AVAILABLE'})
+        self.assertFalse(ChatMessageRecipient.objects.filter(message__service_request=connected, is_read=False).exists())
+        self.assertFalse(ServiceExecution.objects.filter(service_request=connected).exists())
+        self.assertEqual(expiration.expire_due_requests(), 0)
+
+    def test_reads_do_not_write(self):
+        service_request = self._overdue(self.owner, status='CONNECTING', fees=[('49.00', 'COMPLETED')], connection='REQUESTED')
+        WorkshopConnection.objects.filter(service_request=service_request).update(
+            requested_at=timezone.now() - timedelta(hours=1),
+        )
+        self.client.force_authenticate(self.owner)
+
+        for url in (
+            f'/api/service-request/{service_request.pk}/',
+            f'/api/service-request/{service_request.pk}/nearby/',
+            '/api/service-request/user-requests/',
+        ):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    [q['sql'] for q in queries.captured_queries if not q['sql'].lstrip().upper().startswith('SELECT')], [],
+                )
+
+        item = response.data[0]
+        self.assertEqual(item['status'], 'EXPIRED')
+        self.assertEqual(item['latest_connection']['status'], 'AUTO_REJECTED')
+        self.assertIsNone(item['active_connection'])
+
+        service_request.refresh_from_db()
+        self.assertEqual(service_request.status, 'CONNECTING')
+        self.assertFalse(Payment.objects.filter(is_refunded=True).exists())
+
+    def test_overdue_connection_cannot_be_answered(self):
+        service_request = _service_request(self.owner, status='CONNECTING', platform_fee_paid=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            overdue = WorkshopConnection.objects.create(service_request=service_request, workshop=self.workshop, status='REQUESTED')
+        WorkshopConnection.objects.filter(pk=overdue.pk).update(requested_at=timezone.now() - timedelta(minutes=31))
+        self.client.force_authenticate(self.workshop_admin)
+
+        response = self.client.get('/api/service-request/workshop/connection-requests/')
+        self.assertEqual(response.data['results'][0]['status'], 'AUTO_REJECTED')
+
+        for action in ('accept', 'reject'):
+            with self.subTest(action=action), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(f'/api/service-request/workshop/connection-requests/{overdue.pk}/{action}/')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], 'Connection request is already AUTO_REJECTED')
+
+        overdue.refresh_from_db()
+        service_request.refresh_from_db()
+        self.assertEqual(overdue.status, 'AUTO_REJECTED')
+        self.assertEqual(service_request.status, 'PLATFORM_FEE_PAID')
+        self.assertFalse(ServiceExecution.objects.filter(service_request=service_request).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REALTIME_DELIVERY='direct')
+class AutoRejectTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(dispatch, 'send')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+        self.workshops = []
+        for n in range(2):
+            workshop_admin = User.objects.create_user(f'workshop{n}@example.com', f'Workshop {n}', 'pass1234', role='workshop_admin')
+            self.workshops.append(Workshop.objects.create(
+                user=workshop_admin, workshop_name=f'Workshop {n}', address_line='Street', city='City',
+                state='State', pincode='000000', latitude=12.9, longitude=77.5, verification_status='APPROVED',
+            ))
+
+    def _connection(self, service_request, workshop, status='REQUESTED', age=timedelta(minutes=31)):
+        connection = WorkshopConnection.objects.create(service_request=service_request, workshop=workshop, status=status)
+        WorkshopConnection.objects.filter(pk=connection.pk).update(requested_at=timezone.now() - age)
+        return connection
+
+    def _statuses(self, *rows):
+        return [type(row).objects.get(pk=row.pk).status for row in rows]
+
+    def test_only_overdue_requested_connections_are_rejected(self):
+        connecting = _service_request(self.owner, status='CONNECTING')
+        paid = _service_request(self.owner, status='PLATFORM_FEE_PAID')
+        overdue = self._connection(connecting, self.workshops[0])
+        other = self._connection(paid, self.workshops[0])
+        fresh = self._connection(_service_request(self.owner, status='CONNECTING'), self.workshops[1], age=timedelta(minutes=5))
+        # Picked by the sweep but accepted before its UPDATE ran
+        accepted = self._connection(_service_request(self.owner, status='CONNECTED'), self.workshops[1], status='ACCEPTED')
+
+        with transaction.atomic():
+            rows = expiration._auto_reject(
+                WorkshopConnection.objects.filter(pk__in=[overdue.pk, other.pk, accepted.pk]).values('pk'),
+                timezone.now(),
+            )
+        self.assertEqual(sorted(rows), sorted([
+            (overdue.pk, connecting.pk, self.workshops[0].pk),
+            (other.pk, paid.pk, self.workshops[0].pk),
+        ]))
+        self.assertEqual(self._statuses(overdue, other, fresh, accepted), ['AUTO_REJECTED', 'AUTO_REJECTED', 'REQUESTED', 'ACCEPTED'])
+
+        # The full path also moves requests that were waiting on the workshop back
+        WorkshopConnection.objects.filter(pk__in=[overdue.pk, other.pk]).update(status='REQUESTED')
+        self.assertEqual(expiration.check_expired_connections(WorkshopConnection.objects.all()), 2)
+        self.assertEqual(self._statuses(connecting, paid, fresh.service_request), ['PLATFORM_FEE_PAID', 'PLATFORM_FEE_PAID', 'CONNECTING'])
+        self.assertEqual(self._statuses(fresh, accepted), ['REQUESTED', 'ACCEPTED'])
+
+    def test_notifications_are_sent_once_after_commit(self):
+        first = _service_request(self.owner, status='CONNECTING')
+        second = _service_request(self.owner, status='CONNECTING')
+        connections = [
+            self._connection(first, self.workshops[0]),
+            self._connection(second, self.workshops[0]),
+            self._connection(first, self.workshops[1]),
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expiration.check_expired_connections(WorkshopConnection.objects.all()), 3)
+            self.send.assert_not_called()
+
+        messages = [message for call in self.send.call_args_list for message in call.args[0]]
+        flow_updates = Counter(group for group, message in messages if message['type'] == 'service_flow.update')
+        count_updates = Counter(group for group, message in messages if message['type'] == 'connection_count.update')
+        self.assertEqual(flow_updates, {f'service_flow_{first.pk}': 1, f'service_flow_{second.pk}': 1})
+        self.assertEqual(count_updates, {f'notifications_user_{w.user_id}': 1 for w in self.workshops})
+        self.assertEqual(self._statuses(*connections), ['AUTO_REJECTED'] * 3)
+        self.assertEqual(
+            [get_counter(w.user_id).pending_connections for w in self.workshops], [0, 0],
+        )
+
+
+@skipUnless(fakeredis, 'fakeredis is not installed')
+class DeadlineSchedulerTests(TestCase):
+
+    def setUp(self):
+        scheduler.use_redis(fakeredis.FakeRedis())
+        self.addCleanup(scheduler.use_redis, None)
+
+        self.owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+        workshop_admin = User.objects.create_user('workshop@example.com', 'Workshop', 'pass1234', role='workshop_admin')
+        self.workshop = Workshop.objects.create(
+            user=workshop_admin, workshop_name='Workshop', address_line='Street', city='City',
+            state='State', pincode='000000', latitude=12.9, longitude=77.5, verification_status='APPROVED',
+        )
+
+    def _create_request(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ServiceRequest.objects.create(
+                user=self.owner, vehicle_type='Bike', vehicle_model='Model', issue_category='Engine',
+                description='Engine makes a noise when starting', user_latitude=12.9, user_longitude=77.5, **kwargs
+            )
+
+    def test_deadlines_are_registered_and_moved(self):
+        service_request = self._create_request()
+        self.assertAlmostEqual(scheduler.next_due_in(), 30 * 60, delta=5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            service_request.platform_fee_paid = True
+            service_request.status = 'PLATFORM_FEE_PAID'
+            service_request.save()
+        self.assertEqual(scheduler.pending_count(), 1)
+        self.assertAlmostEqual(scheduler.next_due_in(), 7 * 24 * 3600, delta=5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            WorkshopConnection.objects.create(service_request=service_request, workshop=self.workshop, status='REQUESTED')
+        self.assertEqual(scheduler.pending_count(), 2)
+
+    def test_due_events_apply_transitions(self):
+        service_request = self._create_request(status='PLATFORM_FEE_PAID')
+        with self.captureOnCommitCallbacks(execute=True):
+            connection = WorkshopConnection.objects.create(service_request=service_request, workshop=self.workshop, status='ACCEPTED')
+            estimate = Estimate.objects.create(
+                service_request=service_request, workshop_connection=connection, status='SENT',
+                expires_at=timezone.now() + timedelta(days=7),
+            )
+
+        # Nothing is due yet
+        self.assertEqual(scheduler.run_due(), 0)
+        self.assertEqual(scheduler.pending_count(), 2)
+
+        later = timezone.now() + timedelta(days=8)
+        ServiceRequest.objects.filter(pk=service_request.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        Estimate.objects.filter(pk=estimate.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(scheduler.run_due(now=later), 2)
+
+        self.assertEqual(scheduler.pending_count(), 0)
+        service_request.refresh_from_db()
+        estimate.refresh_from_db()
+        self.assertEqual(service_request.status, 'EXPIRED')
+        self.assertEqual(estimate.status, 'EXPIRED')
+
+    def test_stale_events_leave_rows_alone(self):
+        service_request = self._create_request()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(scheduler.run_due(now=timezone.now() + timedelta(hours=1)), 1)
+
+        # The row was not actually overdue, so the event is a no-op
+        service_request.refresh_from_db()
+        self.assertEqual(service_request.status, 'CREATED')
+
+    def test_locked_rows_are_retried_shortly(self):
+        service_request = self._create_request()
+        ServiceRequest.objects.filter(pk=service_request.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        claimed = scheduler.claim_due(now=timezone.now() + timedelta(hours=1))
+        self.assertEqual(scheduler.pending_count(), 0)
+
+        # Another transaction holds the row, so SKIP LOCKED passes over it
+        with mock.patch.object(expiration, 'expire_requests', return_value=([], [service_request.pk])):
+            self.assertEqual(scheduler.dispatch(claimed), 0)
+
+        self.assertEqual(scheduler.pending_count(), 1)
+        self.assertAlmostEqual(scheduler.next_due_in(), settings.DEADLINE_SCHEDULER_LOCKED_RETRY_SECONDS, delta=2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(scheduler.dispatch(scheduler.claim_due(now=timezone.now() + timedelta(minutes=1))), 1)
+        service_request.refresh_from_db()
+        self.assertEqual(service_request.status, 'EXPIRED')
+
+    def test_backfill_registers_pending_deadlines(self):
+        ServiceRequest.objects.bulk_create([
+            ServiceRequest(
+                user=self.owner, vehicle_type='Bike', vehicle_model='Model', issue_category='Engine',
+                description='Bulk created', user_latitude=12.9, user_longitude=77.5,
+                expires_at=timezone.now() + timedelta(minutes=30), status=status,
+            )
+            for status in ('CREATED', 'CONNECTING', 'COMPLETED')
+        ])
+
+        self.assertEqual(scheduler.backfill(), 2)
+        self.assertEqual(scheduler.pending_count(), 2)
+
+
+class NotificationCounterTests(TestCase):
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+        self.workshop_admin = User.objects.create_user('workshop@example.com', 'Workshop', 'pass1234', role='workshop_admin')
+        self.workshop = Workshop.objects.create(
+            user=self.workshop_admin, workshop_name='Workshop', address_line='Street', city='City',
+            state='State', pincode='000000', latitude=12.9, longitude=77.5, verification_status='APPROVED',
+        )
+        self.mechanic = Mechanic.objects.create(
+            user=User.objects.create_user('mechanic@example.com', 'Mechanic', 'pass1234', role='mechanic'),
+            workshop=self.workshop,
+        )
+        self.service_request = ServiceRequest.objects.create(
+            user=self.owner, vehicle_type='Bike', vehicle_model='Model', issue_category='Engine',
+            description='Engine makes a noise when starting', user_latitude=12.9, user_longitude=77.5,
+            status='CONNECTING',
+        )
+
+    def _counts(self, user):
+        counter = NotificationCounter.objects.get(user=user)
+        return counter.pending_connections, counter.active_tasks
+
+    def test_transitions_adjust_counters(self):
+        # Rows are created from real counts on first read
+        self.assertEqual(get_counter(self.workshop_admin.id).pending_connections, 0)
+        self.assertEqual(get_counter(self.mechanic.user_id).active_tasks, 0)
+
+        connection = WorkshopConnection.objects.create(
+            service_request=self.service_request, workshop=self.workshop, status='REQUESTED',
+        )
+        self.assertEqual(self._counts(self.workshop_admin), (1, 0))
+
+        connection = WorkshopConnection.objects.get(pk=connection.pk)
+        connection.status = 'ACCEPTED'
+        connection.save()
+        self.assertEqual(self._counts(self.workshop_admin), (0, 0))
+
+        self.service_request.status = 'CONNECTED'
+        self.service_request.save()
+        execution = ServiceExecution.objects.create(
+            service_request=self.service_request, workshop=self.workshop, assigned_to=self.workshop_admin,
+        )
+        execution.mechanics.add(self.mechanic)
+        mechanics_changed(self.service_request.status, [self.mechanic.user_id], 1)
+        self.assertEqual(self._counts(self.mechanic.user), (0, 1))
+
+        self.service_request.status = 'IN_PROGRESS'
+        self.service_request.save()
+        self.assertEqual(self._counts(self.mechanic.user), (0, 1))
+
+        self.service_request.status = 'COMPLETED'
+        self.service_request.save()
+        self.assertEqual(self._counts(self.mechanic.user), (0, 0))
+
+        self.assertEqual(reconcile_counters(), 0)
+
+    def test_reconcile_fixes_drift(self):
+        WorkshopConnection.objects.create(service_request=self.service_request, workshop=self.workshop, status='REQUESTED')
+        NotificationCounter.objects.update_or_create(user=self.workshop_admin, defaults={'pending_connections': 7})
+
+        # One drifted row fixed, one missing row (the mechanic) created
+        self.assertEqual(reconcile_counters(), 2)
+        self.assertEqual(self._counts(self.workshop_admin), (1, 0))
+        self.assertEqual(self._counts(self.mechanic.user), (0, 0))
+
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ParticipantResolverTests(TestCase):
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+        self.workshop_admin = User.objects.create_user('workshop@example.com', 'Workshop', 'pass1234', role='workshop_admin')
+        self.workshop = Workshop.objects.create(
+            user=self.workshop_admin, workshop_name='Workshop', address_line='Street', city='City',
+            state='State', pincode='000000', latitude=12.9, longitude=77.5, verification_status='APPROVED',
+        )
+        self.mechanic = Mechanic.objects.create(
+            user=User.objects.create_user('mechanic@example.com', 'Mechanic', 'pass1234', role='mechanic'),
+            workshop=self.workshop,
+        )
+        self.service_request = ServiceRequest.objects.create(
+            user=self.owner, vehicle_type='Bike', vehicle_model='Model', issue_category='Engine',
+            description='Engine makes a noise when starting', user_latitude=12.9, user_longitude=77.5,
+            status='CONNECTING',
+        )
+
+    def test_resolved_in_one_query_then_cached(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            WorkshopConnection.objects.create(service_request=self.service_request, workshop=self.workshop, status='REQUESTED')
+
+        with self.assertNumQueries(1):
+            participants = get_participants(self.service_request.pk)
+        self.assertTrue(participants.can_view(self.workshop_admin))
+        self.assertFalse(participants.can_chat(self.workshop_admin))
+        self.assertFalse(participants.can_chat(self.owner))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_participants(self.service_request.pk).pending_workshop_user_ids, {self.workshop_admin.id})
+
+    def test_accept_and_assignment_invalidate(self):
+        connection = WorkshopConnection.objects.create(
+            service_request=self.service_request, workshop=self.workshop, status='REQUESTED',
+        )
+        self.assertFalse(get_participants(self.service_request.pk).can_chat(self.owner))
+
+        connection.status = 'ACCEPTED'
+        with self.captureOnCommitCallbacks(execute=True):
+            connection.save()
+        participants = get_participants(self.service_request.pk)
+        self.assertTrue(participants.can_chat(self.owner))
+        self.assertEqual(participants.user_ids, {self.owner.id, self.workshop_admin.id})
+
+        execution = ServiceExecution.objects.create(
+            service_request=self.service_request, workshop=self.workshop, assigned_to=self.workshop_admin,
+        )
+        execution.mechanics.add(self.mechanic)
+        self.assertFalse(get_participants(self.service_request.pk).can_chat(self.mechanic.user))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_participants([self.service_request.pk])
+        self.assertTrue(get_participants(self.service_request.pk).can_chat(self.mechanic.user))
+        self.assertFalse(get_participants(self.service_request.pk).can_chat(User(pk=0)))
+
+    def test_invalidation_during_a_load_is_not_overwritten(self):
+        connection = WorkshopConnection.objects.create(
+            service_request=self.service_request, workshop=self.workshop, status='REQUESTED',
+        )
+        load = participants_module.load_participants
+
+        def load_then_reject(service_request_id):
+            # The connection is rejected and committed after the rows were read
+            loaded = load(service_request_id)
+            WorkshopConnection.objects.filter(pk=connection.pk).update(status='REJECTED')
+            with self.captureOnCommitCallbacks(execute=True):
+                invalidate_participants([service_request_id])
+            return loaded
+
+        def read_during_reject():
+            with mock.patch.object(participants_module, 'load_participants', side_effect=load_then_reject):
+                self.assertTrue(get_participants(self.service_request.pk).can_view(self.workshop_admin))
+            self.assertFalse(get_participants(self.service_request.pk).can_view(self.workshop_admin))
+
+        # No generation yet
+        read_during_reject()
+
+        # A current generation and an entry from an older one
+        WorkshopConnection.objects.filter(pk=connection.pk).update(status='REQUESTED')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_participants([self.service_request.pk])
+        read_during_reject()
+
+
+@override_settings(REALTIME_DELIVERY='direct')
+class NotificationDispatcherTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(dispatch, 'send')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+        self.first = _service_request(owner)
+        self.second = _service_request(owner)
+
+    def _sent(self):
+        return [message for call in self.send.call_args_list for message in call.args[0]]
+
+    def test_transaction_notifications_are_coalesced(self):
+        first, second = self.first.pk, self.second.pk
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            notify_service_flow_update(first)
+            notify_service_flow_update(first)
+            notify_service_flow_update(first, event='estimate_sent')
+            notify_service_flow_updates([first, second])
+            self.send.assert_not_called()
+
+        self.assertEqual(len(callbacks), 1)
+        self.send.assert_called_once()
+        self.assertEqual(_flow_events(self._sent()), [
+            (f'service_flow_{first}', 'update', 1),
+            (f'service_flow_{first}', 'estimate_sent', 2),
+            (f'service_flow_{second}', 'update', 1),
+        ])
+
+    def test_rolled_back_savepoint_drops_its_notifications(self):
+        first, second = self.first.pk, self.second.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_service_flow_update(first)
+            try:
+                with transaction.atomic():
+                    notify_service_flow_update(second)
+                    notify_service_flow_update(first, event='estimate_sent')
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            with transaction.atomic():
+                notify_service_flow_update(second, event='estimate_sent')
+            notify_service_flow_update(first)
+
+        self.assertEqual(_flow_events(self._sent()), [
+            (f'service_flow_{first}', 'update', 1),
+            (f'service_flow_{second}', 'estimate_sent', 1),
+        ])
+
+    def test_higher_version_never_carries_older_state(self):
+        pk = self.first.pk
+        bump = utils.bump_service_flow_versions
+        interleaved = []
+
+        def bump_after_concurrent_flush(counts):
+            # Flush B changes the request and delivers before flush A takes its version
+            if not interleaved:
+                interleaved.append(True)
+                ServiceRequest.objects.filter(pk=pk).update(status='IN_PROGRESS')
+                interleaved.extend(utils._service_flow_messages([(pk, 'flush_b')]))
+            return bump(counts)
+
+        with mock.patch.object(utils, 'bump_service_flow_versions', side_effect=bump_after_concurrent_flush):
+            flush_a = utils._service_flow_messages([(pk, 'flush_a')])
+
+        frames = sorted(
+            (json.loads(message['frame']) for _, message in interleaved[1:] + flush_a),
+            key=lambda frame: frame['version'],
+        )
+        self.assertEqual([frame['event'] for frame in frames], ['flush_b', 'flush_a'])
+        self.assertEqual([frame['state']['status'] for frame in frames], ['IN_PROGRESS', 'IN_PROGRESS'])
+
+    def test_request_batch_merges_transactions(self):
+        workshop_admin = User.objects.create_user('workshop@example.com', 'Workshop', 'pass1234', role='workshop_admin')
+
+        with dispatch.collect():
+            with self.captureOnCommitCallbacks(execute=True):
+                notify_service_flow_update(self.first.pk)
+                push_connection_count_to_workshop(workshop_admin.id)
+            with self.captureOnCommitCallbacks(execute=True):
+                notify_service_flow_update(self.first.pk)
+                push_connection_count_to_workshop(workshop_admin.id)
+            self.send.assert_not_called()
+
+        self.send.assert_called_once()
+        self.assertEqual(_flow_events(self._sent()), [
+            (f'service_flow_{self.first.pk}', 'update', 1),
+            (f'notifications_user_{workshop_admin.id}', {'type': 'connection_count.update', 'count': 0}),
+        ])
+
+    def test_service_flow_update_carries_versioned_state(self):
+        workshop_admin = User.objects.create_user('workshop@example.com', 'Workshop', 'pass1234', role='workshop_admin')
+        workshop = Workshop.objects.create(
+            user=workshop_admin, workshop_name='Workshop', address_line='Street', city='City',
+            state='State', pincode='000000', latitude=12.9, longitude=77.5, verification_status='APPROVED',
+        )
+        connection = WorkshopConnection.objects.create(service_request=self.first, workshop=workshop, status='ACCEPTED')
+        estimate = Estimate.objects.create(
+            service_request=self.first, workshop_connection=connection, status='SENT', total_amount=1200,
+        )
+        ServiceRequest.objects.filter(pk=self.first.pk).update(status='ESTIMATE_SHARED')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_service_flow_update(self.first.pk, event='estimate_sent')
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_service_flow_update(self.first.pk)
+        # A request deleted before delivery is skipped
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_service_flow_update(0)
+
+        frames = [json.loads(message['frame']) for _, message in self._sent()]
+        self.assertEqual([frame['version'] for frame in frames], [1, 2])
+        state = frames[0]['state']
+        self.assertEqual(state['status'], 'ESTIMATE_SHARED')
+        self.assertEqual(state['active_connection']['workshop_name'], 'Workshop')
+        self.assertEqual((state['estimate']['id'], state['estimate']['status']), (estimate.pk, 'SENT'))
+
+        # The detail view reports the version its state was read at
+        client = APIClient()
+        client.force_authenticate(self.first.user)
+        response = client.get(f'/api/service-request/{self.first.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['request']['flow_version'], 2)
+        self.assertEqual(response.data['request']['estimate']['id'], estimate.pk)
+
+
+@override_settings(REALTIME_DELIVERY='outbox')
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        owner = User.objects.create_user('owner@example.com', 'Owner', 'pass1234')
+        self.first = _service_request(owner)
+        self.second = _service_request(owner)
+
+    def test_events_are_written_in_the_transaction(self):
+        with mock.patch.object(dispatch, 'send') as send:
+            notify_service_flow_update(self.first.pk)
+            dispatch.publish('chat_1', {'type': 'chat.message', 'message': {'id': 5}})
+        send.assert_not_called()
+
+        self.assertEqual(
+            list(OutboxEvent.objects.order_by('pk').values_list('topic', flat=True)),
+            ['service_flow', 'message'],
+        )
+
+    def test_relay_batch_is_coalesced_and_marked_delivered(self):
+        first, second = self.first.pk, self.second.pk
+        notify_service_flow_update(first)
+        notify_service_flow_update(first)
+        notify_service_flow_updates([first, second], event='estimate_sent')
+
+        rows = outbox.claim_batch(batch_size=10, lease_seconds=30)
+        self.assertEqual(len(rows), 3)
+        # Leased rows are not handed out twice
+        self.assertEqual(outbox.claim_batch(batch_size=10, lease_seconds=30), [])
+
+        messages = outbox.build_messages(rows)
+        self.assertEqual(_flow_events(messages), [
+            (f'service_flow_{first}', 'update', 1),
+            (f'service_flow_{first}', 'estimate_sent', 2),
+            (f'service_flow_{second}', 'estimate_sent', 1),
+        ])
+
+        outbox.mark_delivered([pk for pk, _, _ in rows])
+        self.assertFalse(OutboxEvent.objects.filter(delivered_at__isnull=True).exists())
+
+        # Delivered rows can be replayed until they are pruned
+        self.assertEqual(outbox.replay(timezone.now() - timedelta(minutes=1)), 3)
+        self.assertEqual(len(outbox.claim_batch(batch_size=10, lease_seconds=30)), 3)
+        OutboxEvent.objects.update(delivered_at=timezone.now())
+        self.assertEqual(outbox.prune(now=timezone.now() + timedelta(days=2)), 3)
@@ -1,98 +1,234 @@
 from django.utils import timezone
-from payments.utils import check_and_process_refund
+from django.conf import settings
 from math import radians, cos, sin, asin, sqrt
-from django.db import transaction
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from chat.models import ChatMessageRecipient
-from service_request.models import WorkshopConnection, ServiceExecution
+from service_request import dispatch
+from service_request.models import ServiceRequest, WorkshopConnection, ServiceExecution, ServiceFlowVersion
+import json
 import logging
+from rest_framework.utils.encoders import JSONEncoder
 from accounts.models import Workshop
+from accounts.geohash import covering_cells
+from collections import Counter, defaultdict
+from functools import lru_cache
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 
 
 logger = logging.getLogger(__name__)
 
-def notify_service_flow_update(service_request_id: int, event: str = "update") -> None:
+# Service request statuses during which an execution keeps its workshop and mechanics busy
+ACTIVE_SERVICE_STATUSES = [
+    'CONNECTED', 'ESTIMATE_SHARED',
+    'SERVICE_AMOUNT_PAID', 'IN_PROGRESS'
+]
 
-    def send_notification():
-        try:
-            channel_layer = get_channel_layer()
-            if not channel_layer:
-                logger.warning("Channel layer not configured. Notification skipped.")
-                return
-
-            async_to_sync(channel_layer.group_send)(
-                f"service_flow_{service_request_id}",
-                {"type": "service_flow.update", "event": event},
-            )
-            logger.info(f"Service flow update notification sent for ServiceRequest #{service_request_id}, event: {event}")
+# Connection statuses that count towards a workshop's load
+PENDING_CONNECTION_STATUSES = ['REQUESTED', 'ACCEPTED']
 
-        except Exception as e:
-            logger.exception(f"Failed to send service flow update notification for ServiceRequest #{service_request_id}")
+# Service statuses an accepted connection is shown under in the workshop inbox
+INBOX_SERVICE_STATUSES = [
+    'IN_PROGRESS', 'ESTIMATE_SHARED', 'SERVICE_AMOUNT_PAID',
+    'COMPLETED', 'VERIFIED'
+]
 
-    transaction.on_commit(send_notification)
+def notify_service_flow_update(service_request_id: int, event: str = "update") -> None:
+    notify_service_flow_updates([service_request_id], event)
+
+
+def notify_service_flow_updates(service_request_ids, event: str = "update") -> None:
+    """
+    Push the service flow state of these requests to their pages, once per
+    (request, event). Each update carries the request's next flow version.
+    """
+    dispatch.enqueue('service_flow', ((service_request_id, event) for service_request_id in service_request_ids))
+
+
+def bump_service_flow_versions(counts):
+    """Add {service_request_id: n} to the requests' flow versions; returns {service_request_id: new version}."""
+    with transaction.atomic():
+        ServiceFlowVersion.objects.bulk_create(
+            [ServiceFlowVersion(service_request_id=pk) for pk in counts],
+            ignore_conflicts=True,
+        )
+        # Lock the rows in pk order so concurrent bumps queue up instead of deadlocking
+        list(
+            ServiceFlowVersion.objects.filter(service_request_id__in=counts)
+            .order_by('pk').select_for_update().values_list('pk', flat=True)
+        )
+
+        # One UPDATE per distinct increment
+        by_delta = defaultdict(list)
+        for pk, n in counts.items():
+            by_delta[n].append(pk)
+        for n, pks in by_delta.items():
+            ServiceFlowVersion.objects.filter(service_request_id__in=pks).update(
+                version=F('version') + n,
+                updated_at=timezone.now(),
+            )
+
+        return dict(
+            ServiceFlowVersion.objects.filter(service_request_id__in=counts).values_list('service_request_id', 'version')
+        )
+
+
+@dispatch.builder('service_flow')
+def _service_flow_messages(items):
+    from service_request.serializers import ServiceFlowStateSerializer
+
+    with transaction.atomic():
+        # Requests deleted since the update was enqueued have nobody left to tell
+        existing = set(ServiceRequest.objects.filter(
+            pk__in={service_request_id for service_request_id, _ in items},
+        ).values_list('pk', flat=True))
+        items = [(service_request_id, event) for service_request_id, event in items if service_request_id in existing]
+        counts = Counter(service_request_id for service_request_id, _ in items)
+
+        # The version rows stay locked until commit and the state is read after
+        # taking them, so a concurrent flush of the same request either goes
+        # first with a lower version or waits and reads newer state: a higher
+        # version never carries older state
+        versions = bump_service_flow_versions(counts)
+        service_requests = ServiceFlowStateSerializer.setup_eager_loading(ServiceRequest.objects.filter(pk__in=counts))
+        states = {sr.pk: ServiceFlowStateSerializer(sr).data for sr in service_requests}
+
+    # Several events for one request get consecutive versions, in order
+    next_version = {pk: versions[pk] - n + 1 for pk, n in counts.items()}
+
+    messages = []
+    for service_request_id, event in items:
+        version = next_version[service_request_id]
+        next_version[service_request_id] += 1
+        if service_request_id not in states:
+            continue
+        messages.append((
+            f"service_flow_{service_request_id}",
+            {
+                "type": "service_flow.update",
+                "service_request_id": service_request_id,
+                "frame": dispatch.encode_frame({
+                    "type": "service_flow.update",
+                    "event": event,
+                    "version": version,
+                    "state": states[service_request_id],
+                }),
+            },
+        ))
+    return messages
+
+
+def push_connection_counts_to_workshops(workshop_user_ids) -> None:
+    """Push the pending connection count to each workshop admin in `workshop_user_ids`."""
+    dispatch.enqueue('connection_count', workshop_user_ids)
 
 
 def push_connection_count_to_workshop(workshop_user_id: int) -> None:
+    push_connection_counts_to_workshops([workshop_user_id])
 
-    def send():
-        try:
-            count = WorkshopConnection.objects.filter(
-                workshop__user_id=workshop_user_id,
-                status='REQUESTED'
-            ).count()
-
-            channel_layer = get_channel_layer()
-            if not channel_layer:
-                logger.warning(f"Channel layer not configured. Cannot push connection count for workshop_user_id {workshop_user_id}.")
-                return
-
-            async_to_sync(channel_layer.group_send)(
-                f'notifications_user_{workshop_user_id}',
-                {'type': 'connection_count.update', 'count': count}
-            )
 
-            logger.info(f"Pushed connection count ({count}) to workshop_user_id {workshop_user_id}")
+@dispatch.builder('connection_count')
+def _connection_count_messages(workshop_user_ids):
+    from .counters import get_counters
 
-        except Exception as e:
-            logger.exception(f"Failed to push connection count for workshop_user_id {workshop_user_id}")
+    return [
+        (f'notifications_user_{user_id}', {'type': 'connection_count.update', 'count': counter.pending_connections})
+        for user_id, counter in get_counters(workshop_user_ids).items()
+    ]
 
-    transaction.on_commit(send)
 
+def inbox_status(connection_status, service_request_status):
+    """
+    Status a connection is shown under in the workshop inbox: the service's
+    own status once an accepted connection has moved on, EXPIRED once the
+    request expired, otherwise the connection status.
+    """
+    if connection_status == 'ACCEPTED' and service_request_status in INBOX_SERVICE_STATUSES:
+        return service_request_status
+    if service_request_status == 'EXPIRED':
+        return 'EXPIRED'
+    return connection_status
 
 
-def push_assigned_task_count_to_mechanic(mechanic_user_id: int) -> None:
+def inbox_status_filter(status):
+    """Q matching WorkshopConnection rows whose inbox_status() is `status`."""
+    if status in INBOX_SERVICE_STATUSES:
+        return Q(status='ACCEPTED', service_request__status=status)
+    if status == 'EXPIRED':
+        return Q(service_request__status='EXPIRED')
 
-    def send():
-        service_status = [
-            'CONNECTED', 'ESTIMATE_SHARED',
-            'SERVICE_AMOUNT_PAID', 'IN_PROGRESS'
-        ]
+    status_filter = Q(status=status) & ~Q(service_request__status='EXPIRED')
+    if status == 'ACCEPTED':
+        status_filter &= ~Q(service_request__status__in=INBOX_SERVICE_STATUSES)
+    return status_filter
+
+
+def get_connection_inbox_counts_by_workshop(workshop_ids):
+    """{workshop_id: {inbox status: count}} from one grouped query."""
+    rows = WorkshopConnection.objects.filter(workshop_id__in=workshop_ids).order_by().values(
+        'workshop_id', 'status', 'service_request__status'
+    ).annotate(total=Count('id'))
+
+    counts = {workshop_id: {} for workshop_id in workshop_ids}
+    for row in rows:
+        key = inbox_status(row['status'], row['service_request__status'])
+        workshop_counts = counts[row['workshop_id']]
+        workshop_counts[key] = workshop_counts.get(key, 0) + row['total']
+    return counts
+
+
+def get_connection_inbox_counts(workshop_id):
+    """{inbox status: count} of a workshop's connections, from one grouped query."""
+    return get_connection_inbox_counts_by_workshop([workshop_id])[workshop_id]
 
-        try:
-            count = ServiceExecution.objects.filter(
-                mechanics__user_id=mechanic_user_id,
-                service_request__status__in=service_status
-            ).count()
-
-            channel_layer = get_channel_layer()
-            if not channel_layer:
-                logger.warning(f"Channel layer not configured. Cannot push assigned task count for mechanic_user_id {mechanic_user_id}.")
-                return
-
-            async_to_sync(channel_layer.group_send)(
-                f'notifications_user_{mechanic_user_id}',
-                {'type': 'assigned_task_count.update', 'count': count}
-            )
 
-            logger.info(f"Pushed assigned task count ({count}) to mechanic_user_id {mechanic_user_id}")
+def push_connection_inbox_updates(connection_ids) -> None:
+    """
+    Push created/changed connections, rendered like the inbox list, plus each
+    workshop's fresh inbox counts to its admin's notification group.
+    """
+    dispatch.enqueue('connection_inbox', connection_ids)
 
-        except Exception as e:
-            logger.exception(f"Failed to push assigned task count for mechanic_user_id {mechanic_user_id}")
 
-    transaction.on_commit(send)
+def push_connection_inbox_update(connection_id: int) -> None:
+    push_connection_inbox_updates([connection_id])
 
 
+@dispatch.builder('connection_inbox')
+def _connection_inbox_messages(connection_ids):
+    from .serializers import ServiceRequestSerializer, WorkshopConnectionSerializer
+
+    connections = list(ServiceRequestSerializer.setup_eager_loading(
+        WorkshopConnection.objects.filter(pk__in=connection_ids).select_related('workshop', 'service_request__user'),
+        prefix='service_request__',
+    ))
+    counts = get_connection_inbox_counts_by_workshop({c.workshop_id for c in connections})
+
+    messages = []
+    for connection in connections:
+        # Round-trip through JSON so the channel layer only sees plain types
+        payload = json.loads(json.dumps({
+            'connection': WorkshopConnectionSerializer(connection).data,
+            'counts': counts[connection.workshop_id],
+        }, cls=JSONEncoder))
+        messages.append((
+            f'notifications_user_{connection.workshop.user_id}',
+            {'type': 'connection_inbox.update', **payload},
+        ))
+    return messages
+
+
+def push_assigned_task_count_to_mechanic(mechanic_user_id: int) -> None:
+    dispatch.enqueue('assigned_task_count', [mechanic_user_id])
+
+
+@dispatch.builder('assigned_task_count')
+def _assigned_task_count_messages(mechanic_user_ids):
+    from .counters import get_counters
+
+    return [
+        (f'notifications_user_{user_id}', {'type': 'assigned_task_count.update', 'count': counter.active_tasks})
+        for user_id, counter in get_counters(mechanic_user_ids).items()
+    ]
 
 
 def calculate_distance(lat1, long1, lat2, long2):
@@ -112,82 +248,226 @@ def calculate_distance(lat1, long1, lat2, long2):
     
     return R * c
 
-def get_nearby_workshops(user_lat, user_lon, radius_km=20):
+def nearby_bounding_box(user_lat, user_lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) pre-filter box around a point."""
+    lat_change = radius_km / 111.0
+    lon_change = 360 if abs(user_lat) > 89 else radius_km / (111.0 * abs(cos(radians(user_lat))))
+
+    return user_lat - lat_change, user_lat + lat_change, user_lon - lon_change, user_lon + lon_change
+
+
+def _nearby_candidates(user_lat, user_lon, radius_km, use_spatial_index=True):
+    min_lat, max_lat, min_lon, max_lon = nearby_bounding_box(user_lat, user_lon, radius_km)
+
+    candidates = Workshop.objects.filter(
+        verification_status='APPROVED',
+        latitude__range=(min_lat, max_lat),
+        longitude__range=(min_lon, max_lon)
+    ).exclude(latitude__isnull=True)
+
+    if use_spatial_index:
+        # Narrow the scan to the geohash cells overlapping the bounding box;
+        # the range filter above still decides which rows actually match.
+        # Rows saved before the geohash backfill have none and are kept.
+        cells = covering_cells(min_lat, max_lat, min_lon, max_lon)
+        if cells is not None:
+            cell_filter = Q(geohash__isnull=True)
+            for cell in cells:
+                cell_filter |= Q(geohash__startswith=cell)
+            candidates = candidates.filter(cell_filter)
+
+    return candidates.order_by('pk')
+
+
+def _within_radius(candidates, user_lat, user_lon, radius_km):
+    nearby_workshops = []
+    for ws in candidates:
+        dist = calculate_distance(user_lat, user_lon, ws.latitude, ws.longitude)
+        if dist <= radius_km:
+            ws.distance = round(dist, 2)
+            nearby_workshops.append(ws)
+
+    nearby_workshops.sort(key=lambda x: x.distance)
+    return nearby_workshops
+
+
+def _parse_coordinates(user_lat, user_lon):
     if user_lat is None or user_lon is None:
         logger.warning("Latitude or longitude not provided. Returning empty list.")
-        return []
+        return None
 
     try:
-        user_lat = float(user_lat)
-        user_lon = float(user_lon)
+        return float(user_lat), float(user_lon)
     except (ValueError, TypeError) as e:
         logger.warning(f"Invalid latitude or longitude values: {e}")
-        return []
+        return None
+
 
+@lru_cache(maxsize=None)
+def _load_nearby_engine():
     try:
-        lat_change = radius_km / 111.0
-        lon_change = 360 if abs(user_lat) > 89 else radius_km / (111.0 * abs(cos(radians(user_lat))))
+        from .nearby_engine import snapshot
+    except ImportError:
+        logger.warning("NEARBY_WORKSHOP_ENGINE is 'numpy' but NumPy is not installed; using the database")
+        return None
+    return snapshot
 
-        min_lat, max_lat = user_lat - lat_change, user_lat + lat_change
-        min_lon, max_lon = user_lon - lon_change, user_lon + lon_change
 
-        candidates = Workshop.objects.filter(
-            verification_status='APPROVED',
-            latitude__range=(min_lat, max_lat),
-            longitude__range=(min_lon, max_lon)
-        ).exclude(latitude__isnull=True)
+def _nearby_engine():
+    """The in-memory snapshot when NEARBY_WORKSHOP_ENGINE='numpy' and NumPy is available, else None."""
+    if settings.NEARBY_WORKSHOP_ENGINE != 'numpy':
+        return None
+    return _load_nearby_engine()
 
-        nearby_workshops = []
-        for ws in candidates:
-            dist = calculate_distance(user_lat, user_lon, ws.latitude, ws.longitude)
-            if dist <= radius_km:
-                ws.distance = round(dist, 2)
-                nearby_workshops.append(ws)
 
-        nearby_workshops.sort(key=lambda x: x.distance)
-        return nearby_workshops
+def get_nearby_workshops(user_lat, user_lon, radius_km=20, use_spatial_index=True):
+    coordinates = _parse_coordinates(user_lat, user_lon)
+    if coordinates is None:
+        return []
+    user_lat, user_lon = coordinates
+
+    engine = _nearby_engine()
+    if engine is not None:
+        try:
+            return engine.nearby(user_lat, user_lon, radius_km)
+        except Exception:
+            logger.exception("Nearby engine lookup failed, falling back to the database")
+
+    try:
+        candidates = _nearby_candidates(user_lat, user_lon, radius_km, use_spatial_index)
+        return _within_radius(candidates, user_lat, user_lon, radius_km)
 
     except Exception as e:
         logger.exception("Failed to fetch nearby workshops")
         return []
 
 
-def check_request_expiration(service_request):
+def _knn_search_radius(user_lat, user_lon, k, max_radius_km):
+    """
+    Smallest radius (within a few bisection steps) whose bounding box holds
+    at least k approved workshops, found with COUNT queries only. Returns
+    max_radius_km when even that box holds fewer than k.
+    """
+    radius = min(settings.NEARBY_KNN_START_RADIUS_KM, max_radius_km)
+    previous = 0.0
+
+    # Expand rings outward until the box is big enough
+    while _nearby_candidates(user_lat, user_lon, radius).count() < k:
+        if radius >= max_radius_km:
+            return max_radius_km
+        previous, radius = radius, min(radius * 2, max_radius_km)
+
+    # Then tighten back towards the smallest sufficient ring, so the final
+    # fetch stays close to k rows instead of up to 4x that
+    for _ in range(settings.NEARBY_KNN_BISECT_STEPS):
+        middle = (previous + radius) / 2
+        if _nearby_candidates(user_lat, user_lon, middle).count() >= k:
+            radius = middle
+        else:
+            previous = middle
 
-    if service_request.status in ['COMPLETED', 'CANCELLED', 'EXPIRED', 'VERIFIED']:
-        return False
+    return radius
 
-    if not service_request.expires_at or service_request.expires_at >= timezone.now():
-        return False
+
+def get_k_nearest_workshops(user_lat, user_lon, k, max_radius_km=None):
+    """
+    The k approved workshops closest to the point, searching outward until
+    k are found or max_radius_km (default NEARBY_MAX_RADIUS_KM) is reached.
+    """
+    coordinates = _parse_coordinates(user_lat, user_lon)
+    if coordinates is None or k <= 0:
+        return []
+    user_lat, user_lon = coordinates
+
+    if max_radius_km is None:
+        max_radius_km = settings.NEARBY_MAX_RADIUS_KM
+
+    engine = _nearby_engine()
+    if engine is not None:
+        try:
+            return engine.k_nearest(user_lat, user_lon, k, max_radius_km)
+        except Exception:
+            logger.exception("Nearby engine lookup failed, falling back to the database")
 
     try:
-        is_refunded, msg = check_and_process_refund(service_request)
-        if is_refunded:
-            logger.info(f"Refund processed for ServiceRequest #{service_request.id}: {msg}")
-        else:
-            logger.warning(f"Refund failed or not applicable for ServiceRequest #{service_request.id}: {msg}")
+        radius = _knn_search_radius(user_lat, user_lon, k, max_radius_km)
+
+        # Every workshop in that box lies no further away than its farthest
+        # corner, so a circle reaching the corners is guaranteed to contain
+        # k of them (about twice the box's area, hence about 2k rows).
+        min_lat, max_lat, min_lon, max_lon = nearby_bounding_box(user_lat, user_lon, radius)
+        radius = min(max_radius_km, max(
+            calculate_distance(user_lat, user_lon, lat, lon)
+            for lat in (min_lat, max_lat) for lon in (min_lon, max_lon)
+        ))
+        # Rank lightweight (id, lat, lon) rows and only load the k winners
+        ranked = []
+        for ws_id, lat, lon in _nearby_candidates(user_lat, user_lon, radius).values_list('id', 'latitude', 'longitude'):
+            dist = calculate_distance(user_lat, user_lon, lat, lon)
+            if dist <= radius:
+                ranked.append((round(dist, 2), ws_id))
+        ranked.sort()
+        ranked = ranked[:k]
+
+        workshops = Workshop.objects.in_bulk([ws_id for _, ws_id in ranked])
+        nearest = []
+        for dist, ws_id in ranked:
+            ws = workshops.get(ws_id)
+            if ws is None:
+                continue
+            ws.distance = dist
+            nearest.append(ws)
+        return nearest
 
-        service_request.status = 'EXPIRED'
-        service_request.save()
+    except Exception as e:
+        logger.exception("Failed to fetch k nearest workshops")
+        return []
 
-        # Mark chat messages as read
-        ChatMessageRecipient.objects.filter(
-            message__service_request=service_request,
-            is_read=False
-        ).update(is_read=True)
 
-        notify_service_flow_update(service_request.id)
+def get_workshop_loads(workshop_ids):
+    """
+    {workshop_id: load} for the given workshops, where load is the number of
+    REQUESTED/ACCEPTED connections plus active service executions. Computed
+    in a single query however many workshops are passed.
+    """
+    if not workshop_ids:
+        return {}
 
-        try:
-            execution = service_request.execution
-            if execution:
-                for mechanic in execution.mechanics.all():
-                    mechanic.availability = 'AVAILABLE'
-                    mechanic.save()
-                execution.delete()
-        except ServiceExecution.DoesNotExist:
-            logger.warning(f"No execution found for expired ServiceRequest #{service_request.id}")
+    connections = WorkshopConnection.objects.filter(
+        workshop=OuterRef('pk'),
+        status__in=PENDING_CONNECTION_STATUSES,
+    ).order_by().values('workshop').annotate(total=Count('pk')).values('total')
+
+    executions = ServiceExecution.objects.filter(
+        workshop=OuterRef('pk'),
+        service_request__status__in=ACTIVE_SERVICE_STATUSES,
+    ).order_by().values('workshop').annotate(total=Count('pk')).values('total')
+
+    rows = Workshop.objects.filter(pk__in=workshop_ids).annotate(
+        connection_load=Coalesce(Subquery(connections, output_field=IntegerField()), 0),
+        execution_load=Coalesce(Subquery(executions, output_field=IntegerField()), 0),
+    ).values_list('pk', 'connection_load', 'execution_load')
 
+    return {pk: connection_load + execution_load for pk, connection_load, execution_load in rows}
+
+
+def check_request_expiration(service_request):
+    """
+    Expire a single overdue request right away (used by write paths that must
+    not act on an overdue request). Reads never call this; the periodic
+    process_expirations sweep handles everything else in bulk.
+    """
+    from .expiration import expire_requests, is_effectively_expired
+
+    if not is_effectively_expired(service_request):
+        return False
+
+    try:
+        expired, _ = expire_requests([service_request.id])
+        if not expired:
+            return False
+
+        service_request.status = 'EXPIRED'
         return True
 
     except Exception as e:
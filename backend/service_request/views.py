@@ -1,6 +1,7 @@
 from rest_framework import status, generics, permissions, parsers
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.pagination import CursorPagination
 from django.core.mail import send_mail
 from django.conf import settings
 from .models import (
@@ -9,15 +10,24 @@ from .models import (
 )
 from accounts.models import Workshop, Mechanic
 from .serializers import (
-    ServiceRequestSerializer, NearbyWorkshopSerializer, WorkshopConnectionSerializer,
+    ServiceRequestSerializer, ServiceFlowSerializer, NearbyWorkshopSerializer, WorkshopConnectionSerializer,
     ServiceExecutionMechanicSerializer, EstimateSerializer, EstimateCreateSerializer,
     EstimateUpdateSerializer, ComplaintCreateSerializer
 )
 from django.utils import timezone
 from datetime import timedelta
-from .utils import check_request_expiration, get_nearby_workshops, notify_service_flow_update, push_connection_count_to_workshop, push_assigned_task_count_to_mechanic
+from .expiration import check_expired_connections, expire_connections, is_connection_overdue
+from .counters import mechanics_changed
+from .participants import get_participants, invalidate_participants
+from .nearby import get_cached_nearby_workshops
+from .utils import (
+    check_request_expiration, get_nearby_workshops, notify_service_flow_update, push_connection_count_to_workshop,
+    push_assigned_task_count_to_mechanic, push_connection_inbox_update, get_connection_inbox_counts, inbox_status_filter,
+    INBOX_SERVICE_STATUSES,
+)
 from django.db import DatabaseError, transaction
 from chat.models import ChatMessageRecipient
+from chat.unread import clear_service_requests
 import logging
 from django.db.models import Sum, F, Count, Q
 from accounts.utils import generate_otp_code
@@ -27,70 +37,35 @@ from dateutil.relativedelta import relativedelta
 
 logger = logging.getLogger(__name__)
 
-def check_expired_connections(queryset):
-    expiration_threshold = timezone.now() - timedelta(minutes=30)
-
-    expired_requests = queryset.filter(
-        status='REQUESTED',
-        requested_at__lt=expiration_threshold
-    )
-
-    updated_count = 0
-
-    for conn in expired_requests:
-        try:
-            with transaction.atomic():
-                conn.status = 'AUTO_REJECTED'
-                conn.responded_at = timezone.now()
-                conn.save(update_fields=['status', 'responded_at'])
-
-                service_request = conn.service_request
-
-                if service_request.status == 'CONNECTING':
-                    service_request.status = 'PLATFORM_FEE_PAID'
-                    service_request.save(update_fields=['status'])
-
-                    notify_service_flow_update(service_request.id)
-
-            updated_count += 1
-
-        except Exception as e:
-            logger.exception(
-                "Failed to process expired connection. "
-                f"connection_id={conn.id}, error={str(e)}"
-            )
-            continue
-
-        try:
-            push_connection_count_to_workshop(conn.workshop.user.id)
-        except Exception:
-            logger.exception(
-                f"Failed to push workshop count for connection_id={conn.id}"
-            )
+class IsServiceRequestParticipant(permissions.BasePermission):
+    def has_object_permission(self, request, view, obj):
+        return get_participants(obj.pk).can_view(request.user)
 
-    return updated_count
+NEARBY_SORT_MODES = ('distance', 'rank')
 
 
-class IsServiceRequestParticipant(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
-        user = request.user
-        sr = obj
+def _nearby_options(request):
+    """
+    Optional ?limit=N asking for the N nearest workshops instead of all of
+    them within 20 km, and ?sort=distance|rank. Returns (limit, sort, error_message).
+    """
+    sort = request.query_params.get('sort') or 'distance'
+    if sort not in NEARBY_SORT_MODES:
+        return None, None, f"sort must be one of: {', '.join(NEARBY_SORT_MODES)}"
 
-        is_owner = sr.user == user
+    raw = request.query_params.get('limit')
+    if raw in (None, ''):
+        return None, sort, None
 
-        is_workshop = (
-            user.role == 'workshop_admin'
-            and hasattr(user, 'workshop')
-            and sr.connections.filter(workshop=user.workshop).exclude(status__in=['REJECTED', 'AUTO_REJECTED', 'CANCELLED', 'WITHDRAWN']).exists()
-        )
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        return None, None, 'limit must be a positive integer'
 
-        is_mechanic = (
-            user.role == 'mechanic'
-            and hasattr(sr,'execution')
-            and sr.execution.mechanics.filter(user = user).exists()
-        )
+    if limit <= 0:
+        return None, None, 'limit must be a positive integer'
+    return min(limit, settings.NEARBY_MAX_LIMIT), sort, None
 
-        return is_owner or is_mechanic or is_workshop
 
 class CreateServiceRequestView(generics.CreateAPIView):
     serializer_class = ServiceRequestSerializer
@@ -101,6 +76,10 @@ class CreateServiceRequestView(generics.CreateAPIView):
         serializer.save(user = self.request.user)
 
     def create(self, request , *args, **kwargs):
+        limit, sort, error = _nearby_options(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             serializer = self.get_serializer(data = request.data)
             serializer.is_valid(raise_exception = True)
@@ -110,12 +89,11 @@ class CreateServiceRequestView(generics.CreateAPIView):
             u_lat = serializer.data['user_latitude']
             u_long = serializer.data['user_longitude']
 
-            nearby_list = get_nearby_workshops(u_lat, u_long)
-            nearby_serializer = NearbyWorkshopSerializer(nearby_list, many = True)
+            nearby_workshops = get_cached_nearby_workshops(u_lat, u_long, limit=limit, sort=sort)
         
             return Response({
                 'request' : serializer.data,
-                'nearby_workshops' : nearby_serializer.data
+                'nearby_workshops' : nearby_workshops
             }, status=status.HTTP_201_CREATED)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -127,38 +105,36 @@ class ServiceRequestDetailView(generics.RetrieveAPIView):
     queryset = ServiceRequest.objects.all()
 
     def retrieve(self, request, *args, **kwargs):
+        limit, sort, error = _nearby_options(request)
+        if error:
+            return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
             instance = self.get_object()
-            
-            check_request_expiration(instance)
-            instance.refresh_from_db()
 
             u_lat = instance.user_latitude
             u_lon = instance.user_longitude
             
-            nearby_list = get_nearby_workshops(u_lat, u_lon)
+            nearby_workshops = get_cached_nearby_workshops(u_lat, u_lon, limit=limit, sort=sort)
             
             req_serializer = self.get_serializer(instance)
-            ws_serializer = NearbyWorkshopSerializer(nearby_list, many=True)
             
             return Response({
                 "request": req_serializer.data,
-                "nearby_workshops": ws_serializer.data,
+                "nearby_workshops": nearby_workshops,
             })
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class ServiceFlowDetailView(generics.RetrieveAPIView):
-    serializer_class = ServiceRequestSerializer
-    queryset = ServiceRequest.objects.all()
+    serializer_class = ServiceFlowSerializer
+    queryset = ServiceFlowSerializer.setup_eager_loading(ServiceRequest.objects.all())
     permission_classes = [permissions.IsAuthenticated, IsServiceRequestParticipant]
 
     def retrieve(self, request, *args, **kwargs):
         try:
             instance = self.get_object()
-            check_request_expiration(instance)
-            instance.refresh_from_db()
 
             req_serializer = self.get_serializer(instance)
 
@@ -176,19 +152,8 @@ class UserServiceRequestListView(generics.ListAPIView):
     def get_queryset(self):
         try:
             qs = ServiceRequest.objects.filter(user=self.request.user).order_by('-created_at')
-            
-            user_connections = WorkshopConnection.objects.filter(
-                service_request__in=qs,
-                status='REQUESTED'
-            )
-            check_expired_connections(user_connections)
-            
-            for req in qs:
-                check_request_expiration(req)
-                
-            qs = ServiceRequest.objects.filter(user=self.request.user).order_by('-created_at')
 
-            return qs
+            return ServiceRequestSerializer.setup_eager_loading(qs)
         except Exception as e:
             return ServiceRequest.objects.none()
 
@@ -224,12 +189,15 @@ class ConnectWorkshopView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        check_request_expiration(service_request)
         if service_request.status == 'EXPIRED':
             return Response(
                 {"error": "This service request has expired."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        check_expired_connections(service_request.connections.all())
+
         existing_connection = WorkshopConnection.objects.filter(
             service_request=service_request,
             status__in=['REQUESTED', 'ACCEPTED']
@@ -259,7 +227,7 @@ class ConnectWorkshopView(APIView):
 
         try:
             with transaction.atomic():
-                WorkshopConnection.objects.create(
+                connection = WorkshopConnection.objects.create(
                     service_request=service_request,
                     workshop=workshop,
                     status='REQUESTED'
@@ -267,6 +235,7 @@ class ConnectWorkshopView(APIView):
 
                 service_request.status = 'CONNECTING'
                 service_request.save(update_fields=['status'])
+                push_connection_inbox_update(connection.id)
 
             try:
                 push_connection_count_to_workshop(workshop.user.id)
@@ -300,7 +269,30 @@ class ConnectWorkshopView(APIView):
             )
 
 
+INBOX_STATUSES = {choice for choice, _ in WorkshopConnection.STATUS_CHOICES} | set(INBOX_SERVICE_STATUSES) | {'EXPIRED'}
+
+
+class ConnectionInboxPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-requested_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('ordering') == 'oldest':
+            return ('requested_at', 'id')
+        return self.ordering
+
+
 class WorkshopConnectionRequestsView(APIView):
+    """
+    Cursor-paginated connection inbox of the workshop.
+
+    ?status= filters by the status shown in the inbox (see inbox_status),
+    ?ordering=oldest flips the order. Every page carries the per-status
+    counts of the whole inbox; changes are pushed to the workshop admin's
+    notifications socket as connection_inbox updates.
+    """
 
     permission_classes = [permissions.IsAuthenticated]
 
@@ -313,16 +305,42 @@ class WorkshopConnectionRequestsView(APIView):
                 workshop = request.user.workshop
             except AttributeError:
                 return Response({"error": "Workshop not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            inbox_status = request.query_params.get('status')
+            if inbox_status and inbox_status not in INBOX_STATUSES:
+                return Response({"error": f"Unknown status '{inbox_status}'"}, status=status.HTTP_400_BAD_REQUEST)
             
-            check_expired_connections(WorkshopConnection.objects.filter(workshop=workshop))
+            connections = WorkshopConnection.objects.filter(workshop=workshop).select_related(
+                'service_request__user'
+            )
+            if inbox_status:
+                connections = connections.filter(inbox_status_filter(inbox_status))
+            connections = ServiceRequestSerializer.setup_eager_loading(connections, prefix='service_request__')
+
+            paginator = ConnectionInboxPagination()
+            page = paginator.paginate_queryset(connections, request, view=self)
 
-            connections = WorkshopConnection.objects.filter(workshop=workshop).order_by('-requested_at')
-            serializer = WorkshopConnectionSerializer(connections, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            serializer = WorkshopConnectionSerializer(page, many=True)
+            response = paginator.get_paginated_response(serializer.data)
+            response.data['counts'] = get_connection_inbox_counts(workshop.id)
+            return response
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _lock_pending_connection(pk, workshop):
+    """
+    The workshop's connection `pk`, locked until the transaction ends. A
+    request left unanswered past the response window is auto-rejected first,
+    in case the deadline scheduler and the sweep have not got to it yet.
+    """
+    connection = WorkshopConnection.objects.select_for_update().get(pk=pk, workshop=workshop)
+    if is_connection_overdue(connection):
+        expire_connections([connection.pk])
+        connection.refresh_from_db()
+    return connection
+
+
 class AcceptConnectionRequestView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -336,36 +354,38 @@ class AcceptConnectionRequestView(APIView):
             except AttributeError:
                 return Response({"error": "Workshop not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            try:
-                connection = WorkshopConnection.objects.get(pk=pk, workshop=workshop)
-            except WorkshopConnection.DoesNotExist:
-                return Response({"error": "Connection request not found"}, status=status.HTTP_404_NOT_FOUND)
+            with transaction.atomic():
+                try:
+                    connection = _lock_pending_connection(pk, workshop)
+                except WorkshopConnection.DoesNotExist:
+                    return Response({"error": "Connection request not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            if connection.status != 'REQUESTED':
-                return Response({"error": f"Connection request is already {connection.status}"}, status=status.HTTP_400_BAD_REQUEST)
+                if connection.status != 'REQUESTED':
+                    return Response({"error": f"Connection request is already {connection.status}"}, status=status.HTTP_400_BAD_REQUEST)
 
-            connection.status = 'ACCEPTED'
-            connection.responded_at = timezone.now()
-            connection.save()
+                connection.status = 'ACCEPTED'
+                connection.responded_at = timezone.now()
+                connection.save()
 
-            connection.service_request.status = 'CONNECTED'
-            connection.service_request.save()
-            push_connection_count_to_workshop(workshop.user.id)
-            notify_service_flow_update(connection.service_request_id)
+                connection.service_request.status = 'CONNECTED'
+                connection.service_request.save()
+                push_connection_count_to_workshop(workshop.user.id)
+                push_connection_inbox_update(connection.id)
+                notify_service_flow_update(connection.service_request_id)
 
-            execution, created = ServiceExecution.objects.get_or_create(
-                service_request=connection.service_request,
-                defaults={
-                    'workshop': workshop,
-                    'assigned_to': request.user,
-                    'estimate_amount': 0
-                }
-            )
-            
-            if not created:
-                execution.workshop = workshop
-                execution.assigned_to = request.user
-                execution.save()
+                execution, created = ServiceExecution.objects.get_or_create(
+                    service_request=connection.service_request,
+                    defaults={
+                        'workshop': workshop,
+                        'assigned_to': request.user,
+                        'estimate_amount': 0
+                    }
+                )
+
+                if not created:
+                    execution.workshop = workshop
+                    execution.assigned_to = request.user
+                    execution.save()
 
             return Response({"message": "Connection request accepted successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -385,22 +405,24 @@ class RejectConnectionRequestView(APIView):
             except AttributeError:
                 return Response({"error": "Workshop not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            try:
-                connection = WorkshopConnection.objects.get(pk=pk, workshop=workshop)
-            except WorkshopConnection.DoesNotExist:
-                return Response({"error": "Connection request not found"}, status=status.HTTP_404_NOT_FOUND)
+            with transaction.atomic():
+                try:
+                    connection = _lock_pending_connection(pk, workshop)
+                except WorkshopConnection.DoesNotExist:
+                    return Response({"error": "Connection request not found"}, status=status.HTTP_404_NOT_FOUND)
 
-            if connection.status != 'REQUESTED':
-                return Response({"error": f"Connection request is already {connection.status}"}, status=status.HTTP_400_BAD_REQUEST)
+                if connection.status != 'REQUESTED':
+                    return Response({"error": f"Connection request is already {connection.status}"}, status=status.HTTP_400_BAD_REQUEST)
 
-            connection.status = 'REJECTED'
-            connection.responded_at = timezone.now()
-            connection.save()
+                connection.status = 'REJECTED'
+                connection.responded_at = timezone.now()
+                connection.save()
 
-            connection.service_request.status = 'PLATFORM_FEE_PAID'
-            connection.service_request.save()
-            push_connection_count_to_workshop(workshop.user.id)
-            notify_service_flow_update(connection.service_request_id)
+                connection.service_request.status = 'PLATFORM_FEE_PAID'
+                connection.service_request.save()
+                push_connection_count_to_workshop(workshop.user.id)
+                push_connection_inbox_update(connection.id)
+                notify_service_flow_update(connection.service_request_id)
 
             return Response({"message": "Connection request rejected successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -440,6 +462,7 @@ class CancelConnectionRequestView(APIView):
             connection.responded_at = timezone.now()
             connection.save()
             push_connection_count_to_workshop(workshop.user.id)
+            clear_service_requests([connection.service_request_id])
             ChatMessageRecipient.objects.filter(
                 message__service_request=connection.service_request,
                 is_read=False
@@ -447,11 +470,14 @@ class CancelConnectionRequestView(APIView):
             
             try:
                 execution = connection.service_request.execution
-                for mechanic in execution.mechanics.all():
+                mechanics = list(execution.mechanics.all())
+                for mechanic in mechanics:
                     mechanic.availability = 'AVAILABLE'
                     mechanic.save()
                 
                 execution.mechanics.clear()
+                mechanics_changed(connection.service_request.status, [m.user_id for m in mechanics], -1)
+                invalidate_participants([connection.service_request_id])
                 execution.assigned_to = None
                 execution.estimate_amount = 0
                 execution.escrow_paid = False
@@ -467,6 +493,7 @@ class CancelConnectionRequestView(APIView):
             
             connection.service_request.status = 'PLATFORM_FEE_PAID'
             connection.service_request.save()
+            push_connection_inbox_update(connection.id)
             notify_service_flow_update(connection.service_request_id)
 
             return Response({"message": "Connection cancelled successfully"}, status=status.HTTP_200_OK)
@@ -504,12 +531,15 @@ class UserCancelConnectionView(APIView):
                  connection.cancelled_by = 'USER'
                  try:
                      execution = connection.service_request.execution
-                     for mechanic in execution.mechanics.all():
+                     mechanics = list(execution.mechanics.all())
+                     for mechanic in mechanics:
                          mechanic.availability = 'AVAILABLE'
                          mechanic.save()
                      
                      # Clear mechanics and reset execution details instead of deletion
                      execution.mechanics.clear()
+                     mechanics_changed(connection.service_request.status, [m.user_id for m in mechanics], -1)
+                     invalidate_participants([connection.service_request_id])
                      execution.assigned_to = None
                      execution.estimate_amount = 0
                      execution.escrow_paid = False
@@ -519,6 +549,7 @@ class UserCancelConnectionView(APIView):
                      execution.started_at = None
                      execution.completed_at = None
                      execution.save()
+                     clear_service_requests([connection.service_request_id])
                      ChatMessageRecipient.objects.filter(
                         message__service_request=connection.service_request,
                         is_read=False
@@ -533,6 +564,7 @@ class UserCancelConnectionView(APIView):
             
             connection.service_request.status = 'PLATFORM_FEE_PAID'
             connection.service_request.save()
+            push_connection_inbox_update(connection.id)
             notify_service_flow_update(connection.service_request_id)
 
             return Response({"message": "Connection cancelled"}, status=status.HTTP_200_OK)
@@ -622,6 +654,7 @@ class MechanicAssignedServicesView(APIView):
             qs = ServiceRequest.objects.filter(
                 execution__mechanics=mechanic
             ).select_related("user").order_by("-created_at")
+            qs = ServiceRequestSerializer.setup_eager_loading(qs)
 
             serializer = ServiceRequestSerializer(qs, many=True)
 
@@ -714,6 +747,8 @@ class AssignMechanicView(APIView):
                 )
 
             execution.mechanics.add(mechanic)
+            mechanics_changed(service_request.status, [mechanic.user_id], 1)
+            invalidate_participants([service_request.id])
             mechanic.availability = "BUSY"
             mechanic.save()
 
@@ -778,6 +813,8 @@ class RemoveMechanicView(APIView):
              
              if mechanic in execution.mechanics.all():
                   execution.mechanics.remove(mechanic)
+                  mechanics_changed(service_request.status, [mechanic.user_id], -1)
+                  invalidate_participants([service_request.id])
                   mechanic.availability = 'AVAILABLE'
                   mechanic.save()
                   push_assigned_task_count_to_mechanic(mechanic.user.id)
@@ -856,9 +893,9 @@ class UpdateEstimateView(APIView):
         except Estimate.DoesNotExist:
             return Response({"error": "Estimate not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        if estimate.status not in ('DRAFT', 'REJECTED'):
+        if estimate.status not in ('DRAFT', 'REJECTED', 'EXPIRED'):
             return Response(
-                {"error": f"Cannot update estimate with status: {estimate.status}. Only DRAFT or REJECTED estimates can be updated."},
+                {"error": f"Cannot update estimate with status: {estimate.status}. Only DRAFT, REJECTED or EXPIRED estimates can be updated."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
@@ -866,7 +903,7 @@ class UpdateEstimateView(APIView):
         if serializer.is_valid():
             with transaction.atomic():
                 estimate = serializer.save()
-                if estimate.status == 'REJECTED':
+                if estimate.status in ('REJECTED', 'EXPIRED'):
                     estimate.status = 'DRAFT'
                     estimate.rejected_at = None
                     estimate.save()
@@ -916,6 +953,8 @@ class SendEstimateView(APIView):
         with transaction.atomic():
             estimate.status = 'SENT'
             estimate.sent_at = timezone.now()
+            if estimate.expires_at and estimate.expires_at <= estimate.sent_at:
+                estimate.expires_at = estimate.sent_at + timedelta(days=7)
             estimate.save()
 
             # Update service request status
@@ -1027,15 +1066,17 @@ class ResendEstimateView(APIView):
             )
         except Estimate.DoesNotExist:
             return Response({"error": "Estimate not found"}, status=status.HTTP_404_NOT_FOUND)
-        if estimate.status != 'REJECTED':
+        if estimate.status not in ('REJECTED', 'EXPIRED'):
             return Response(
-                {"error": f"Can only resend REJECTED estimates. Current status: {estimate.status}"},
+                {"error": f"Can only resend REJECTED or EXPIRED estimates. Current status: {estimate.status}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
         with transaction.atomic():
             estimate.status = 'SENT'
             estimate.sent_at = timezone.now()
             estimate.rejected_at = None
+            if estimate.expires_at and estimate.expires_at <= estimate.sent_at:
+                estimate.expires_at = estimate.sent_at + timedelta(days=7)
             estimate.save()
             
             service_request = estimate.service_request
@@ -1198,21 +1239,11 @@ class GetEstimateView(APIView):
                 and estimate.workshop_connection.workshop == request.user.workshop
             )
 
-            is_service_owner = estimate.service_request.user == request.user
+            participants = get_participants(estimate.service_request_id)
 
-            is_mechanic = False
-            if request.user.role == "mechanic":
-                try:
-                    execution = estimate.service_request.execution
-                    is_mechanic = execution.mechanics.filter(
-                        user=request.user
-                    ).exists()
-                except Exception:
-                    logger.exception(
-                        "Error checking mechanic access user_id=%s estimate_id=%s",
-                        request.user.id,
-                        estimate_id
-                    )
+            is_service_owner = participants.is_owner(request.user)
+
+            is_mechanic = participants.is_assigned_mechanic(request.user)
 
             if not (is_workshop_admin or is_service_owner or is_mechanic):
                 return Response(
@@ -1276,21 +1307,11 @@ class ListEstimatesView(APIView):
                 and connection.workshop == request.user.workshop
             )
 
-            is_service_owner = connection.service_request.user == request.user
+            participants = get_participants(connection.service_request_id)
 
-            is_mechanic = False
-            if request.user.role == "mechanic":
-                try:
-                    execution = connection.service_request.execution
-                    is_mechanic = execution.mechanics.filter(
-                        user=request.user
-                    ).exists()
-                except Exception:
-                    logger.exception(
-                        "Error checking mechanic access user_id=%s connection_id=%s",
-                        request.user.id,
-                        connection_id
-                    )
+            is_service_owner = participants.is_owner(request.user)
+
+            is_mechanic = participants.is_assigned_mechanic(request.user)
 
             if not (is_workshop_admin or is_service_owner or is_mechanic):
                 return Response(
@@ -1607,7 +1628,7 @@ def _can_generate_service_otp(user, execution):
             return execution.workshop == getattr(user, "workshop", None)
 
         if user.role == "mechanic":
-            return execution.mechanics.filter(user=user).exists()
+            return get_participants(execution.service_request_id).is_assigned_mechanic(user)
 
     except Exception:
         logger.exception(
@@ -0,0 +1,129 @@
+import { getWebSocketBase } from '../config/ws';
+
+/**
+ * One multiplexed WebSocket per session (ws/stream/), shared by the notification,
+ * chat and service-flow subscribers instead of a socket each.
+ *
+ * Streams are 'notifications', 'chat:<requestId>' and 'service_flow:<requestId>'.
+ * The server wraps every frame as { stream, data }; `data` is what the stream's
+ * own socket used to send, so handlers stay the same.
+ */
+
+const ACCESS_TOKEN_KEY = 'accessToken';
+const MAX_RECONNECT_ATTEMPTS = 8;
+
+// stream -> Set of { onFrame, getSubscribeParams, onClose }
+const subscribers = new Map();
+
+let socket = null;
+let retryTimer = null;
+let attempts = 0;
+
+const subscribeMessage = (stream) => {
+  const params = {};
+  subscribers.get(stream)?.forEach((s) => Object.assign(params, s.getSubscribeParams?.()));
+  return JSON.stringify({ action: 'subscribe', stream, ...params });
+};
+
+const connect = () => {
+  const token = localStorage.getItem(ACCESS_TOKEN_KEY);
+  if (!token) return;
+
+  const ws = new WebSocket(`${getWebSocketBase()}/ws/stream/?token=${encodeURIComponent(token)}`);
+  socket = ws;
+
+  ws.onopen = () => {
+    attempts = 0;
+    // Also re-subscribes everything after a reconnect
+    subscribers.forEach((_, stream) => ws.send(subscribeMessage(stream)));
+  };
+
+  ws.onmessage = (event) => {
+    let envelope;
+    try {
+      envelope = JSON.parse(event.data);
+    } catch (err) {
+      console.error('[Stream] Failed to parse frame:', err);
+      return;
+    }
+    subscribers.get(envelope.stream)?.forEach((s) => s.onFrame(envelope.data));
+  };
+
+  ws.onclose = () => {
+    if (socket !== ws) return;
+    socket = null;
+    subscribers.forEach((set) => set.forEach((s) => s.onClose?.()));
+
+    if (!subscribers.size || attempts >= MAX_RECONNECT_ATTEMPTS) return;
+    const delay = Math.min(1000 * 2 ** attempts, 30000);
+    attempts += 1;
+    retryTimer = setTimeout(connect, delay);
+  };
+
+  ws.onerror = (err) => {
+    console.error('[Stream] WebSocket error:', err);
+  };
+};
+
+/**
+ * Subscribe to a stream, opening the shared socket if needed.
+ *
+ * @param {string} stream
+ * @param {(data: object) => void} onFrame - Called with every frame of the stream
+ * @param {object} [options]
+ * @param {() => object} [options.getSubscribeParams] - Extra subscribe fields, read on every
+ *   (re)subscribe, e.g. a chat's after_id
+ * @param {() => void} [options.onClose] - Called when the socket drops; it reconnects on its own
+ * @returns {() => void} Unsubscribe
+ */
+export function subscribeStream(stream, onFrame, { getSubscribeParams, onClose } = {}) {
+  const subscriber = { onFrame, getSubscribeParams, onClose };
+
+  let set = subscribers.get(stream);
+  const isNew = !set;
+  if (isNew) {
+    set = new Set();
+    subscribers.set(stream, set);
+  }
+  set.add(subscriber);
+
+  if (!socket) {
+    clearTimeout(retryTimer);
+    attempts = 0;
+    connect();
+  } else if (isNew && socket.readyState === WebSocket.OPEN) {
+    socket.send(subscribeMessage(stream));
+  }
+
+  return () => {
+    set.delete(subscriber);
+    if (set.size) return;
+
+    subscribers.delete(stream);
+    if (socket?.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify({ action: 'unsubscribe', stream }));
+    }
+    if (!subscribers.size) closeStreamSocket();
+  };
+}
+
+/** Send a stream action, e.g. a chat message. Returns false while the socket is down. */
+export function sendToStream(stream, content) {
+  if (socket?.readyState !== WebSocket.OPEN) return false;
+  socket.send(JSON.stringify({ ...content, stream }));
+  return true;
+}
+
+export function isStreamOpen() {
+  return socket?.readyState === WebSocket.OPEN;
+}
+
+/** Close the socket, e.g. on logout so the next session authenticates afresh. */
+export function closeStreamSocket() {
+  clearTimeout(retryTimer);
+  const ws = socket;
+  socket = null;
+  if (ws && (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING)) {
+    ws.close();
+  }
+}
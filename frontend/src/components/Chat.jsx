@@ -3,7 +3,7 @@ import { useSelector } from 'react-redux';
 import { Send, ImageIcon, X, Loader2 } from 'lucide-react';
 import axiosInstance from '../api/axiosInstance';
 import toast from 'react-hot-toast';
-import { getWebSocketBase } from '../config/ws';
+import { isStreamOpen, sendToStream, subscribeStream } from '../api/stream';
 import { formatDateTime } from '../utils/dateUtils';
 
 const ACCESS_TOKEN_KEY = 'accessToken';
@@ -30,7 +30,8 @@ const Chat = ({
   const [imagePreviewUrl, setImagePreviewUrl] = useState(null);
   const [isSendingImage, setIsSendingImage] = useState(false);
 
-  const socketRef = useRef(null);
+  const streamName = `chat:${serviceRequestId}`;
+  const lastMessageIdRef = useRef(null);
   const messagesEndRef = useRef(null);
   const scrollContainerRef = useRef(null);
   const fileInputRef = useRef(null);
@@ -89,27 +90,31 @@ const Chat = ({
   }, []);
 
   useEffect(() => {
-    if (!serviceRequestId || !canChat) return;
-    const token = localStorage.getItem(ACCESS_TOKEN_KEY);
-    if (!token) return;
-
-    const wsUrl = `${getWebSocketBase()}/ws/chat/${serviceRequestId}/?token=${encodeURIComponent(token)}`;
-    const socket = new WebSocket(wsUrl);
-    socketRef.current = socket;
+    lastMessageIdRef.current = messages.length ? messages[messages.length - 1].id : null;
+  }, [messages]);
 
-    socket.onopen = () => {
-      setIsConnected(true);
-      socket.send(JSON.stringify({ type: 'mark_read' }));
-    };
+  useEffect(() => {
+    if (!serviceRequestId || !canChat) return;
+    if (!localStorage.getItem(ACCESS_TOKEN_KEY)) return;
 
-    socket.onmessage = (event) => {
+    const onFrame = (data) => {
       try {
-        const data = JSON.parse(event.data);
-        if (data.type === 'chat.history') {
+        if (data.type === 'stream.subscribed') {
+          setIsConnected(true);
+        } else if (data.type === 'stream.error') {
+          setIsConnected(false);
+        } else if (data.type === 'chat.history' || (data.type === 'chat.resume' && data.has_gap)) {
           setMessages(data.messages || []);
           setHasMore((data.messages?.length ?? 0) === PAGE_SIZE);
           setIsLoadingMore(false);
           requestAnimationFrame(() => requestAnimationFrame(() => scrollToBottom('instant')));
+        } else if (data.type === 'chat.resume') {
+          if (!data.messages?.length) return;
+          setMessages((prev) => {
+            const seen = new Set(prev.map((m) => m.id));
+            return [...prev, ...data.messages.filter((m) => !seen.has(m.id))];
+          });
+          setTimeout(() => scrollToBottom('smooth'), 0);
         } else if (data.type === 'chat.message') {
           setMessages((prev) => [...prev, data.message]);
           setTimeout(() => scrollToBottom('smooth'), 0);
@@ -122,43 +127,47 @@ const Chat = ({
           });
         }
       } catch (error) {
-        console.error('Failed to parse chat message', error);
+        console.error('Failed to handle chat message', error);
         setIsLoadingMore(false);
       }
     };
 
-    socket.onclose = () => setIsConnected(false);
-    socket.onerror = () => setIsConnected(false);
+    const unsubscribe = subscribeStream(streamName, onFrame, {
+      // On resubscribe only ask for what arrived after the newest message we have
+      getSubscribeParams: () => (
+        lastMessageIdRef.current != null ? { after_id: lastMessageIdRef.current } : {}
+      ),
+      onClose: () => setIsConnected(false),
+    });
 
     return () => {
-      socket.close();
-      socketRef.current = null;
+      unsubscribe();
+      lastMessageIdRef.current = null;
       setIsConnected(false);
       setMessages([]);
       setHasMore(true);
       setIsLoadingMore(false);
     };
-  }, [serviceRequestId, canChat]);
+  }, [serviceRequestId, canChat, streamName]);
 
   const handleScroll = useCallback((e) => {
     const container = e.currentTarget;
     if (
       container.scrollTop === 0 &&
       hasMore && !isLoadingMore &&
-      socketRef.current?.readyState === WebSocket.OPEN &&
+      isStreamOpen() &&
       messages.length > 0
     ) {
       const oldestId = messages[0].id;
       setIsLoadingMore(true);
-      socketRef.current.send(JSON.stringify({ type: 'fetch_history', before_id: oldestId }));
+      sendToStream(streamName, { type: 'fetch_history', before_id: oldestId });
     }
-  }, [hasMore, isLoadingMore, messages]);
+  }, [hasMore, isLoadingMore, messages, streamName]);
 
   const handleSend = (e) => {
     e.preventDefault();
     const text = messageInput.trim();
-    if (!text || socketRef.current?.readyState !== WebSocket.OPEN) return;
-    socketRef.current.send(JSON.stringify({ type: 'message', message: text }));
+    if (!text || !sendToStream(streamName, { type: 'message', message: text })) return;
     setMessageInput('');
   };
 
@@ -37,7 +37,7 @@ const EstimateManager = ({ connectionId, requestId, onEstimateSent, onResend })
   }, [connectionId, dispatch]);
 
   useEffect(() => {
-    if (currentEstimate && (currentEstimate.status === 'DRAFT' || currentEstimate.status === 'REJECTED')) {
+    if (currentEstimate && ['DRAFT', 'REJECTED', 'EXPIRED'].includes(currentEstimate.status)) {
       const items = (currentEstimate.line_items || []).map((item) => ({
         item_type: item.item_type || 'LABOR',
         description: item.description || '',
@@ -125,7 +125,7 @@ const EstimateManager = ({ connectionId, requestId, onEstimateSent, onResend })
 
     const estimateData = buildEstimatePayload();
     try {
-      if (currentEstimate && (currentEstimate.status === 'DRAFT' || currentEstimate.status === 'REJECTED')) {
+      if (currentEstimate && ['DRAFT', 'REJECTED', 'EXPIRED'].includes(currentEstimate.status)) {
         await dispatch(updateEstimate({ estimateId: currentEstimate.id, estimateData })).unwrap();
         toast.success('Estimate updated successfully');
         setIsEditing(false);
@@ -177,7 +177,7 @@ const EstimateManager = ({ connectionId, requestId, onEstimateSent, onResend })
   const { subtotal, taxAmount, totalAmount } = calculateTotals();
   const activeEstimate = estimates.find(e => e.status === 'DRAFT') || 
                          estimates.find(e => e.status === 'SENT') || 
-                         estimates.find(e => e.status === 'REJECTED') || 
+                         estimates.find(e => e.status === 'REJECTED' || e.status === 'EXPIRED') || 
                          estimates[0];
 
   if (!connectionId) {
@@ -545,13 +545,19 @@ const EstimateManager = ({ connectionId, requestId, onEstimateSent, onResend })
               </div>
             )}
 
-            {activeEstimate.status === 'REJECTED' && (
+            {(activeEstimate.status === 'REJECTED' || activeEstimate.status === 'EXPIRED') && (
               <div className="bg-rose-50 border border-rose-100 rounded-xl p-4 space-y-3">
                 <div className="flex gap-3">
                   <XCircle className="w-5 h-5 text-rose-600 flex-shrink-0" />
                   <div>
-                    <p className="font-bold text-rose-900 text-sm">Estimate Declined</p>
-                    <p className="text-xs text-rose-700">The customer rejected this quote layout. Revise or re-send to retry.</p>
+                    <p className="font-bold text-rose-900 text-sm">
+                      {activeEstimate.status === 'EXPIRED' ? 'Estimate Expired' : 'Estimate Declined'}
+                    </p>
+                    <p className="text-xs text-rose-700">
+                      {activeEstimate.status === 'EXPIRED'
+                        ? 'The customer did not respond before this quote expired. Revise or re-send to retry.'
+                        : 'The customer rejected this quote layout. Revise or re-send to retry.'}
+                    </p>
                   </div>
                 </div>
                 <div className="flex flex-col sm:flex-row gap-2 pt-1">
@@ -1,12 +1,15 @@
 import { useDispatch } from 'react-redux';
 import { useNavigate } from 'react-router-dom';
 import { logoutUser } from '../redux/slices/authSlice';
+import { closeStreamSocket } from '../api/stream';
 
 export const useLogout = () => {
     const dispatch = useDispatch();
     const navigate = useNavigate();
 
     const logout = async () => {
+        // The socket is authenticated as this user; the next login opens a new one
+        closeStreamSocket();
         try {
             await dispatch(logoutUser()).unwrap();
             navigate('/login', { replace: true });
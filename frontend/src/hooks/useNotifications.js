@@ -1,12 +1,14 @@
 import { useEffect, useState } from 'react';
-import { useSelector } from 'react-redux';
-import { getWebSocketBase } from '../config/ws';
+import { useDispatch, useSelector } from 'react-redux';
+import { subscribeStream } from '../api/stream';
+import { workshopRequestUpserted } from '../redux/slices/serviceRequestSlice';
 
 const ACCESS_TOKEN_KEY = 'accessToken';
 
 
 export const useNotifications = (currentServiceRequestId) => {
 
+  const dispatch = useDispatch();
   const [items, setItems] = useState([]);
   const [assignedTaskCount, setAssignedTaskCount] = useState(0);
 
@@ -23,18 +25,8 @@ export const useNotifications = (currentServiceRequestId) => {
       return;
     }
 
-    const wsBase = getWebSocketBase();
-    const wsUrl = `${wsBase}/ws/notifications/?token=${encodeURIComponent(accessToken)}`;
-    const socket = new WebSocket(wsUrl);
-
-    socket.onopen = () => {
-      // Connection established
-    };
-
-    socket.onmessage = (event) => {
+    const onFrame = (data) => {
       try {
-        const data = JSON.parse(event.data);
-
         if (data.type === 'notifications.initial') {
           const serverItems = data.items || [];
           setItems(serverItems);
@@ -52,6 +44,11 @@ export const useNotifications = (currentServiceRequestId) => {
         else if (data.type === 'notifications.connection_count') {          
           setConnectionRequestCount(data.count || 0);
         }
+        else if (data.type === 'notifications.connection_inbox') {
+          if (data.connection) {
+            dispatch(workshopRequestUpserted({ connection: data.connection, counts: data.counts }));
+          }
+        }
         else if (data.type === 'notifications.update') {
           const item = data.item;
           if (!item) return;
@@ -69,24 +66,13 @@ export const useNotifications = (currentServiceRequestId) => {
           });
         }
       } catch (error) {
-        console.error('Failed to parse notification message', error);
+        console.error('Failed to handle notification message', error);
       }
     };
 
-    socket.onclose = () => {
-      // Connection closed; will reconnect if still authenticated
-    };
-
-    socket.onerror = (error) => {
-      console.error('Notification WebSocket error:', error);
-    };
-
-    return () => {
-      if (socket.readyState === WebSocket.OPEN || socket.readyState === WebSocket.CONNECTING) {
-        socket.close();
-      }
-    };
-  }, [isAuthenticated, accessToken]);
+    // notifications.initial is sent again on every (re)subscribe, so a reconnect resyncs the badges
+    return subscribeStream('notifications', onFrame);
+  }, [isAuthenticated, accessToken, dispatch]);
 
   const visibleNotifications = items.filter((n) => {
     if (!n || typeof n.unread_count === 'undefined') return false;
@@ -1,12 +1,36 @@
 import { useEffect, useRef } from 'react';
 import toast from 'react-hot-toast';
-import { getWebSocketBase } from '../config/ws';
+import { subscribeStream } from '../api/stream';
+import { fetchServiceRequestDetails, serviceFlowUpdated } from '../redux/slices/serviceRequestSlice';
 
 /**
- * Subscribe to live service-flow updates via WebSocket.
+ * Apply a service-flow update to the request on screen without a refetch.
  *
- * @param {string|number|null} requestId  - Service request ID (falsy = no connection)
- * @param {(event: string) => void} onUpdate - Callback fired on every update; receives the event name
+ * A delta that directly follows the version we hold is merged in place; an older one
+ * is already reflected and dropped. A gap (missed update) or an update without a delta
+ * falls back to refetching the request.
+ */
+export function applyServiceFlowUpdate(dispatch, requestId, currentRequest, update) {
+  if (!requestId) return;
+
+  const heldVersion = currentRequest?.flow_version;
+  if (update && heldVersion != null && currentRequest?.id === update.state.id) {
+    if (update.version <= heldVersion) return;
+    if (update.version === heldVersion + 1) {
+      dispatch(serviceFlowUpdated(update));
+      return;
+    }
+  }
+  dispatch(fetchServiceRequestDetails(requestId));
+}
+
+/**
+ * Subscribe to live service-flow updates over the shared stream socket (see api/stream).
+ *
+ * @param {string|number|null} requestId  - Service request ID (falsy = no subscription)
+ * @param {(event: string, update: {version: number, state: object}|null) => void} onUpdate - Callback fired on
+ *   every update; receives the event name and, when the server sent one, the versioned state delta
+ *   (see applyServiceFlowUpdate). After a reconnect it fires once with 'resync' and no delta.
  * @param {'user'|'workshop'|'mechanic'} role - The role of the currently logged-in viewer.
  *   Toasts are shown only to the party that DIDN'T trigger the event, preventing duplicate toasts.
  *   - Events triggered by workshop  → toast shown only to 'user' and 'mechanic'
@@ -18,17 +42,18 @@ export function useServiceFlowSocket(requestId, onUpdate, role = 'user') {
 
   useEffect(() => {
     if (!requestId) return;
+    if (!localStorage.getItem('accessToken')) return;
 
-    const token = localStorage.getItem('accessToken');
-    if (!token) return;
-
-    const wsBase = getWebSocketBase();
-    const wsUrl = `${wsBase}/ws/service-flow/${requestId}/?token=${encodeURIComponent(token)}`;
-    const socket = new WebSocket(wsUrl);
+    let subscribed = false;
 
-    socket.onmessage = (event) => {
+    const onFrame = (data) => {
       try {
-        const data = JSON.parse(event.data);
+        if (data.type === 'stream.subscribed') {
+          // Updates sent while the socket was down are lost; resync after a reconnect
+          if (subscribed) onUpdateRef.current?.('resync', null);
+          subscribed = true;
+          return;
+        }
 
         if (data.type === 'service_flow.update') {
           const eventName = data.event || 'update';
@@ -66,25 +91,19 @@ export function useServiceFlowSocket(requestId, onUpdate, role = 'user') {
               toast.success('Customer approved the estimate. Awaiting payment.', { id: 'socket-estimate-approved' });
             } else if (eventName === 'estimate_rejected') {
               toast('Customer rejected the estimate. Please send a revised one.', { id: 'socket-estimate-rejected' });
+            } else if (eventName === 'estimate_expired') {
+              toast('The estimate expired before the customer responded. Revise or resend it.', { id: 'socket-estimate-expired' });
             }
           }
 
-          onUpdateRef.current?.(eventName);
+          const update = data.version != null && data.state ? { version: data.version, state: data.state } : null;
+          onUpdateRef.current?.(eventName, update);
         }
       } catch (err) {
-        console.error('[ServiceFlowSocket] Failed to parse message:', err);
+        console.error('[ServiceFlowSocket] Failed to handle update:', err);
       }
     };
 
-    socket.onerror = (err) => {
-      console.error('[ServiceFlowSocket] WebSocket error:', err);
-    };
-
-    return () => {
-      if (socket.readyState === WebSocket.OPEN || socket.readyState === WebSocket.CONNECTING) {
-        socket.close();
-      }
-    };
+    return subscribeStream(`service_flow:${requestId}`, onFrame);
   }, [requestId]);
 }
-
@@ -13,7 +13,7 @@ import {
   Wrench, Shield, Users, Mail, Phone, Key, Clock,
 } from 'lucide-react';
 import { toast } from 'react-hot-toast';
-import { useServiceFlowSocket } from '../../hooks/useServiceFlowSocket';
+import { applyServiceFlowUpdate, useServiceFlowSocket } from '../../hooks/useServiceFlowSocket';
 import Chat from '../../components/Chat';
 import { formatBackendError } from '../../utils/errorHandler';
 import { formatDateTime } from '../../utils/dateUtils';
@@ -34,16 +34,15 @@ const MechanicServiceFlow = () => {
     dispatch(fetchServiceRequestDetails(requestId));
   }, [dispatch, requestId]);
 
-  useServiceFlowSocket(requestId, () => {
-    if (requestId) dispatch(fetchServiceRequestDetails(requestId));
-    const connectionId = currentRequestRef.current?.active_connection?.id;
+  useServiceFlowSocket(requestId, (eventName, update) => {
+    applyServiceFlowUpdate(dispatch, requestId, currentRequestRef.current, update);
   }, 'mechanic');
 
   useEffect(() => {
     if (currentRequest?.active_connection?.id) {
       dispatch(fetchEstimates(currentRequest.active_connection.id));
     }
-  }, [dispatch, currentRequest?.active_connection?.id, currentRequest?.status]);
+  }, [dispatch, currentRequest?.active_connection?.id, currentRequest?.status, currentRequest?.estimate?.id, currentRequest?.estimate?.status, currentRequest?.estimate?.sent_at]);
 
   const currentStatus = currentRequest?.status || 'CREATED';
   const execution = currentRequest?.execution;
@@ -9,7 +9,7 @@ import { fetchNearbyWorkshops, userCancelConnection, fetchServiceRequestDetails,
 import { createEscrowCheckout, resetPaymentState } from '../../redux/slices/paymentSlice';
 import Chat from '../../components/Chat';
 import toast from 'react-hot-toast';
-import { useServiceFlowSocket } from '../../hooks/useServiceFlowSocket';
+import { applyServiceFlowUpdate, useServiceFlowSocket } from '../../hooks/useServiceFlowSocket';
 import ReportComplaintModal from '../../components/ReportComplaintModal';
 import { formatBackendError } from '../../utils/errorHandler';
 import { formatDate } from '../../utils/dateUtils';
@@ -47,18 +47,15 @@ const UserServiceFlow = () => {
   const currentRequestRef = useRef(currentRequest);
   useEffect(() => { currentRequestRef.current = currentRequest; }, [currentRequest]);
 
-  useServiceFlowSocket(requestId, () => {
-    if (requestId) {
-      dispatch(fetchServiceRequestDetails(requestId));
-      const connectionId = currentRequestRef.current?.active_connection?.id;
-    }
+  useServiceFlowSocket(requestId, (eventName, update) => {
+    applyServiceFlowUpdate(dispatch, requestId, currentRequestRef.current, update);
   });
 
   useEffect(() => {
     if (currentRequest?.active_connection?.id) {
       dispatch(fetchEstimates(currentRequest.active_connection.id));
     }
-  }, [dispatch, currentRequest?.active_connection?.id, currentRequest?.status]);
+  }, [dispatch, currentRequest?.active_connection?.id, currentRequest?.status, currentRequest?.estimate?.id, currentRequest?.estimate?.status, currentRequest?.estimate?.sent_at]);
 
   useEffect(() => {
     const escrowSuccess = searchParams.get('escrow_success');
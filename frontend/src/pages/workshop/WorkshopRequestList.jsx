@@ -3,6 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import { useDispatch, useSelector } from 'react-redux';
 import {
   fetchWorkshopRequests,
+  fetchMoreWorkshopRequests,
   acceptRequest,
   rejectRequest,
   cancelRequestWorkshop
@@ -82,7 +83,7 @@ const avatarColor = (id) => AVATAR_COLORS[(id || 0) % AVATAR_COLORS.length];
 const WorkshopRequestList = () => {
   const dispatch  = useDispatch();
   const navigate  = useNavigate();
-  const { workshopRequests, loading } = useSelector(s => s.serviceRequest);
+  const { workshopRequests, workshopRequestsNext, workshopRequestCounts, loading } = useSelector(s => s.serviceRequest);
 
   const [selectedRequest, setSelectedRequest] = useState(null);
   const [enlargedImage,   setEnlargedImage]   = useState(null);
@@ -92,11 +93,17 @@ const WorkshopRequestList = () => {
   const [currentPage,     setCurrentPage]     = useState(1);
   const itemsPerPage = 10;
 
-  useEffect(() => { setMounted(true); dispatch(fetchWorkshopRequests()); }, [dispatch]);
+  useEffect(() => { setMounted(true); }, []);
 
+  // Filtering and date ordering happen on the server; new and changed
+  // connections arrive over the notifications socket, so no polling.
   useEffect(() => {
     setCurrentPage(1);
-  }, [sortBy, filterStatus]);
+    dispatch(fetchWorkshopRequests({
+      status:   filterStatus === 'All' ? undefined : filterStatus,
+      ordering: sortBy === 'oldest' ? 'oldest' : undefined,
+    }));
+  }, [dispatch, sortBy, filterStatus]);
 
   const getDisplayStatus = (req) => {
     const conn = req.status;
@@ -144,12 +151,14 @@ const WorkshopRequestList = () => {
   const totalPages = Math.ceil(sorted.length / itemsPerPage);
   const currentRequests = sorted.slice((currentPage - 1) * itemsPerPage, currentPage * itemsPerPage);
 
+  const countOf = (...statuses) => statuses.reduce((sum, st) => sum + (workshopRequestCounts[st] || 0), 0);
   const stats = {
-    total:     workshopRequests.length,
-    pending:   workshopRequests.filter(r => r.status === 'REQUESTED').length,
-    active:    workshopRequests.filter(r => ['ACCEPTED','IN_PROGRESS','ESTIMATE_SHARED','SERVICE_AMOUNT_PAID'].includes(getDisplayStatus(r))).length,
-    completed: workshopRequests.filter(r => ['COMPLETED','VERIFIED'].includes(getDisplayStatus(r))).length,
+    total:     Object.values(workshopRequestCounts).reduce((sum, n) => sum + n, 0),
+    pending:   countOf('REQUESTED'),
+    active:    countOf('ACCEPTED','IN_PROGRESS','ESTIMATE_SHARED','SERVICE_AMOUNT_PAID'),
+    completed: countOf('COMPLETED','VERIFIED'),
   };
+  const resultCount = filterStatus === 'All' ? stats.total : countOf(filterStatus);
 
   if (loading && workshopRequests.length === 0) {
     return (
@@ -235,7 +244,7 @@ const WorkshopRequestList = () => {
               <ChevronDown size={12} color="#9CA3AF" className="rl-select-chevron" />
             </div>
 
-            <span className="rl-count-chip">{sorted.length} result{sorted.length !== 1 ? 's' : ''}</span>
+            <span className="rl-count-chip">{resultCount} result{resultCount !== 1 ? 's' : ''}</span>
           </div>
 
           {/* ── REQUEST LIST ── */}
@@ -292,6 +301,14 @@ const WorkshopRequestList = () => {
             />
           )}
 
+          {workshopRequestsNext && (
+            <div style={{ display: 'flex', justifyContent: 'center', marginTop: 16 }}>
+              <button className="rl-btn-view" onClick={() => dispatch(fetchMoreWorkshopRequests(workshopRequestsNext))}>
+                <ChevronDown size={14} /> Load older requests
+              </button>
+            </div>
+          )}
+
           {/* Empty state */}
           {sorted.length === 0 && !loading && (
             <div className="rl-empty">
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { useParams } from 'react-router-dom';
 import {
@@ -20,7 +20,7 @@ import {
 import { toast } from 'react-hot-toast';
 import Chat from '../../components/Chat';
 import EstimateManager from '../../components/EstimateManager';
-import { useServiceFlowSocket } from '../../hooks/useServiceFlowSocket';
+import { applyServiceFlowUpdate, useServiceFlowSocket } from '../../hooks/useServiceFlowSocket';
 import ReportComplaintModal from '../../components/ReportComplaintModal';
 import { formatBackendError } from '../../utils/errorHandler';
 
@@ -40,16 +40,29 @@ const WorkshopServiceFlow = () => {
     return () => { dispatch(clearCurrentRequest()); };
   }, [dispatch, requestId]);
 
-  useServiceFlowSocket(requestId, () => {
-    if (requestId) {
-      dispatch(fetchServiceRequestDetails(requestId));
-      const connectionId = currentRequest?.active_connection?.id;
-    }
+  const currentRequestRef = useRef(currentRequest);
+  useEffect(() => { currentRequestRef.current = currentRequest; }, [currentRequest]);
+
+  useServiceFlowSocket(requestId, (eventName, update) => {
+    applyServiceFlowUpdate(dispatch, requestId, currentRequestRef.current, update);
   }, 'workshop');
 
   const currentStatus = currentRequest?.status || 'CREATED';
   const activeConnection = currentRequest?.active_connection;
 
+  // EstimateManager loads the estimates once; reload them when the customer acts on one
+  const estimateKey = currentRequest?.estimate
+    ? `${currentRequest.estimate.id}:${currentRequest.estimate.status}:${currentRequest.estimate.sent_at}`
+    : null;
+  const estimateKeyRef = useRef(estimateKey);
+  useEffect(() => {
+    const previous = estimateKeyRef.current;
+    estimateKeyRef.current = estimateKey;
+    if (previous && estimateKey && previous !== estimateKey && activeConnection?.id) {
+      dispatch(fetchEstimates(activeConnection.id));
+    }
+  }, [dispatch, estimateKey, activeConnection?.id]);
+
   const statusFlow = [
     { key: 'CREATED', label: 'Created', icon: FileCheck },
     { key: 'PLATFORM_FEE_PAID', label: 'Fee Paid', icon: CreditCard },
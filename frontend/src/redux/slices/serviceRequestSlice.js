@@ -56,9 +56,23 @@ export const fetchUserServiceRequests = createAsyncThunk(
 
 export const fetchWorkshopRequests = createAsyncThunk(
   'serviceRequest/fetchWorkshopRequests',
-  async (_, { rejectWithValue }) => {
+  async ({ status, ordering } = {}, { rejectWithValue }) => {
+    try {
+      const response = await axiosInstance.get('service-request/workshop/connection-requests/', {
+        params: { page_size: 50, status, ordering },
+      });
+      return response.data;
+    } catch (error) {
+      return rejectWithValue(error.response?.data || "Failed to fetch requests");
+    }
+  }
+);
+
+export const fetchMoreWorkshopRequests = createAsyncThunk(
+  'serviceRequest/fetchMoreWorkshopRequests',
+  async (nextUrl, { rejectWithValue }) => {
     try {
-      const response = await axiosInstance.get('service-request/workshop/connection-requests/');
+      const response = await axiosInstance.get(nextUrl);
       return response.data;
     } catch (error) {
       return rejectWithValue(error.response?.data || "Failed to fetch requests");
@@ -373,6 +387,8 @@ const serviceRequestSlice = createSlice({
     nearbyWorkshops: [],
     userRequests: [],
     workshopRequests: [],
+    workshopRequestsNext: null,
+    workshopRequestCounts: {},
     mechanicAssignedRequests: [],
     mechanics: [],
     estimates: [],
@@ -382,7 +398,25 @@ const serviceRequestSlice = createSlice({
   },
   reducers: {
     clearRequestError: (state) => { state.error = null; },
-    clearCurrentRequest: (state) => { state.currentRequest = null; }
+    clearCurrentRequest: (state) => { state.currentRequest = null; },
+    // Pushed over the notifications socket whenever a connection is created or changes
+    workshopRequestUpserted: (state, action) => {
+      const { connection, counts } = action.payload;
+      const index = state.workshopRequests.findIndex(r => r.id === connection.id);
+      if (index !== -1) {
+        state.workshopRequests[index] = connection;
+      } else {
+        state.workshopRequests.unshift(connection);
+      }
+      if (counts) state.workshopRequestCounts = counts;
+    },
+    // Pushed over the service-flow socket; only applied on top of the version it follows
+    serviceFlowUpdated: (state, action) => {
+      const { version, state: flowState } = action.payload;
+      if (state.currentRequest?.id !== flowState.id) return;
+      if (version !== (state.currentRequest.flow_version ?? 0) + 1) return;
+      state.currentRequest = { ...state.currentRequest, ...flowState, flow_version: version };
+    }
   },
   extraReducers: (builder) => {
     builder
@@ -446,12 +480,20 @@ const serviceRequestSlice = createSlice({
       })
       .addCase(fetchWorkshopRequests.fulfilled, (state, action) => {
         state.loading = false;
-        state.workshopRequests = action.payload;
+        state.workshopRequests = action.payload.results;
+        state.workshopRequestsNext = action.payload.next;
+        state.workshopRequestCounts = action.payload.counts || {};
       })
       .addCase(fetchWorkshopRequests.rejected, (state, action) => {
         state.loading = false;
         state.error = action.payload;
       })
+      .addCase(fetchMoreWorkshopRequests.fulfilled, (state, action) => {
+        const known = new Set(state.workshopRequests.map(r => r.id));
+        state.workshopRequests.push(...action.payload.results.filter(r => !known.has(r.id)));
+        state.workshopRequestsNext = action.payload.next;
+        state.workshopRequestCounts = action.payload.counts || state.workshopRequestCounts;
+      })
 
       // Mechanic assigned services
       .addCase(fetchMechanicAssignedServices.pending, (state) => {
@@ -563,5 +605,5 @@ const serviceRequestSlice = createSlice({
   }
 });
 
-export const { clearRequestError, clearCurrentRequest } = serviceRequestSlice.actions;
+export const { clearRequestError, clearCurrentRequest, workshopRequestUpserted, serviceFlowUpdated } = serviceRequestSlice.actions;
 export default serviceRequestSlice.reducer;
\ No newline at end of file